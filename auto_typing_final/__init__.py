@@ -0,0 +1,12 @@
+from auto_typing_final.transform import IMPORT_STYLES_TO_IMPORT_CONFIGS, ImportConfig, ImportStyle
+from auto_typing_final.transformer import AnalysisResult, SpanEdit, Transformer, TransformResult
+
+__all__ = [
+    "IMPORT_STYLES_TO_IMPORT_CONFIGS",
+    "AnalysisResult",
+    "ImportConfig",
+    "ImportStyle",
+    "SpanEdit",
+    "TransformResult",
+    "Transformer",
+]
@@ -0,0 +1,207 @@
+import argparse
+import statistics
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Final, get_args
+
+from auto_typing_final.discovery import find_all_source_files
+from auto_typing_final.files import SourceDecodeError, SourceFile, read_source_file
+from auto_typing_final.pipeline import Pipeline
+from auto_typing_final.transform import IMPORT_STYLES_TO_IMPORT_CONFIGS, ImportConfig, ImportStyle
+from auto_typing_final.transformer import Transformer
+
+if TYPE_CHECKING:
+    from auto_typing_final.ffi_accounting import FfiCallAccounting
+
+PHASES: Final = ("discovery", "read", "transform")
+FFI_REPORT_ROWS_COUNT: Final = 20
+
+
+@dataclass(slots=True, kw_only=True)
+class BenchRun:
+    files_count: int = 0
+    bytes_count: int = 0
+    changed_files_count: int = 0
+    skipped_files_count: int = 0
+    # Files with a bogus coding cookie or bytes that don't match it, skipped as the main command does
+    undecodable_files_count: int = 0
+    phase_seconds: dict[str, float] = field(default_factory=lambda: dict.fromkeys(PHASES, 0.0))
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(self.phase_seconds.values())
+
+
+def _read_decodable_source_file(path: Path) -> SourceFile | None:
+    try:
+        return read_source_file(path)
+    except SourceDecodeError:
+        return None
+
+
+# Files are read and analyzed the way the main command does it, all files are read before analysis starts,
+# so that the two phases are timed apart. The pipeline is shared by runs, so its worker processes stay warm.
+def run_once(
+    paths: list[Path], import_config: ImportConfig, ignore_global_vars: bool, *, pipeline: Pipeline | None = None
+) -> BenchRun:
+    if not pipeline:
+        with Pipeline.start(jobs=1) as one_run_pipeline:
+            return run_once(paths, import_config, ignore_global_vars, pipeline=one_run_pipeline)
+
+    run: Final = BenchRun()
+    transformer: Final = Transformer(import_config=import_config, ignore_global_vars=ignore_global_vars)
+
+    start = time.perf_counter()
+    source_files: Final = list(find_all_source_files(paths))
+    run.phase_seconds["discovery"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sources: Final = []
+    for _, source_file in pipeline.read(_read_decodable_source_file, ((path, path) for path in source_files)):
+        if source_file:
+            sources.append(source_file.text)
+        else:
+            run.undecodable_files_count += 1
+    run.phase_seconds["read"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for source, result in pipeline.analyze(transformer.transform, ((source, (source, None)) for source in sources)):
+        # Results are None only for analyses that ran out of time, and these have no timeout
+        if not result:
+            continue
+        run.files_count += 1
+        run.bytes_count += len(source.encode())
+        run.changed_files_count += result.has_changes
+        run.skipped_files_count += not result.analysis.is_parsed
+    run.phase_seconds["transform"] = time.perf_counter() - start
+
+    return run
+
+
+def _format_milliseconds(seconds: float) -> str:
+    return f"{seconds * 1000:10.1f} ms"
+
+
+def format_report(runs: list[BenchRun]) -> str:
+    cold_run: Final = runs[0]
+    warm_runs: Final = runs[1:] or runs
+    warm_total_median: Final = statistics.median(run.total_seconds for run in warm_runs)
+    lines: Final = [
+        f"files: {cold_run.files_count}, size: {cold_run.bytes_count / 1_000_000:.2f} MB, "
+        f"would change: {cold_run.changed_files_count}, skipped without parsing: {cold_run.skipped_files_count}, "
+        f"not decoded: {cold_run.undecodable_files_count}, runs: {len(runs)}",
+        "",
+        f"{'phase':<12}{'cold':>13}{'warm median':>13}",
+    ]
+    for phase in (*PHASES, "total"):
+        cold_seconds = cold_run.total_seconds if phase == "total" else cold_run.phase_seconds[phase]
+        warm_seconds = (
+            warm_total_median if phase == "total" else statistics.median(run.phase_seconds[phase] for run in warm_runs)
+        )
+        lines.append(f"{phase:<12}{_format_milliseconds(cold_seconds)}{_format_milliseconds(warm_seconds)}")
+
+    lines.append("")
+    if warm_total_median:
+        lines.append(
+            f"throughput (warm median): {cold_run.files_count / warm_total_median:.1f} files/s, "
+            f"{cold_run.bytes_count / 1_000_000 / warm_total_median:.2f} MB/s"
+        )
+    if len(warm_runs) > 1:
+        lines.append(
+            f"warm runs stdev: {_format_milliseconds(statistics.stdev(run.total_seconds for run in warm_runs)).strip()}"
+        )
+    if warm_total_median:
+        lines.append(f"cold / warm: {cold_run.total_seconds / warm_total_median:.2f}x")
+    return "\n".join(lines) + "\n"
+
+
+# A separate pass after the timed runs, so that the profile hook doesn't skew their timings
+def run_ffi_accounting(
+    paths: list[Path], import_config: ImportConfig, ignore_global_vars: bool
+) -> list[tuple[Path, "FfiCallAccounting"]]:
+    from auto_typing_final.ffi_accounting import FfiCallAccounting  # noqa: PLC0415
+
+    transformer: Final = Transformer(import_config=import_config, ignore_global_vars=ignore_global_vars)
+    result: Final = []
+    for path in find_all_source_files(paths):
+        if not (source_file := _read_decodable_source_file(path)):
+            continue
+        accounting = FfiCallAccounting()
+        with accounting.record():
+            transformer.transform(source_file.text)
+        result.append((path, accounting))
+    return result
+
+
+def format_ffi_report(
+    file_accountings: list[tuple[Path, "FfiCallAccounting"]], rows_count: int = FFI_REPORT_ROWS_COUNT
+) -> str:
+    from auto_typing_final.ffi_accounting import FfiCallAccounting  # noqa: PLC0415
+
+    run_accounting: Final = FfiCallAccounting()
+    for _, accounting in file_accountings:
+        run_accounting.add(accounting)
+    run_total: Final = run_accounting.total
+    lines: Final = [
+        f"ast-grep calls: {run_total.calls_count}, {_format_milliseconds(run_total.seconds).strip()}",
+        "",
+        f"{'calls':>10}{'time':>13}  function: method",
+    ]
+    lines.extend(
+        f"{stats.calls_count:>10}{_format_milliseconds(stats.seconds)}  {function_name}: {method_name}"
+        for (function_name, method_name), stats in sorted(
+            run_accounting.calls.items(), key=lambda item: item[1].seconds, reverse=True
+        )[:rows_count]
+    )
+    lines.extend(("", f"{'calls':>10}{'time':>13}  file"))
+    file_totals: Final = sorted(
+        ((path, accounting.total) for path, accounting in file_accountings),
+        key=lambda item: item[1].seconds,
+        reverse=True,
+    )
+    lines.extend(
+        f"{stats.calls_count:>10}{_format_milliseconds(stats.seconds)}  {path}"
+        for path, stats in file_totals[:rows_count]
+    )
+    return "\n".join(lines) + "\n"
+
+
+def bench_main(argv: list[str]) -> int:
+    parser: Final = argparse.ArgumentParser(
+        prog="auto-typing-final bench", description="Measure discovery and analysis throughput without writing files"
+    )
+    parser.add_argument("files", type=Path, nargs="*", default=[Path()])
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs, the first one is reported as cold")
+    parser.add_argument("--import-style", type=str, choices=get_args(ImportStyle), default="typing-final")
+    parser.add_argument("--ignore-global-vars", action="store_true")
+    parser.add_argument("--jobs", type=int, default=1, metavar="N", help="Analyze files in N worker processes")
+    parser.add_argument(
+        "--ffi-calls",
+        action="store_true",
+        help="After the timed runs, analyze files once more counting calls into ast-grep by calling function and file",
+    )
+
+    args: Final = parser.parse_args(argv)
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    import_config: Final = IMPORT_STYLES_TO_IMPORT_CONFIGS[args.import_style]
+    with Pipeline.start(jobs=args.jobs) as pipeline:
+        runs: Final = [
+            run_once(
+                args.files, import_config=import_config, ignore_global_vars=args.ignore_global_vars, pipeline=pipeline
+            )
+            for _ in range(args.repeat)
+        ]
+    sys.stdout.write(format_report(runs))
+    if args.ffi_calls:
+        sys.stdout.write("\n")
+        sys.stdout.write(
+            format_ffi_report(
+                run_ffi_accounting(args.files, import_config=import_config, ignore_global_vars=args.ignore_global_vars)
+            )
+        )
+    return 0
@@ -0,0 +1,68 @@
+import re
+from collections.abc import Iterator
+from typing import Final
+
+# Small statements are grouped, so that a module with a million one-line constants is not parsed a million times
+CHUNK_TARGET_LENGTH: Final = 64 * 1024
+# Strings, comments and brackets are matched to know whether a line at column 0 starts a new top-level statement
+TOKEN_REGEX: Final = re.compile(
+    r"""
+    (?P<string>
+        [rRbBuUfF]{0,2}
+        (?:'''(?:[^'\\]|\\.|'(?!''))*'''|\"\"\"(?:[^"\\]|\\.|"(?!""))*\"\"\"|'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*")
+    )
+    |(?P<unterminated_string>['"])
+    |(?P<comment>\#[^\n]*)
+    |(?P<line_continuation>\\\r?\n)
+    |(?P<opening_bracket>[(\[{])
+    |(?P<closing_bracket>[)\]}])
+    |\n(?P<statement_start>(?=[^\s#)\]}]))
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+LONE_CARRIAGE_RETURN_REGEX: Final = re.compile(r"\r(?!\n)")
+# Lines at column 0 that continue the previous compound statement
+CONTINUATION_KEYWORD_REGEX: Final = re.compile(r"(?:else|elif|except|finally)\b")
+
+
+class _UnsplittableSourceError(Exception): ...
+
+
+# Yields where top-level statements start, decorators are a part of the definition that follows them
+def _iter_statement_starts(source: str) -> Iterator[int]:
+    if LONE_CARRIAGE_RETURN_REGEX.search(source):
+        raise _UnsplittableSourceError
+    brackets_depth = 0
+    has_only_decorators = source.startswith("@")
+    for match in TOKEN_REGEX.finditer(source):
+        match match.lastgroup:
+            case "unterminated_string":
+                raise _UnsplittableSourceError
+            case "opening_bracket":
+                brackets_depth += 1
+            case "closing_bracket":
+                brackets_depth -= 1
+                if brackets_depth < 0:
+                    raise _UnsplittableSourceError
+            case "statement_start" if not brackets_depth and not CONTINUATION_KEYWORD_REGEX.match(source, match.end()):
+                if not has_only_decorators:
+                    yield match.end()
+                has_only_decorators = source.startswith("@", match.end())
+    if brackets_depth:
+        raise _UnsplittableSourceError
+
+
+# Returns (start, end) character ranges that each hold whole top-level statements, or None when the source can't be
+# split reliably. Comments between statements go to the previous chunk.
+def split_into_chunks(source: str, target_length: int = CHUNK_TARGET_LENGTH) -> list[tuple[int, int]] | None:
+    result: Final[list[tuple[int, int]]] = []
+    chunk_start = 0
+    try:
+        for statement_start in _iter_statement_starts(source):
+            if statement_start - chunk_start >= target_length:
+                result.append((chunk_start, statement_start))
+                chunk_start = statement_start
+    except _UnsplittableSourceError:
+        return None
+    result.append((chunk_start, len(source)))
+    return result
@@ -0,0 +1,87 @@
+import os
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Final
+
+CONFIG_FILE_NAME: Final = "pyproject.toml"
+CONFIG_SECTION_NAME: Final = "auto-typing-final"
+
+
+class ConfigError(Exception): ...
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class FileLimits:
+    # Larger files are skipped without being read, None means no limit
+    max_file_size: int | None = None
+    # Analysis that takes longer is abandoned by killing its worker process, None means no limit
+    timeout: float | None = None
+
+
+def _read_toml(path: Path) -> dict[str, object]:
+    # tomllib is only in the standard library since Python 3.11, older versions depend on its backport
+    if sys.version_info >= (3, 11):
+        import tomllib  # noqa: PLC0415
+    else:
+        import tomli as tomllib  # noqa: PLC0415
+
+    try:
+        content: Final[dict[str, object]] = tomllib.loads(path.read_text(encoding="utf-8"))
+    except (OSError, tomllib.TOMLDecodeError) as exception:
+        msg: Final = f"cannot read {path}: {exception}"
+        raise ConfigError(msg) from exception
+    return content
+
+
+def _load_config_section(path: Path) -> dict[str, object]:
+    tool_section: Final = _read_toml(path).get("tool", {})
+    section: Final = tool_section.get(CONFIG_SECTION_NAME, {}) if isinstance(tool_section, dict) else None
+    if not isinstance(section, dict):
+        msg: Final = f"{path}: [tool.{CONFIG_SECTION_NAME}] must be a table"
+        raise ConfigError(msg)
+    return section
+
+
+def _get_positive_number(path: Path, section: dict[str, object], key: str) -> float:
+    value: Final = section[key]
+    if isinstance(value, bool) or not isinstance(value, int | float) or value <= 0:
+        msg: Final = f"{path}: `{key}` must be a positive number"
+        raise ConfigError(msg)
+    return value
+
+
+def _make_file_limits(path: Path, command_line_limits: FileLimits) -> FileLimits:
+    section: Final = _load_config_section(path)
+    max_file_size: Final = (
+        int(_get_positive_number(path, section, "max-file-size")) if "max-file-size" in section else None
+    )
+    timeout: Final = _get_positive_number(path, section, "timeout") if "timeout" in section else None
+    return FileLimits(
+        max_file_size=max_file_size if command_line_limits.max_file_size is None else command_line_limits.max_file_size,
+        timeout=timeout if command_line_limits.timeout is None else command_line_limits.timeout,
+    )
+
+
+# Limits that are passed on the command line apply to every file. The ones that are not are taken from
+# [tool.auto-typing-final] in the nearest pyproject.toml, so that a directory with generated code can have its own.
+@dataclass(slots=True, kw_only=True)
+class FileLimitsFinder:
+    command_line_limits: FileLimits
+    _directory_limits: dict[Path, FileLimits] = field(default_factory=dict)
+
+    def find(self, path: Path) -> FileLimits:
+        directory = Path(os.path.abspath(path)).parent  # noqa: PTH100
+        visited_directories: Final = []
+        while directory not in self._directory_limits:
+            visited_directories.append(directory)
+            if (config_path := directory / CONFIG_FILE_NAME).is_file():
+                self._directory_limits[directory] = _make_file_limits(config_path, self.command_line_limits)
+            elif directory.parent == directory:
+                self._directory_limits[directory] = self.command_line_limits
+            else:
+                directory = directory.parent
+        limits: Final = self._directory_limits[directory]
+        for visited_directory in visited_directories:
+            self._directory_limits[visited_directory] = limits
+        return limits
@@ -0,0 +1,358 @@
+import argparse
+import contextlib
+import dataclasses
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import stat
+import struct
+import subprocess  # noqa: S404
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Final
+
+from auto_typing_final.lru import LruCache
+
+if TYPE_CHECKING:
+    from auto_typing_final.transformer import TransformResult
+
+DEFAULT_IDLE_TIMEOUT_SECONDS: Final = 15 * 60
+START_TIMEOUT_SECONDS: Final = 10
+CACHE_MAX_ENTRIES: Final = 1024
+CACHE_MAX_BYTES: Final = 64 * 1024 * 1024
+# Measured with tracemalloc: a span edit with its replacement text takes about this much
+APPROXIMATE_SPAN_EDIT_SIZE_BYTES: Final = 256
+POLL_INTERVAL_SECONDS: Final = 0.2
+
+
+# The temporary directory is shared between users, so the socket lives in a directory only its owner can enter
+def get_default_socket_path() -> Path:
+    runtime_directory: Final = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return Path(runtime_directory) / f"auto-typing-final-{os.getuid()}" / "daemon.sock"
+
+
+def get_version() -> str:
+    from auto_typing_final.git import get_tool_version  # noqa: PLC0415
+
+    return get_tool_version()
+
+
+class DaemonError(Exception): ...
+
+
+# A result without changes shares its new source with the source
+def get_result_size(result: "TransformResult") -> int:
+    return (
+        sys.getsizeof(result.source)
+        + (0 if result.new_source is result.source else sys.getsizeof(result.new_source))
+        + APPROXIMATE_SPAN_EDIT_SIZE_BYTES * len(result.analysis.edits)
+    )
+
+
+# Another local user must not be able to answer requests with their own "transformed" sources,
+# so both the socket and its directory must belong to the current user and be closed to others
+def _is_private_path(path: Path, *, is_directory: bool) -> bool:
+    try:
+        path_stat: Final = path.lstat()
+    except OSError:
+        return False
+    is_expected_type: Final = stat.S_ISDIR(path_stat.st_mode) if is_directory else stat.S_ISSOCK(path_stat.st_mode)
+    return is_expected_type and path_stat.st_uid == os.getuid() and not path_stat.st_mode & 0o022
+
+
+def _get_peer_uid(connection: socket.socket) -> int | None:
+    if sys.platform != "linux":
+        return None
+    credentials_format: Final = "3i"
+    _, uid, _ = struct.unpack(
+        credentials_format,
+        connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize(credentials_format)),
+    )
+    return int(uid)
+
+
+def create_socket_directory(socket_path: Path) -> None:
+    socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if not _is_private_path(socket_path.parent, is_directory=True):
+        msg: Final = f"{socket_path.parent} must be a directory owned by the current user and not writable by others"
+        raise DaemonError(msg)
+
+
+class DaemonClient:
+    def __init__(self, connection: socket.socket) -> None:
+        self._connection = connection
+        self._file = connection.makefile("rwb")
+
+    # With is_version_checked, a daemon of another version is treated as not running, so that callers
+    # fall back to in-process analysis instead of getting results of other rules
+    @staticmethod
+    def connect(socket_path: Path, *, is_version_checked: bool = True) -> "DaemonClient | None":
+        if not (
+            _is_private_path(socket_path.parent, is_directory=True)
+            and _is_private_path(socket_path, is_directory=False)
+        ):
+            return None
+        connection: Final = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(str(socket_path))
+            peer_uid: Final = _get_peer_uid(connection)
+        except OSError:
+            connection.close()
+            return None
+        if peer_uid is not None and peer_uid != os.getuid():
+            connection.close()
+            return None
+        client: Final = DaemonClient(connection)
+        if is_version_checked:
+            try:
+                is_same_version = client.request({"method": "hello"})["version"] == get_version()
+            except (OSError, DaemonError, KeyError, ValueError):
+                is_same_version = False
+            if not is_same_version:
+                client.close()
+                return None
+        return client
+
+    def request(self, message: dict[str, Any]) -> dict[str, Any]:
+        self._file.write(json.dumps({**message, "version": get_version()}).encode() + b"\n")
+        self._file.flush()
+        if not (line := self._file.readline()):
+            msg: Final = "daemon closed the connection"
+            raise DaemonError(msg)
+        response: Final[dict[str, Any]] = json.loads(line)
+        if "error" in response:
+            raise DaemonError(response["error"])
+        return response
+
+    def transform(self, source: str, import_style: str, ignore_global_vars: bool) -> "TransformResult":
+        from auto_typing_final.transformer import AnalysisResult, SpanEdit, TransformResult  # noqa: PLC0415
+
+        response: Final = self.request(
+            {
+                "method": "transform",
+                "source": source,
+                "import_style": import_style,
+                "ignore_global_vars": ignore_global_vars,
+            }
+        )
+        return TransformResult(
+            source=source,
+            new_source=response["result"],
+            analysis=AnalysisResult(
+                edits=[SpanEdit(**edit) for edit in response["edits"]],
+                import_text=response["import_text"],
+                is_parsed=response["is_parsed"],
+            ),
+        )
+
+    def close(self) -> None:
+        self._file.close()
+        self._connection.close()
+
+
+class DaemonServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, idle_timeout: float) -> None:
+        self.results_cache: LruCache[tuple[str, str, bool], TransformResult] = LruCache(
+            max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, get_size=get_result_size
+        )
+        self.handled_requests_count = 0
+        self.active_connections_count = 0
+        self.last_activity_time = time.monotonic()
+        self.lock = threading.Lock()
+        self.is_shutting_down = False
+        self.idle_timeout = idle_timeout
+        self.version = get_version()
+        self.timeout = min(idle_timeout, POLL_INTERVAL_SECONDS)
+        super().__init__(str(socket_path), DaemonRequestHandler)
+
+    def handle_timeout(self) -> None:
+        with self.lock:
+            if not self.active_connections_count and time.monotonic() - self.last_activity_time >= self.idle_timeout:
+                self.is_shutting_down = True
+
+    def _transform(self, source: str, import_style: str, ignore_global_vars: bool) -> "TransformResult":
+        from auto_typing_final.transform import IMPORT_STYLES_TO_IMPORT_CONFIGS  # noqa: PLC0415
+        from auto_typing_final.transformer import Transformer  # noqa: PLC0415
+
+        key: Final = (hashlib.blake2b(source.encode()).hexdigest(), import_style, ignore_global_vars)
+        with self.lock:
+            if (cached_result := self.results_cache.get(key)) is not None:
+                return cached_result
+
+        result: Final = Transformer(
+            import_config=IMPORT_STYLES_TO_IMPORT_CONFIGS[import_style],  # type: ignore[index]
+            ignore_global_vars=ignore_global_vars,
+        ).transform(source)
+        with self.lock:
+            self.results_cache.put(key, result)
+        return result
+
+    def handle_message(self, message: dict[str, Any]) -> dict[str, Any]:
+        with self.lock:
+            self.last_activity_time = time.monotonic()
+            # Every client starts with a handshake, which is not counted as a request
+            if message.get("method") == "hello":
+                return {"version": self.version}
+            self.handled_requests_count += 1
+        match message:
+            case {"method": "transform", "version": str(version)} if version != self.version:
+                return {"error": f"daemon version {self.version} does not match client version {version}"}
+            case {
+                "method": "transform",
+                "source": str(source),
+                "import_style": "typing-final" | "final" as import_style,
+                "ignore_global_vars": bool(ignore_global_vars),
+            }:
+                result: Final = self._transform(source, import_style, ignore_global_vars)
+                return {
+                    "result": result.new_source,
+                    "edits": [dataclasses.asdict(edit) for edit in result.analysis.edits],
+                    "import_text": result.analysis.import_text,
+                    "is_parsed": result.analysis.is_parsed,
+                }
+            case {"method": "status"}:
+                return {
+                    "version": self.version,
+                    "pid": os.getpid(),
+                    "cached_results_count": len(self.results_cache.entries),
+                    "cached_results_bytes": self.results_cache.resident_bytes,
+                    "handled_requests_count": self.handled_requests_count,
+                }
+            case {"method": "shutdown"}:
+                self.is_shutting_down = True
+                return {}
+        return {"error": f"invalid request: {message!r}"}
+
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+    server: DaemonServer
+
+    def setup(self) -> None:
+        super().setup()
+        with self.server.lock:
+            self.server.active_connections_count += 1
+
+    def finish(self) -> None:
+        with self.server.lock:
+            self.server.active_connections_count -= 1
+            self.server.last_activity_time = time.monotonic()
+        super().finish()
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                response = {"error": "request is not valid JSON"}
+            else:
+                response = (
+                    self.server.handle_message(message)
+                    if isinstance(message, dict)
+                    else {"error": "request must be an object"}
+                )
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+def serve(socket_path: Path, idle_timeout: float) -> None:
+    create_socket_directory(socket_path)
+    socket_path.unlink(missing_ok=True)
+    # The socket is created by bind() already closed to others, instead of being chmod-ed after it is reachable
+    previous_umask: Final = os.umask(0o177)
+    try:
+        server: Final = DaemonServer(socket_path, idle_timeout=idle_timeout)
+    finally:
+        os.umask(previous_umask)
+    with server:
+        try:
+            while not server.is_shutting_down:
+                server.handle_request()
+        finally:
+            socket_path.unlink(missing_ok=True)
+
+
+def _start(socket_path: Path, idle_timeout: float) -> int:
+    if client := DaemonClient.connect(socket_path, is_version_checked=False):
+        client.close()
+        sys.stdout.write(f"Daemon is already running at {socket_path}\n")
+        return 0
+    try:
+        create_socket_directory(socket_path)
+    except DaemonError as exception:
+        sys.stderr.write(f"{exception}\n")
+        return 1
+
+    subprocess.Popen(  # noqa: S603
+        [
+            sys.executable,
+            "-m",
+            "auto_typing_final.daemon",
+            "serve",
+            "--socket",
+            str(socket_path),
+            "--idle-timeout",
+            str(idle_timeout),
+        ],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    deadline: Final = time.monotonic() + START_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if client := DaemonClient.connect(socket_path):
+            client.close()
+            sys.stdout.write(f"Daemon started at {socket_path}\n")
+            return 0
+        time.sleep(0.05)
+    sys.stderr.write(f"Daemon did not start at {socket_path}\n")
+    return 1
+
+
+def _send(socket_path: Path, method: str) -> int:
+    if not (client := DaemonClient.connect(socket_path, is_version_checked=False)):
+        sys.stdout.write(f"Daemon is not running at {socket_path}\n")
+        return 1
+    try:
+        response: Final = client.request({"method": method})
+    finally:
+        client.close()
+    sys.stdout.write(f"{json.dumps(response)}\n" if response else "Daemon stopped\n")
+    return 0
+
+
+def daemon_main(argv: list[str]) -> int:
+    parser: Final = argparse.ArgumentParser(
+        prog="auto-typing-final daemon", description="Keep a warm process that serves transform requests"
+    )
+    parser.add_argument("command", choices=["start", "stop", "status", "serve"])
+    parser.add_argument("--socket", type=Path, default=get_default_socket_path())
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=DEFAULT_IDLE_TIMEOUT_SECONDS,
+        help="Shut down after this many seconds without requests",
+    )
+    args: Final = parser.parse_args(argv)
+
+    match args.command:
+        case "start":
+            return _start(args.socket, idle_timeout=args.idle_timeout)
+        case "serve":
+            with contextlib.suppress(KeyboardInterrupt):
+                serve(args.socket, idle_timeout=args.idle_timeout)
+            return 0
+        case "stop":
+            return _send(args.socket, "shutdown")
+    return _send(args.socket, "status")
+
+
+if __name__ == "__main__":
+    sys.exit(daemon_main(sys.argv[1:]))
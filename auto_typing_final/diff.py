@@ -0,0 +1,398 @@
+import re
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, replace
+from typing import Final
+
+from auto_typing_final.transform import find_import_index
+from auto_typing_final.transformer import AnalysisResult, detect_newline
+
+CONTEXT_LINES_COUNT: Final = 3
+# difflib.SequenceMatcher treats lines that make up more than 1% of a new source of this many lines as popular: they
+# never anchor a match, only extend one. Unchanged lines between changes that are all popular, like a single blank
+# line, are then reported as changed together with them.
+AUTOJUNK_MIN_LINES_COUNT: Final = 200
+# Unchanged stretches are checked for a line that can anchor a match among this many of their first lines. Longer
+# stretches without one go through difflib.
+ANCHOR_SEARCH_LINES_COUNT: Final = 8
+# Edit spans are byte offsets, which are found in a non-ASCII source by encoding it by blocks of this many characters
+ENCODED_BLOCK_LENGTH: Final = 64 * 1024
+# str.splitlines() treats these as line boundaries too, such sources go through difflib to keep the output identical
+UNUSUAL_LINE_BOUNDARY_REGEX: Final = re.compile(r"[\x0b\x0c\x1c-\x1e\x85\u2028\u2029]|\r(?!\n)")
+
+
+@dataclass(frozen=True, slots=True)
+class _Opcode:
+    tag: str
+    old_start: int
+    old_end: int
+    new_start: int
+    new_end: int
+    # Changed lines are kept as they are, unchanged ones are read from the source by indices only when printed
+    old_lines: list[str]
+    new_lines: list[str]
+    start_offset: int = 0
+    end_offset: int = 0
+    original_old_start: int = 0
+
+
+def _format_range(start: int, stop: int) -> str:
+    length: Final = stop - start
+    if length == 1:
+        return str(start + 1)
+    return f"{start if not length else start + 1},{length}"
+
+
+def _make_equal_opcode(start_offset: int, end_offset: int, old_start: int, new_start: int, count: int) -> _Opcode:
+    return _Opcode(
+        "equal",
+        old_start,
+        old_start + count,
+        new_start,
+        new_start + count,
+        [],
+        [],
+        start_offset=start_offset,
+        end_offset=end_offset,
+        original_old_start=old_start,
+    )
+
+
+def _count_lines(source: str, start_offset: int, end_offset: int) -> int:
+    return source.count("\n", start_offset, end_offset) + (
+        end_offset > start_offset and not source.endswith("\n", 0, end_offset)
+    )
+
+
+# Goes over the lines one by one instead of splitting the whole source
+def _iter_lines(source: str) -> Iterator[str]:
+    start = 0
+    while start < len(source):
+        end = (source.find("\n", start) + 1) or len(source)
+        yield source[start:end]
+        start = end
+
+
+def _read_equal_lines(source: str, opcode: _Opcode) -> list[str]:
+    count: Final = opcode.old_end - opcode.old_start
+    # Trimmed context is either at the start or at the end of the unchanged block
+    if opcode.old_start == opcode.original_old_start:
+        end = opcode.start_offset
+        for _ in range(count):
+            end = (source.find("\n", end, opcode.end_offset) + 1) or opcode.end_offset
+        return source[opcode.start_offset : end].splitlines(keepends=True)
+    start = opcode.end_offset - 1 if source.endswith("\n", 0, opcode.end_offset) else opcode.end_offset
+    for _ in range(count):
+        start = max(source.rfind("\n", opcode.start_offset, start), opcode.start_offset - 1)
+    return source[start + 1 : opcode.end_offset].splitlines(keepends=True)
+
+
+def _make_changed_opcodes(
+    *,
+    region_start: int,
+    old_lines: list[str],
+    new_lines: list[str],
+    old_start: int,
+    new_start: int,
+) -> list[_Opcode]:
+    line_offsets: Final = [region_start]
+    for line in old_lines:
+        line_offsets.append(line_offsets[-1] + len(line))
+
+    def make_opcode(tag: str, i1: int, i2: int, j1: int, j2: int) -> _Opcode:
+        if tag == "equal":
+            return _make_equal_opcode(line_offsets[i1], line_offsets[i2], old_start + i1, new_start + j1, i2 - i1)
+        return _Opcode(
+            tag, old_start + i1, old_start + i2, new_start + j1, new_start + j2, old_lines[i1:i2], new_lines[j1:j2]
+        )
+
+    prefix_length = 0
+    while prefix_length < min(len(old_lines), len(new_lines)) and old_lines[prefix_length] == new_lines[prefix_length]:
+        prefix_length += 1
+    suffix_length = 0
+    while (
+        suffix_length < min(len(old_lines), len(new_lines)) - prefix_length
+        and old_lines[-suffix_length - 1] == new_lines[-suffix_length - 1]
+    ):
+        suffix_length += 1
+    old_changed_end: Final = len(old_lines) - suffix_length
+    new_changed_end: Final = len(new_lines) - suffix_length
+    old_changed_count: Final = old_changed_end - prefix_length
+    new_changed_count: Final = new_changed_end - prefix_length
+
+    opcodes: Final = [make_opcode("equal", 0, prefix_length, 0, prefix_length)]
+    if old_changed_count and new_changed_count and max(old_changed_count, new_changed_count) > 1:
+        # Multiline edits can keep some lines in the middle, let difflib align those few lines
+        from difflib import SequenceMatcher  # noqa: PLC0415
+
+        opcodes.extend(
+            make_opcode(tag, prefix_length + i1, prefix_length + i2, prefix_length + j1, prefix_length + j2)
+            for tag, i1, i2, j1, j2 in SequenceMatcher(
+                None, old_lines[prefix_length:old_changed_end], new_lines[prefix_length:new_changed_end]
+            ).get_opcodes()
+        )
+    elif old_changed_count or new_changed_count:
+        opcodes.append(
+            make_opcode(
+                "replace" if old_changed_count and new_changed_count else "delete" if old_changed_count else "insert",
+                prefix_length,
+                old_changed_end,
+                prefix_length,
+                new_changed_end,
+            )
+        )
+    opcodes.append(make_opcode("equal", old_changed_end, len(old_lines), new_changed_end, len(new_lines)))
+    return opcodes
+
+
+def _merge_equal_opcodes(opcodes: list[_Opcode]) -> list[_Opcode]:
+    result: Final[list[_Opcode]] = []
+    for opcode in opcodes:
+        if opcode.tag == "equal" and opcode.old_end == opcode.old_start:
+            continue
+        if opcode.tag == "equal" and result and result[-1].tag == "equal":
+            previous = result[-1]
+            result[-1] = _make_equal_opcode(
+                previous.start_offset,
+                opcode.end_offset,
+                previous.old_start,
+                previous.new_start,
+                opcode.old_end - previous.old_start,
+            )
+        else:
+            result.append(opcode)
+    return result
+
+
+# Maps byte offsets to character indices without encoding the whole source at once
+def _make_char_indices(source: str, offsets: Iterable[int]) -> dict[int, int]:
+    if source.isascii():
+        return {offset: offset for offset in offsets}
+    result: Final = {}
+    index = offset = 0
+    for target_offset in sorted(set(offsets)):
+        while offset < target_offset:
+            length = min(target_offset - offset, ENCODED_BLOCK_LENGTH)
+            block = source[index : index + length].encode("utf-8")
+            if offset + len(block) <= target_offset:
+                index += length
+                offset += len(block)
+            else:
+                # The block runs past the target, which is at a character boundary
+                index += len(block[: target_offset - offset].decode("utf-8"))
+                offset = target_offset
+        result[target_offset] = index
+    return result
+
+
+def _make_opcodes(source: str, analysis: AnalysisResult) -> list[_Opcode]:
+    char_indices: Final = _make_char_indices(
+        source, (offset for edit in analysis.edits for offset in (edit.start, edit.end))
+    )
+    edits: Final = [(char_indices[edit.start], char_indices[edit.end], edit.new_text) for edit in analysis.edits]
+    if analysis.import_text:
+        import_index: Final = find_import_index(source)
+        edits.insert(0, (import_index, import_index, f"{analysis.import_text}{detect_newline(source)}"))
+
+    # Edits on the same or on adjacent lines form one region, as difflib would put them into one block
+    regions: Final[list[tuple[int, int, list[tuple[int, int, str]]]]] = []
+    for start, end, new_text in edits:
+        region_start = source.rfind("\n", 0, start) + 1
+        region_end = (source.find("\n", end) + 1) or len(source)
+        if regions and region_start <= regions[-1][1]:
+            regions[-1] = (regions[-1][0], max(region_end, regions[-1][1]), [*regions[-1][2], (start, end, new_text)])
+        else:
+            regions.append((region_start, region_end, [(start, end, new_text)]))
+
+    result: Final = []
+    previous_end = old_line = new_line = 0
+    for region_start, region_end, region_edits in regions:
+        equal_lines_count = _count_lines(source, previous_end, region_start)
+        result.append(_make_equal_opcode(previous_end, region_start, old_line, new_line, equal_lines_count))
+        old_line += equal_lines_count
+        new_line += equal_lines_count
+
+        new_parts: list[str] = []
+        position = region_start
+        for start, end, new_text in region_edits:
+            new_parts.extend((source[position:start], new_text))
+            position = end
+        new_parts.append(source[position:region_end])
+        old_lines = source[region_start:region_end].splitlines(keepends=True)
+        new_lines = "".join(new_parts).splitlines(keepends=True)
+        result.extend(
+            _make_changed_opcodes(
+                region_start=region_start,
+                old_lines=old_lines,
+                new_lines=new_lines,
+                old_start=old_line,
+                new_start=new_line,
+            )
+        )
+        old_line += len(old_lines)
+        new_line += len(new_lines)
+        previous_end = region_end
+
+    result.append(
+        _make_equal_opcode(
+            previous_end, len(source), old_line, new_line, _count_lines(source, previous_end, len(source))
+        )
+    )
+    return _merge_equal_opcodes(result)
+
+
+# Same as difflib.SequenceMatcher.get_grouped_opcodes()
+def _group_opcodes(opcodes: list[_Opcode]) -> Iterator[list[_Opcode]]:
+    if opcodes[0].tag == "equal":
+        first: Final = opcodes[0]
+        opcodes[0] = replace(
+            first,
+            old_start=max(first.old_start, first.old_end - CONTEXT_LINES_COUNT),
+            new_start=max(first.new_start, first.new_end - CONTEXT_LINES_COUNT),
+        )
+    if opcodes[-1].tag == "equal":
+        last: Final = opcodes[-1]
+        opcodes[-1] = replace(
+            last,
+            old_end=min(last.old_end, last.old_start + CONTEXT_LINES_COUNT),
+            new_end=min(last.new_end, last.new_start + CONTEXT_LINES_COUNT),
+        )
+
+    group: list[_Opcode] = []
+    for opcode in opcodes:
+        if opcode.tag == "equal" and opcode.old_end - opcode.old_start > CONTEXT_LINES_COUNT * 2:
+            group.append(
+                replace(
+                    opcode,
+                    old_end=opcode.old_start + CONTEXT_LINES_COUNT,
+                    new_end=opcode.new_start + CONTEXT_LINES_COUNT,
+                )
+            )
+            yield group
+            group = [
+                replace(
+                    opcode,
+                    old_start=opcode.old_end - CONTEXT_LINES_COUNT,
+                    new_start=opcode.new_end - CONTEXT_LINES_COUNT,
+                )
+            ]
+        else:
+            group.append(opcode)
+    if group and not (len(group) == 1 and group[0].tag == "equal"):
+        yield group
+
+
+# Counts lines of the source that are among the given ones, in one pass over the source
+def _count_line_occurrences(source: str, lines: Iterable[str]) -> dict[str, int]:
+    result: Final = dict.fromkeys(lines, 0)
+    if result:
+        for line in _iter_lines(source):
+            if line in result:
+                result[line] += 1
+    return result
+
+
+# Joins an unchanged stretch of popular lines with the changes around it into one replacement, as difflib reports
+# them. Returns None if a long stretch has no line that can anchor a match among its first lines.
+def _join_popular_stretches(
+    opcodes: list[_Opcode], stretches_lines: dict[int, list[str]], is_popular: Callable[[str], bool]
+) -> list[_Opcode] | None:
+    result: Final[list[_Opcode]] = []
+    is_after_popular_stretch = False
+    for opcode in opcodes:
+        is_popular_stretch = False
+        if opcode.tag == "equal":
+            lines = stretches_lines[opcode.old_start]
+            if not all(is_popular(line) for line in lines):
+                result.append(opcode)
+                is_after_popular_stretch = False
+                continue
+            if opcode.old_end - opcode.old_start > len(lines):
+                return None
+            opcode = _Opcode(  # noqa: PLW2901
+                "replace", opcode.old_start, opcode.old_end, opcode.new_start, opcode.new_end, lines, lines
+            )
+            is_popular_stretch = True
+        if result and result[-1].tag != "equal" and (is_popular_stretch or is_after_popular_stretch):
+            previous = result[-1]
+            result[-1] = _Opcode(
+                "replace",
+                previous.old_start,
+                opcode.old_end,
+                previous.new_start,
+                opcode.new_end,
+                [*previous.old_lines, *opcode.old_lines],
+                [*previous.new_lines, *opcode.new_lines],
+            )
+        else:
+            result.append(opcode)
+        is_after_popular_stretch = is_popular_stretch
+    return result
+
+
+# Edits are aligned with the lines they change, while difflib matches equal lines anywhere in the files. The two agree
+# unless a changed line also occurs on the other side, as with `a = 1` next to `a: Final = 1` when one of them changes,
+# or unless difflib can't anchor unchanged lines between changes. Returns None in the first case.
+def _align_like_difflib(opcodes: list[_Opcode], source: str, new_source: str) -> list[_Opcode] | None:
+    changed_opcodes: Final = [opcode for opcode in opcodes if opcode.tag != "equal"]
+    if any(_count_line_occurrences(source, (line for opcode in changed_opcodes for line in opcode.new_lines)).values()):
+        return None
+    new_lines_count: Final = _count_lines(new_source, 0, len(new_source))
+    stretches_lines: Final = (
+        {
+            opcode.old_start: _read_equal_lines(
+                source, replace(opcode, old_end=min(opcode.old_end, opcode.old_start + ANCHOR_SEARCH_LINES_COUNT))
+            )
+            for opcode in opcodes
+            if opcode.tag == "equal"
+        }
+        if new_lines_count >= AUTOJUNK_MIN_LINES_COUNT
+        else {}
+    )
+    new_line_counts: Final = _count_line_occurrences(
+        new_source,
+        (
+            *(line for opcode in changed_opcodes for line in opcode.old_lines),
+            *(line for lines in stretches_lines.values() for line in lines),
+        ),
+    )
+    if any(new_line_counts[line] for opcode in changed_opcodes for line in opcode.old_lines):
+        return None
+    if not stretches_lines:
+        return opcodes
+    max_count: Final = new_lines_count // 100 + 1
+    return _join_popular_stretches(opcodes, stretches_lines, lambda line: new_line_counts[line] > max_count)
+
+
+def _make_difflib_diff(source: str, new_source: str, name: str) -> str:
+    from difflib import unified_diff  # noqa: PLC0415
+
+    return "".join(
+        unified_diff(source.splitlines(keepends=True), new_source.splitlines(keepends=True), fromfile=name, tofile=name)
+    )
+
+
+# Builds the same output as difflib.unified_diff() on whole files, but only looks at lines around the edits
+def make_unified_diff(source: str, new_source: str, analysis: AnalysisResult, name: str) -> str:
+    if not analysis.has_changes:
+        return ""
+    if UNUSUAL_LINE_BOUNDARY_REGEX.search(source):
+        return _make_difflib_diff(source, new_source, name)
+
+    opcodes: Final = _align_like_difflib(_make_opcodes(source, analysis), source, new_source)
+    if opcodes is None:
+        return _make_difflib_diff(source, new_source, name)
+    result: Final[list[str]] = []
+    for group in _group_opcodes(opcodes):
+        if not result:
+            result.extend((f"--- {name}\n", f"+++ {name}\n"))
+        result.append(
+            f"@@ -{_format_range(group[0].old_start, group[-1].old_end)} "
+            f"+{_format_range(group[0].new_start, group[-1].new_end)} @@\n"
+        )
+        for opcode in group:
+            if opcode.tag == "equal":
+                result.extend(f" {line}" for line in _read_equal_lines(source, opcode))
+                continue
+            result.extend(f"-{line}" for line in opcode.old_lines)
+            result.extend(f"+{line}" for line in opcode.new_lines)
+    return "".join(result)
@@ -0,0 +1,333 @@
+import fnmatch
+import functools
+import hashlib
+import os
+import re
+import stat
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Final
+
+SOURCE_FILE_SUFFIXES: Final = (".py", ".pyi")
+DEFAULT_EXCLUDES: Final = (
+    "__pycache__",
+    "__pypackages__",
+    "_build",
+    "buck-out",
+    "build",
+    "dist",
+    "node_modules",
+    "site-packages",
+    "venv",
+)
+
+
+def _translate_gitignore_pattern(pattern: str) -> str:
+    result: Final = []
+    index = 0
+    while index < len(pattern):
+        if pattern.startswith("**/", index):
+            result.append("(?:.*/)?")
+            index += 3
+        elif pattern.startswith("/**", index) and index + 3 == len(pattern):
+            result.append("/.*")
+            index += 3
+        elif pattern.startswith("**", index):
+            result.append(".*")
+            index += 2
+        elif (character := pattern[index]) == "*":
+            result.append("[^/]*")
+            index += 1
+        elif character == "?":
+            result.append("[^/]")
+            index += 1
+        elif character == "[" and (closing_index := pattern.find("]", index + 2)) != -1:
+            result.append("[" + pattern[index + 1 : closing_index].replace("!", "^", 1).replace("\\", "\\\\") + "]")
+            index = closing_index + 1
+        else:
+            result.append(re.escape(character))
+            index += 1
+    return "".join(result)
+
+
+@dataclass(frozen=True, slots=True)
+class GitignoreRule:
+    regex: re.Pattern[str]
+    negated: bool
+    only_directories: bool
+
+
+@dataclass(frozen=True, slots=True)
+class GitignoreRules:
+    base: Path
+    rules: list[GitignoreRule]
+
+    @staticmethod
+    def from_file(path: Path) -> "GitignoreRules | None":
+        try:
+            content: Final = path.read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError):
+            return None
+        rules: Final = []
+        for raw_line in content.splitlines():
+            line = raw_line.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            line = line.removeprefix("!").removeprefix("\\")
+            only_directories = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            prefix = "" if "/" in line else "(?:.*/)?"
+            rules.append(
+                GitignoreRule(
+                    regex=re.compile(prefix + _translate_gitignore_pattern(line.removeprefix("/")) + r"\Z"),
+                    negated=negated,
+                    only_directories=only_directories,
+                )
+            )
+        return GitignoreRules(base=path.parent, rules=rules) if rules else None
+
+    def is_ignored(self, path: Path, is_dir: bool) -> bool | None:
+        try:
+            relative_path: Final = path.relative_to(self.base).as_posix()
+        except ValueError:
+            return None
+        result = None
+        for rule in self.rules:
+            if (not rule.only_directories or is_dir) and rule.regex.match(relative_path):
+                result = not rule.negated
+        return result
+
+
+def _load_parent_gitignores(directory: Path) -> list[GitignoreRules]:
+    result: Final[list[GitignoreRules]] = []
+    if (directory / ".git").exists():
+        return result
+    for parent in directory.parents:
+        if rules := GitignoreRules.from_file(parent / ".gitignore"):
+            result.append(rules)
+        if (parent / ".git").exists():
+            break
+    result.reverse()
+    return result
+
+
+def find_repository_directory(directory: Path) -> Path | None:
+    return next((parent for parent in (directory, *directory.parents) if (parent / ".git").exists()), None)
+
+
+# Relative to the enclosing repository, or to the current directory outside of one, so that a file is matched and
+# hashed the same whichever directory the tool runs from. Paths outside of both are kept absolute.
+def get_project_relative_path(
+    path: Path, find_repository: Callable[[Path], Path | None] = find_repository_directory
+) -> Path:
+    absolute_path: Final = Path(os.path.abspath(path))  # noqa: PTH100
+    base: Final = find_repository(absolute_path.parent) or Path.cwd()
+    return absolute_path.relative_to(base) if absolute_path.is_relative_to(base) else absolute_path
+
+
+@dataclass(slots=True, kw_only=True)
+class SourceFileWalker:
+    exclude: list[str] = field(default_factory=lambda: list(DEFAULT_EXCLUDES))
+    respect_gitignore: bool = True
+    _seen: set[tuple[int, int]] = field(default_factory=set)
+
+    def is_excluded(self, name: str, relative_path: str) -> bool:
+        return any(
+            fnmatch.fnmatchcase(relative_path if "/" in pattern else name, pattern.strip("/"))
+            for pattern in self.exclude
+        )
+
+    def is_excluded_path(self, relative_path: Path) -> bool:
+        parts: Final = relative_path.parts
+        return any(
+            part.startswith(".") or self.is_excluded(part, "/".join(parts[: index + 1]))
+            for index, part in enumerate(parts)
+            if part not in {".", ".."}
+        )
+
+    # Same as the walk decides for one path under root, such as one reported by a file watcher. A path in an ignored
+    # directory is ignored too, as the walk never enters it.
+    def is_ignored_path(self, root: Path, relative_path: Path, *, is_dir: bool) -> bool:
+        if not self.respect_gitignore:
+            return False
+        directory = root.absolute()
+        gitignores: Final = _load_parent_gitignores(directory)
+        parts: Final = relative_path.parts
+        for index, part in enumerate(parts):
+            if own_rules := GitignoreRules.from_file(directory / ".gitignore"):
+                gitignores.append(own_rules)
+            directory /= part
+            if _is_ignored_by_gitignore(gitignores, directory, is_dir or index < len(parts) - 1):
+                return True
+        return False
+
+    # Directories that a walk from root enters, without following symlinks
+    def iter_directories(self, root: Path) -> Iterator[Path]:
+        absolute_root: Final = root.absolute()
+        base_gitignores: Final = _load_parent_gitignores(absolute_root) if self.respect_gitignore else []
+        stack: Final[list[tuple[str, list[GitignoreRules]]]] = [("", base_gitignores)]
+
+        while stack:
+            relative_directory, gitignores = stack.pop()
+            yield root / relative_directory
+            try:
+                with os.scandir(root / relative_directory) as iterator:
+                    names = sorted(entry.name for entry in iterator if entry.is_dir(follow_symlinks=False))
+            except OSError:
+                continue
+            if self.respect_gitignore and (
+                own_rules := GitignoreRules.from_file(absolute_root / relative_directory / ".gitignore")
+            ):
+                gitignores = [*gitignores, own_rules]
+            for name in reversed(names):
+                relative_path = f"{relative_directory}/{name}" if relative_directory else name
+                if (
+                    name.startswith(".")
+                    or self.is_excluded(name, relative_path)
+                    or (gitignores and _is_ignored_by_gitignore(gitignores, absolute_root / relative_path, is_dir=True))
+                ):
+                    continue
+                stack.append((relative_path, gitignores))
+
+    def _is_new(self, key: tuple[int, int]) -> bool:
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        return True
+
+    def _walk_directory(self, root: Path) -> Iterator[Path]:
+        absolute_root: Final = root.absolute()
+        base_gitignores: Final = _load_parent_gitignores(absolute_root) if self.respect_gitignore else []
+        stack: Final[list[tuple[str, list[GitignoreRules]]]] = [("", base_gitignores)]
+
+        while stack:
+            relative_directory, gitignores = stack.pop()
+            directory = root / relative_directory
+            try:
+                device = directory.stat().st_dev
+                with os.scandir(directory) as iterator:
+                    entries = sorted(iterator, key=lambda entry: entry.name)
+            except OSError:
+                continue
+            if (
+                self.respect_gitignore
+                and any(entry.name == ".gitignore" for entry in entries)
+                and (own_rules := GitignoreRules.from_file(absolute_root / relative_directory / ".gitignore"))
+            ):
+                gitignores = [*gitignores, own_rules]
+
+            subdirectories = []
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                    if not is_dir and not entry.name.endswith(SOURCE_FILE_SUFFIXES):
+                        continue
+                    key = _get_entry_key(entry, device)
+                except OSError:
+                    continue
+                relative_path = f"{relative_directory}/{entry.name}" if relative_directory else entry.name
+                if (
+                    self.is_excluded(entry.name, relative_path)
+                    or (gitignores and _is_ignored_by_gitignore(gitignores, absolute_root / relative_path, is_dir))
+                    or not self._is_new(key)
+                ):
+                    continue
+                if is_dir:
+                    subdirectories.append((relative_path, gitignores))
+                else:
+                    yield root / relative_path
+            stack.extend(reversed(subdirectories))
+
+    def walk(self, paths: Iterable[Path]) -> Iterator[Path]:
+        for path in paths:
+            try:
+                stat_result = path.stat()
+            except OSError:
+                yield path
+                continue
+            if not self._is_new((stat_result.st_dev, stat_result.st_ino)):
+                continue
+            if stat.S_ISDIR(stat_result.st_mode):
+                yield from self._walk_directory(path)
+            else:
+                yield path
+
+
+# inode() of a symlink is its own, while the file or directory it points to is what gets processed
+def _get_entry_key(entry: os.DirEntry[str], device: int) -> tuple[int, int]:
+    if entry.is_symlink():
+        target_stat: Final = entry.stat()
+        return target_stat.st_dev, target_stat.st_ino
+    return device, entry.inode()
+
+
+def _is_ignored_by_gitignore(gitignores: list[GitignoreRules], path: Path, is_dir: bool) -> bool:
+    result = False
+    for rules in gitignores:
+        if (is_ignored := rules.is_ignored(path, is_dir)) is not None:
+            result = is_ignored
+    return result
+
+
+def find_all_source_files(
+    paths: Iterable[Path], *, exclude: Iterable[str] = DEFAULT_EXCLUDES, respect_gitignore: bool = True
+) -> Iterator[Path]:
+    return SourceFileWalker(exclude=list(exclude), respect_gitignore=respect_gitignore).walk(paths)
+
+
+@dataclass(frozen=True, slots=True)
+class Shard:
+    index: int
+    count: int
+
+    @staticmethod
+    def parse(value: str) -> "Shard":
+        index, separator, count = value.partition("/")
+        if not separator or not index.isdigit() or not count.isdigit() or not 1 <= int(index) <= int(count):
+            msg: Final = f"expected INDEX/COUNT with 1 <= INDEX <= COUNT, got {value!r}"
+            raise ValueError(msg)
+        return Shard(index=int(index), count=int(count))
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+
+def _stable_hash(path: Path) -> int:
+    return int.from_bytes(hashlib.blake2b(path.as_posix().encode(), digest_size=8).digest(), "big")
+
+
+def _get_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+# Paths are hashed and ordered relative to the project, so nodes that pass it as `.`, as an absolute path or run from
+# a subdirectory agree on the assignment
+def take_shard(paths: Iterable[Path], shard: Shard, *, balance_by_size: bool = False) -> Iterator[Path]:
+    find_repository: Final = functools.cache(find_repository_directory)
+
+    def get_key(path: Path) -> Path:
+        return get_project_relative_path(path, find_repository)
+
+    if not balance_by_size:
+        return (path for path in paths if _stable_hash(get_key(path)) % shard.count == shard.index - 1)
+
+    # Largest files first into the least loaded shard: every node computes the same assignment for the same tree.
+    shard_sizes: Final = [0] * shard.count
+    own_paths: Final = []
+    for size, _, path in sorted(
+        ((_get_size(path), get_key(path), path) for path in paths), key=lambda item: (-item[0], item[1])
+    ):
+        least_loaded_shard = min(range(shard.count), key=lambda index: (shard_sizes[index], index))
+        shard_sizes[least_loaded_shard] += size
+        if least_loaded_shard == shard.index - 1:
+            own_paths.append(path)
+    return iter(own_paths)
@@ -0,0 +1,62 @@
+import io
+import mmap
+import os
+import tokenize
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+from typing import TYPE_CHECKING, Final
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+# Smaller files are cheaper to read in one call than to map
+MMAP_THRESHOLD_BYTES: Final = 1024 * 1024
+
+
+@dataclass(frozen=True, slots=True)
+class SourceFile:
+    text: str
+    # As declared by a coding cookie or a BOM, used to write the file back
+    encoding: str
+
+
+# A bogus coding cookie, a cookie that contradicts the BOM or bytes that don't match the encoding
+class SourceDecodeError(Exception): ...
+
+
+def _decode(readline: "Callable[[], bytes]", decode: "Callable[[str], str]") -> SourceFile:
+    try:
+        encoding, _ = tokenize.detect_encoding(readline)
+        return SourceFile(text=decode(encoding), encoding=encoding)
+    except (SyntaxError, UnicodeDecodeError) as exception:
+        raise SourceDecodeError(str(exception)) from exception
+
+
+def decode_source(data: bytes) -> SourceFile:
+    return _decode(io.BytesIO(data).readline, data.decode)
+
+
+# Reads bytes without newline translation, so line endings are kept as they are in the file
+def read_source_file(path: Path) -> SourceFile:
+    with path.open("rb") as file:
+        if os.fstat(file.fileno()).st_size < MMAP_THRESHOLD_BYTES:
+            return decode_source(file.read())
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file:
+            return _decode(mapped_file.readline, partial(str, mapped_file))
+
+
+# Writes to a temporary file next to the target and renames it over, so readers never see a partially written file
+def write_source_file(path: Path, text: str, encoding: str) -> None:
+    import tempfile  # noqa: PLC0415
+
+    target_path: Final = Path(os.path.realpath(path))
+    file_descriptor, temporary_name = tempfile.mkstemp(dir=target_path.parent, prefix=f".{target_path.name}.")
+    try:
+        with os.fdopen(file_descriptor, "wb") as file:
+            file.write(text.encode(encoding))
+        os.chmod(temporary_name, target_path.stat().st_mode & 0o7777)  # noqa: PTH101
+        os.replace(temporary_name, target_path)  # noqa: PTH105
+    except BaseException:
+        Path(temporary_name).unlink(missing_ok=True)
+        raise
@@ -62,6 +62,15 @@ def _is_inside_inner_function_or_class(root: SgNode, node: SgNode) -> bool:
     return False
 
 
+def _is_inside_any_function_within(root: SgNode, node: SgNode) -> bool:
+    for ancestor in node.ancestors():
+        if ancestor == root:
+            return False
+        if ancestor.kind() == "function_definition":
+            return True
+    return False
+
+
 def _find_identifiers_in_import_statement(node: SgNode) -> Iterable[SgNode]:
     match tuple((child.kind(), child) for child in node.children()):
         case (("from", _), _, ("import", _), *name_nodes) | (("import", _), *name_nodes):
@@ -91,10 +100,8 @@ def _find_identifiers_made_by_node(node: SgNode) -> Iterable[SgNode]:  # noqa: C
         case "class_definition":
             if name := node.field("name"):
                 yield name
-            for function in node.find_all(kind="function_definition"):
-                for nonlocal_statement in node.find_all(kind="nonlocal_statement"):
-                    if _is_inside_inner_function(root=function, node=nonlocal_statement):
-                        continue
+            for nonlocal_statement in node.find_all(kind="nonlocal_statement"):
+                if _is_inside_any_function_within(root=node, node=nonlocal_statement):
                     yield from _find_identifiers_in_children(nonlocal_statement)
         case "function_definition":
             if name := node.field("name"):
@@ -142,20 +149,27 @@ def _find_identifiers_made_by_node(node: SgNode) -> Iterable[SgNode]:  # noqa: C
                 yield from left.find_all(kind="identifier")
 
 
-def _line_has_ignore_comment(node: SgNode) -> bool:
+def _line_has_ignore_comment(node: SgNode, checked_blocks: dict[SgNode, bool]) -> bool:
     if not (parent := node.parent()):
         return False
     if not (grand_parent := parent.parent()):
         return False
-    for one_child in grand_parent.children():
-        if one_child.kind() == "comment" and IGNORE_COMMENT_TEXT in one_child.text():
-            return True
-    return False
+    if (has_ignore_comment := checked_blocks.get(grand_parent)) is None:
+        has_ignore_comment = checked_blocks[grand_parent] = any(
+            one_child.kind() == "comment" and IGNORE_COMMENT_TEXT in one_child.text()
+            for one_child in grand_parent.children()
+        )
+    return has_ignore_comment
 
 
 def _find_identifiers_in_current_scope(node: SgNode) -> Iterable[tuple[SgNode, SgNode]]:
+    checked_blocks: Final[dict[SgNode, bool]] = {}
     for child in node.find_all(DEFINITION_RULE):
-        if child == node or _is_inside_inner_function_or_class(node, child) or _line_has_ignore_comment(child):
+        if (
+            child == node
+            or _is_inside_inner_function_or_class(node, child)
+            or _line_has_ignore_comment(child, checked_blocks)
+        ):
             continue
         for identifier in _find_identifiers_made_by_node(child):
             yield identifier, child
@@ -191,8 +205,8 @@ def has_global_identifier_with_name(root: SgNode, name: str) -> bool:
     return name in {identifier.text() for identifier, _ in _find_identifiers_in_current_scope(root)}
 
 
-def find_global_definitions(root: SgNode) -> Iterable[list[SgNode]]:
-    definitions_by_name: Final = defaultdict(list)
+def find_global_definitions_by_name(root: SgNode) -> dict[str, list[SgNode]]:
+    definitions_by_name: Final[defaultdict[str, list[SgNode]]] = defaultdict(list)
 
     for identifier, definition_node in _find_identifiers_in_current_scope(root):
         definitions_by_name[identifier.text()].append(definition_node)
@@ -201,7 +215,11 @@ def find_global_definitions(root: SgNode) -> Iterable[list[SgNode]]:
         for one_identifier in _find_identifiers_in_children(one_node):
             definitions_by_name[one_identifier.text()].append(one_node)
 
-    return definitions_by_name.values()
+    return definitions_by_name
+
+
+def find_global_definitions(root: SgNode) -> Iterable[list[SgNode]]:
+    return find_global_definitions_by_name(root).values()
 
 
 @dataclass(slots=True, kw_only=True)
@@ -0,0 +1,143 @@
+import json
+import os
+import subprocess  # noqa: S404
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Final
+
+from auto_typing_final.discovery import SOURCE_FILE_SUFFIXES, SourceFileWalker
+
+CACHE_FILE_NAME: Final = "auto-typing-final-cache.json"
+
+
+class GitError(Exception): ...
+
+
+def _run_git(*args: str, cwd: Path | None = None) -> str:
+    try:
+        return subprocess.run(  # noqa: S603
+            ["git", *args],  # noqa: S607
+            cwd=cwd,
+            check=True,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+        ).stdout
+    except FileNotFoundError as exception:
+        msg = "git executable is not found"
+        raise GitError(msg) from exception
+    except subprocess.CalledProcessError as exception:
+        msg = f"`git {' '.join(args)}` failed: {exception.stderr.strip()}"
+        raise GitError(msg) from exception
+
+
+def _split_nul_separated(output: str) -> list[str]:
+    return [one_item for one_item in output.split("\0") if one_item]
+
+
+def find_repository_root() -> Path:
+    return Path(_run_git("rev-parse", "--show-toplevel").strip())
+
+
+def list_changed_files(*, since: str | None, staged: bool) -> list[Path]:
+    repository_root: Final = find_repository_root()
+    relative_paths: Final[set[str]] = set()
+    if since is not None:
+        relative_paths.update(_split_nul_separated(_run_git("diff", "--name-only", "-z", "--diff-filter=d", since)))
+        relative_paths.update(
+            _split_nul_separated(_run_git("ls-files", "--others", "--exclude-standard", "-z", cwd=repository_root))
+        )
+    if staged:
+        relative_paths.update(
+            _split_nul_separated(_run_git("diff", "--name-only", "-z", "--diff-filter=d", "--cached"))
+        )
+    return [repository_root / relative_path for relative_path in sorted(relative_paths)]
+
+
+def select_changed_source_files(changed_files: Iterable[Path], paths: list[Path], exclude: list[str]) -> Iterator[Path]:
+    roots: Final = [Path(os.path.abspath(path)) for path in paths]  # noqa: PTH100
+    walker: Final = SourceFileWalker(exclude=exclude)
+    current_directory: Final = Path.cwd()
+
+    for changed_file in changed_files:
+        if not changed_file.name.endswith(SOURCE_FILE_SUFFIXES) or not changed_file.is_file():
+            continue
+        for root in roots:
+            if changed_file.is_relative_to(root):
+                if not walker.is_excluded_path(changed_file.relative_to(root)):
+                    yield (
+                        changed_file.relative_to(current_directory)
+                        if changed_file.is_relative_to(current_directory)
+                        else changed_file
+                    )
+                break
+
+
+def get_tool_version() -> str:
+    from importlib.metadata import PackageNotFoundError, version  # noqa: PLC0415
+
+    try:
+        return version("auto-typing-final")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+# Remembers blobs that need no changes. Unmodified tracked files are looked up by the SHA from the git index,
+# so their content is never read or hashed.
+@dataclass(slots=True, kw_only=True)
+class GitBlobCache:
+    path: Path
+    repository_root: Path
+    config_key: str
+    index_blobs: dict[str, str]
+    clean_blobs: set[str]
+    _is_dirty: bool = field(default=False)
+
+    @staticmethod
+    def load(config_key: str) -> "GitBlobCache":
+        repository_root: Final = find_repository_root()
+        cache_path: Final = Path(_run_git("rev-parse", "--path-format=absolute", "--git-path", CACHE_FILE_NAME).strip())
+        full_config_key: Final = f"{get_tool_version()}:{config_key}"
+
+        modified_files: Final = set(_split_nul_separated(_run_git("diff", "--name-only", "-z")))
+        index_blobs: Final = {}
+        for line in _split_nul_separated(_run_git("ls-files", "--stage", "-z", cwd=repository_root)):
+            metadata, _, relative_path = line.partition("\t")
+            if relative_path not in modified_files:
+                index_blobs[relative_path] = metadata.split()[1]
+
+        try:
+            cache_content: Final = json.loads(cache_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            clean_blobs = set()
+        else:
+            clean_blobs = set(cache_content.get(full_config_key, [])) if isinstance(cache_content, dict) else set()
+
+        return GitBlobCache(
+            path=cache_path,
+            repository_root=repository_root,
+            config_key=full_config_key,
+            index_blobs=index_blobs,
+            clean_blobs=clean_blobs,
+        )
+
+    def _get_blob(self, path: Path) -> str | None:
+        return self.index_blobs.get(os.path.relpath(os.path.abspath(path), self.repository_root).replace(os.sep, "/"))  # noqa: PTH100
+
+    def is_known_clean(self, path: Path) -> bool:
+        return (blob := self._get_blob(path)) is not None and blob in self.clean_blobs
+
+    def mark_clean(self, path: Path) -> None:
+        if (blob := self._get_blob(path)) is not None and blob not in self.clean_blobs:
+            self.clean_blobs.add(blob)
+            self._is_dirty = True
+
+    def save(self) -> None:
+        if not self._is_dirty:
+            return
+        self.path.write_text(
+            json.dumps({self.config_key: sorted(self.clean_blobs.intersection(self.index_blobs.values()))}),
+            encoding="utf-8",
+        )
+        self._is_dirty = False
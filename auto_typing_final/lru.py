@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Final, Generic, TypeVar
+
+KeyT = TypeVar("KeyT")
+ValueT = TypeVar("ValueT")
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class CacheStats:
+    entries_count: int
+    resident_bytes: int
+    hits_count: int
+    misses_count: int
+    evictions_count: int
+
+    @property
+    def hit_rate(self) -> float:
+        lookups_count: Final = self.hits_count + self.misses_count
+        return self.hits_count / lookups_count if lookups_count else 0.0
+
+
+# Evicts least recently used entries once there are more than max_entries of them or their approximate size,
+# as told by get_size, exceeds max_bytes. A value larger than the whole budget is not stored at all.
+@dataclass(slots=True, kw_only=True)
+class LruCache(Generic[KeyT, ValueT]):
+    max_entries: int
+    max_bytes: int
+    get_size: Callable[[ValueT], int]
+    entries: OrderedDict[KeyT, tuple[ValueT, int]] = field(default_factory=OrderedDict)
+    resident_bytes: int = 0
+    hits_count: int = 0
+    misses_count: int = 0
+    evictions_count: int = 0
+
+    # A stored value that is_current rejects counts as a miss and is dropped
+    def get(self, key: KeyT, is_current: Callable[[ValueT], bool] = lambda _: True) -> ValueT | None:
+        entry: Final = self.entries.get(key)
+        if entry is None or not is_current(entry[0]):
+            self.misses_count += 1
+            if entry is not None:
+                self.pop(key)
+            return None
+        self.hits_count += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: KeyT, value: ValueT) -> None:
+        self.pop(key)
+        size: Final = self.get_size(value)
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (value, size)
+        self.resident_bytes += size
+        while len(self.entries) > self.max_entries or self.resident_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.resident_bytes -= evicted_size
+            self.evictions_count += 1
+
+    def pop(self, key: KeyT) -> None:
+        if (entry := self.entries.pop(key, None)) is not None:
+            self.resident_bytes -= entry[1]
+
+    @property
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            entries_count=len(self.entries),
+            resident_bytes=self.resident_bytes,
+            hits_count=self.hits_count,
+            misses_count=self.misses_count,
+            evictions_count=self.evictions_count,
+        )
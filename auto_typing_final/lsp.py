@@ -1,28 +1,48 @@
+import hashlib
+import json
 import os
 import sys
+import threading
 import typing
 import uuid
-from dataclasses import dataclass
-from importlib.metadata import version
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from functools import partial
 from pathlib import Path
-from typing import Any, Final, TypedDict, cast
+from typing import TYPE_CHECKING, Any, Final, TypedDict, cast
 from urllib.parse import unquote_to_bytes
 
 import attr
 import cattrs
 import lsprotocol.types as lsp
 from ast_grep_py import SgRoot
+from lsprotocol.converters import get_converter
 from pygls.server import LanguageServer
+from pygls.workspace import TextDocument
 
+from auto_typing_final.lru import LruCache
 from auto_typing_final.transform import (
     IMPORT_STYLES_TO_IMPORT_CONFIGS,
     AddFinal,
     Edit,
     ImportConfig,
     ImportStyle,
+    MakeReplacementsResult,
+    find_import_index,
     make_replacements,
 )
 
+if TYPE_CHECKING:
+    import asyncio
+
+DEFAULT_CACHE_MAX_DOCUMENTS: Final = 256
+DEFAULT_CACHE_MAX_BYTES: Final = 64 * 1024 * 1024
+# Measured with tracemalloc: a diagnostic with its fix data or a text edit takes about this much
+APPROXIMATE_EDIT_SIZE_BYTES: Final = 1536
+CACHE_STATS_METHOD: Final = "auto-typing-final/cacheStats"
+LSP_CONVERTER: Final = get_converter()
+
 
 # From Python 3.13: https://github.com/python/cpython/blob/0790418a0406cc5419bfd9d718522a749542bbc8/Lib/pathlib/_local.py#L815
 def path_from_uri(uri: str) -> Path | None:
@@ -49,6 +69,10 @@ def path_from_uri(uri: str) -> Path | None:
 
 
 ClientSettings = TypedDict("ClientSettings", {"import-style": ImportStyle, "ignore-global-vars": bool})
+# Optional, so that clients which send only the required settings keep working
+ClientCacheSettings = TypedDict(
+    "ClientCacheSettings", {"cache-max-documents": int, "cache-max-bytes": int}, total=False
+)
 FullClientSettings = TypedDict("FullClientSettings", {"auto-typing-final": ClientSettings})
 
 
@@ -74,6 +98,13 @@ def parse_settings(raw_full_client_settings: Any) -> FullClientSettings | None:
             f"invalid ignore-global-vars setting: must be a boolean. Settings: {raw_full_client_settings}"
         )
         return None
+    for key in ("cache-max-documents", "cache-max-bytes"):
+        value = client_settings.get(key, 1)
+        if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+            LSP_SERVER.show_message_log(
+                f"invalid {key} setting: must be a positive integer. Settings: {raw_full_client_settings}"
+            )
+            return None
     return typing.cast("FullClientSettings", raw_full_client_settings)
 
 
@@ -83,30 +114,68 @@ class Fix:
     text_edits: list[lsp.TextEdit | lsp.AnnotatedTextEdit]
 
 
-def make_import_text_edit(import_text: str) -> lsp.TextEdit:
+def make_import_text_edit(import_text: str, line: int) -> lsp.TextEdit:
     return lsp.TextEdit(
-        range=lsp.Range(start=lsp.Position(line=0, character=0), end=lsp.Position(line=0, character=0)),
+        range=lsp.Range(start=lsp.Position(line=line, character=0), end=lsp.Position(line=line, character=0)),
         new_text=f"{import_text}\n",
     )
 
 
 def make_text_edit(edit: Edit) -> lsp.TextEdit:
-    node_range: Final = edit.node.range()
     return lsp.TextEdit(
         range=lsp.Range(
-            start=lsp.Position(line=node_range.start.line, character=node_range.start.column),
-            end=lsp.Position(line=node_range.end.line, character=node_range.end.column),
+            start=lsp.Position(line=edit.start.line, character=edit.start.column),
+            end=lsp.Position(line=edit.end.line, character=edit.end.column),
         ),
         new_text=edit.new_text,
     )
 
 
+def make_fix_all_text_edits(
+    replacement_result: MakeReplacementsResult, import_line: int
+) -> list[lsp.TextEdit | lsp.AnnotatedTextEdit]:
+    result: Final[list[lsp.TextEdit | lsp.AnnotatedTextEdit]] = [
+        make_text_edit(edit) for replacement in replacement_result.replacements for edit in replacement.edits
+    ]
+    if replacement_result.import_text:
+        result.append(make_import_text_edit(replacement_result.import_text, import_line))
+    return result
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class DocumentAnalysis:
+    source: str
+    diagnostics: list[lsp.Diagnostic]
+    fix_all_text_edits: list[lsp.TextEdit | lsp.AnnotatedTextEdit]
+
+
+def get_document_analysis_size(analysis: DocumentAnalysis) -> int:
+    return sys.getsizeof(analysis.source) + APPROXIMATE_EDIT_SIZE_BYTES * (
+        len(analysis.diagnostics) + len(analysis.fix_all_text_edits)
+    )
+
+
+def hash_source(source: str) -> str:
+    return hashlib.sha256(source.encode("utf-8", "surrogatepass")).hexdigest()
+
+
 @dataclass(frozen=True, slots=True, kw_only=True)
 class Service:
     ls_name: str
     ignored_paths: list[Path]
     import_config: ImportConfig
     ignore_global_vars: bool
+    settings: FullClientSettings
+    # Analysis of the last seen source of each document, built for this service's settings only
+    document_cache: LruCache[str, DocumentAnalysis] = field(
+        default_factory=lambda: LruCache(
+            max_entries=DEFAULT_CACHE_MAX_DOCUMENTS,
+            max_bytes=DEFAULT_CACHE_MAX_BYTES,
+            get_size=get_document_analysis_size,
+        )
+    )
+    # Unstructured analyses saved by the previous session, by source hash, see load_snapshot()
+    snapshot_analyses: dict[str, Any] = field(default_factory=dict)
 
     @staticmethod
     def try_from_settings(ls_name: str, settings: Any) -> "Service | None":  # noqa: ANN401
@@ -115,19 +184,58 @@ class Service:
             return None
 
         executable_path: Final = Path(sys.executable)
+        cache_settings: Final = typing.cast("ClientCacheSettings", validated_settings["auto-typing-final"])
         return Service(
             ls_name=ls_name,
             ignored_paths=[executable_path.parent.parent] if executable_path.parent.name == "bin" else [],
             import_config=IMPORT_STYLES_TO_IMPORT_CONFIGS[validated_settings["auto-typing-final"]["import-style"]],
             ignore_global_vars=validated_settings["auto-typing-final"]["ignore-global-vars"],
+            settings=validated_settings,
+            document_cache=LruCache(
+                max_entries=cache_settings.get("cache-max-documents", DEFAULT_CACHE_MAX_DOCUMENTS),
+                max_bytes=cache_settings.get("cache-max-bytes", DEFAULT_CACHE_MAX_BYTES),
+                get_size=get_document_analysis_size,
+            ),
         )
 
-    def make_diagnostics(self, source: str) -> list[lsp.Diagnostic]:
+    # Diagnostics and fix-all edits come from one parse, and are reused until the document source changes
+    def analyze_document(self, uri: str, source: str) -> DocumentAnalysis:
+        if cached_analysis := self.document_cache.get(uri, lambda analysis: analysis.source == source):
+            return cached_analysis
+        analysis: Final = self._take_snapshot_analysis(source) or self.analyze_source(source)
+        self.document_cache.put(uri, analysis)
+        return analysis
+
+    # The snapshot is read from disk without a schema, so an analysis that doesn't structure is made again
+    def _take_snapshot_analysis(self, source: str) -> DocumentAnalysis | None:
+        if not self.snapshot_analyses or not (raw_analysis := self.snapshot_analyses.pop(hash_source(source), None)):
+            return None
+        try:
+            return DocumentAnalysis(
+                source=source,
+                diagnostics=LSP_CONVERTER.structure(raw_analysis["diagnostics"], list[lsp.Diagnostic]),
+                fix_all_text_edits=LSP_CONVERTER.structure(
+                    raw_analysis["fix_all_text_edits"], list[lsp.TextEdit | lsp.AnnotatedTextEdit]
+                ),
+            )
+        except (cattrs.errors.CattrsError, KeyError, TypeError, ValueError):
+            return None
+
+    # Doesn't touch the cache, so it is safe to call from any thread
+    def analyze_source(self, source: str) -> DocumentAnalysis:
         replacement_result: Final = make_replacements(
             root=SgRoot(source, "python").root(),
             import_config=self.import_config,
             ignore_global_vars=self.ignore_global_vars,
         )
+        import_line: Final = source.count("\n", 0, find_import_index(source))
+        return DocumentAnalysis(
+            source=source,
+            diagnostics=self.make_diagnostics(replacement_result, import_line),
+            fix_all_text_edits=make_fix_all_text_edits(replacement_result, import_line),
+        )
+
+    def make_diagnostics(self, replacement_result: MakeReplacementsResult, import_line: int) -> list[lsp.Diagnostic]:
         result: Final = []
 
         for replacement in replacement_result.replacements:
@@ -140,10 +248,11 @@ class Service:
 
             fix = Fix(message=fix_message, text_edits=[make_text_edit(edit) for edit in replacement.edits])
             if replacement_result.import_text:
-                fix.text_edits.append(make_import_text_edit(replacement_result.import_text))
+                fix.text_edits.append(make_import_text_edit(replacement_result.import_text, import_line))
 
-            for applied_edit in replacement.edits:
-                node_range = applied_edit.node.range()
+            # One definition can get several edits, but it is reported once
+            for node in dict.fromkeys(edit.node for edit in replacement.edits):
+                node_range = node.range()
                 result.append(
                     lsp.Diagnostic(
                         range=lsp.Range(
@@ -158,19 +267,6 @@ class Service:
                 )
         return result
 
-    def make_fix_all_text_edits(self, source: str) -> list[lsp.TextEdit | lsp.AnnotatedTextEdit]:
-        replacement_result: Final = make_replacements(
-            root=SgRoot(source, "python").root(),
-            import_config=self.import_config,
-            ignore_global_vars=self.ignore_global_vars,
-        )
-        result: Final[list[lsp.TextEdit | lsp.AnnotatedTextEdit]] = [
-            make_text_edit(edit) for replacement in replacement_result.replacements for edit in replacement.edits
-        ]
-        if replacement_result.import_text:
-            result.append(make_import_text_edit(replacement_result.import_text))
-        return result
-
     def path_is_ignored(self, uri: str) -> bool:
         if path := path_from_uri(uri):
             return any(path.is_relative_to(ignored_path) for ignored_path in self.ignored_paths)
@@ -179,13 +275,91 @@ class Service:
 
 class CustomLanguageServer(LanguageServer):
     service: Service | None = None
+    snapshot_path: Path | None = None
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:  # noqa: ANN401
+        super().__init__(*args, **kwargs)
+        # Open documents are re-analyzed after a configuration change here, one pass at a time
+        self.rediagnosis_executor: Final = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rediagnosis")
+        self.rediagnosis_cancel_event = threading.Event()
 
+    # pygls copies the version into the initialize result when the server is made, so both are updated
+    def set_version(self, version: str) -> None:
+        self.version = version
+        self.lsp.server_info.version = version
 
-LSP_SERVER: Final = CustomLanguageServer(name="auto-typing-final", version=version("auto-typing-final"), max_workers=5)
 
+# The version is only reported on initialization, so importlib.metadata is loaded in main() rather than on import
+LSP_SERVER: Final = CustomLanguageServer(name="auto-typing-final", version="", max_workers=5)
 
+
+def get_snapshot_path(workspace_uri: str) -> Path:
+    cache_directory: Final = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    workspace_hash: Final = hashlib.sha256(workspace_uri.encode()).hexdigest()[:16]
+    return Path(cache_directory) / "auto-typing-final" / f"lsp-{workspace_hash}.json"
+
+
+# Analyses of open documents are saved on shutdown by source hash, together with the settings and the tool version
+# they were made with. They are only reused by the same version, and only until the client sends other settings.
+def save_snapshot(path: Path, service: Service, version: str) -> None:
+    import tempfile  # noqa: PLC0415
+
+    documents: Final = {
+        hash_source(analysis.source): {
+            "diagnostics": LSP_CONVERTER.unstructure(analysis.diagnostics, list[lsp.Diagnostic]),
+            "fix_all_text_edits": LSP_CONVERTER.unstructure(
+                analysis.fix_all_text_edits, list[lsp.TextEdit | lsp.AnnotatedTextEdit]
+            ),
+        }
+        for analysis, _ in service.document_cache.entries.values()
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Written next to the target and renamed over it, so that a server that is killed midway or another one shutting
+    # down at the same time never leaves a partial snapshot
+    file_descriptor, temporary_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+            json.dump({"version": version, "settings": service.settings, "documents": documents}, file)
+        os.replace(temporary_name, path)  # noqa: PTH105
+    except BaseException:
+        Path(temporary_name).unlink(missing_ok=True)
+        raise
+
+
+def load_snapshot(path: Path, ls_name: str, version: str) -> Service | None:
+    try:
+        content: Final = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not isinstance(content, dict) or content.get("version") != version:
+        return None
+    service: Final = Service.try_from_settings(ls_name=ls_name, settings=content.get("settings"))
+    documents: Final = content.get("documents")
+    if not service or not isinstance(documents, dict):
+        return None
+    return replace(service, snapshot_analyses=documents)
+
+
+# Until the client sends its settings, the ones from the snapshot are used, so that diagnostics of reopened documents
+# are published right away
 @LSP_SERVER.feature(lsp.INITIALIZE)
-def initialize(_: lsp.InitializeParams) -> None: ...
+def initialize(ls: CustomLanguageServer, params: lsp.InitializeParams) -> None:
+    workspace_uri: Final = params.workspace_folders[0].uri if params.workspace_folders else params.root_uri
+    if not workspace_uri:
+        return
+    ls.snapshot_path = get_snapshot_path(workspace_uri)
+    ls.service = ls.service or load_snapshot(ls.snapshot_path, ls.name, ls.version)
+
+
+@LSP_SERVER.feature(lsp.SHUTDOWN)
+def shutdown(ls: CustomLanguageServer, _: None) -> None:
+    ls.rediagnosis_cancel_event.set()
+    if not ls.service or not ls.snapshot_path:
+        return
+    try:
+        save_snapshot(ls.snapshot_path, ls.service, ls.version)
+    except OSError as exception:
+        ls.show_message_log(f"cannot save snapshot to {ls.snapshot_path}: {exception}")
 
 
 @LSP_SERVER.feature(lsp.INITIALIZED)
@@ -204,14 +378,71 @@ async def initialized(ls: CustomLanguageServer, _: lsp.InitializedParams) -> Non
     LSP_SERVER.show_message_log("language server initialized")
 
 
+# Documents that were analyzed most recently are likely the ones on screen, so they go first
+def prioritize_documents(documents: Iterable[TextDocument], recent_uris: Iterable[str]) -> list[TextDocument]:
+    uris_to_documents: Final = {document.uri: document for document in documents}
+    recent_documents: Final = [uris_to_documents.pop(uri) for uri in recent_uris if uri in uris_to_documents]
+    return [*recent_documents, *uris_to_documents.values()]
+
+
+# Called on the event loop, so it doesn't race with handlers. A result is dropped if its document was closed or
+# edited while it was being analyzed, or if the configuration changed again.
+def publish_document_analysis(ls: CustomLanguageServer, service: Service, uri: str, analysis: DocumentAnalysis) -> None:
+    text_document: Final = ls.workspace.text_documents.get(uri)
+    if ls.service is not service or not text_document or text_document.source != analysis.source:
+        return
+    service.document_cache.put(uri, analysis)
+    ls.publish_diagnostics(uri, diagnostics=analysis.diagnostics)
+
+
+# One document that fails to analyze is logged and doesn't stop the pass
+def rediagnose(
+    ls: CustomLanguageServer, service: Service, sources: list[tuple[str, str]], cancel_event: threading.Event
+) -> None:
+    for uri, source in sources:
+        if cancel_event.is_set():
+            return
+        try:
+            callback = partial(publish_document_analysis, ls, service, uri, service.analyze_source(source))
+        except Exception as exception:  # noqa: BLE001
+            callback = partial(ls.show_message_log, f"cannot analyze {uri}: {exception!r}")
+        try:
+            ls.loop.call_soon_threadsafe(callback)
+        except RuntimeError:
+            # The event loop is closed once the server has exited
+            return
+
+
+def log_rediagnosis_failure(ls: CustomLanguageServer, future: "asyncio.Future[None]") -> None:
+    if not future.cancelled() and (exception := future.exception()):
+        ls.show_message_log(f"re-diagnosis failed: {exception!r}")
+
+
 @LSP_SERVER.feature(lsp.WORKSPACE_DID_CHANGE_CONFIGURATION)
 def workspace_did_change_configuration(ls: CustomLanguageServer, params: lsp.DidChangeConfigurationParams) -> None:
     LSP_SERVER.show_message_log("handling workspace configuration change")
-    ls.service = Service.try_from_settings(ls_name=ls.name, settings=params.settings) or ls.service
-    if not ls.service:
+    previous_service: Final = ls.service
+    service: Final = Service.try_from_settings(ls_name=ls.name, settings=params.settings)
+    # Settings restored from a snapshot are usually the same, then published diagnostics are already right
+    if not service or (previous_service and service.settings == previous_service.settings):
         return
-    for text_document in ls.workspace.text_documents.values():
-        ls.publish_diagnostics(text_document.uri, diagnostics=ls.service.make_diagnostics(text_document.source))
+    ls.service = service
+    # With hundreds of open documents analysis takes seconds, so it runs in the background and a newer
+    # configuration cancels the pass that is still running
+    ls.rediagnosis_cancel_event.set()
+    ls.rediagnosis_cancel_event = threading.Event()
+    text_documents: Final = prioritize_documents(
+        ls.workspace.text_documents.values(),
+        reversed(previous_service.document_cache.entries) if previous_service else (),
+    )
+    ls.loop.run_in_executor(
+        ls.rediagnosis_executor,
+        rediagnose,
+        ls,
+        service,
+        [(text_document.uri, text_document.source) for text_document in text_documents],
+        ls.rediagnosis_cancel_event,
+    ).add_done_callback(partial(log_rediagnosis_failure, ls))
 
 
 @LSP_SERVER.feature(lsp.TEXT_DOCUMENT_DID_OPEN)
@@ -226,14 +457,36 @@ def did_open_did_save_did_change(
     if ls.service.path_is_ignored(params.text_document.uri):
         return
     text_document: Final = ls.workspace.get_text_document(params.text_document.uri)
-    ls.publish_diagnostics(text_document.uri, diagnostics=ls.service.make_diagnostics(text_document.source))
+    ls.publish_diagnostics(
+        text_document.uri,
+        diagnostics=ls.service.analyze_document(text_document.uri, text_document.source).diagnostics,
+    )
 
 
 @LSP_SERVER.feature(lsp.TEXT_DOCUMENT_DID_CLOSE)
 def did_close(ls: CustomLanguageServer, params: lsp.DidCloseTextDocumentParams) -> None:
+    if ls.service:
+        ls.service.document_cache.pop(params.text_document.uri)
     ls.publish_diagnostics(params.text_document.uri, [])
 
 
+# A custom request rather than a command: the VS Code extension runs one server per workspace folder,
+# and commands with the same name can't be registered by several of them
+@LSP_SERVER.feature(CACHE_STATS_METHOD)
+def cache_stats(ls: CustomLanguageServer, _: Any) -> dict[str, float] | None:  # noqa: ANN401
+    if not ls.service:
+        return None
+    stats: Final = ls.service.document_cache.stats
+    return {
+        "documents": stats.entries_count,
+        "resident_bytes": stats.resident_bytes,
+        "hits": stats.hits_count,
+        "misses": stats.misses_count,
+        "evictions": stats.evictions_count,
+        "hit_rate": stats.hit_rate,
+    }
+
+
 @LSP_SERVER.feature(
     lsp.TEXT_DOCUMENT_CODE_ACTION,
     lsp.CodeActionOptions(
@@ -304,7 +557,7 @@ def resolve_code_action(ls: CustomLanguageServer, params: lsp.CodeAction) -> lsp
                     text_document=lsp.OptionalVersionedTextDocumentIdentifier(
                         uri=text_document.uri, version=text_document.version
                     ),
-                    edits=ls.service.make_fix_all_text_edits(text_document.source),
+                    edits=ls.service.analyze_document(text_document.uri, text_document.source).fix_all_text_edits,
                 )
             ],
         )
@@ -312,5 +565,8 @@ def resolve_code_action(ls: CustomLanguageServer, params: lsp.CodeAction) -> lsp
 
 
 def main() -> int:
+    from importlib.metadata import version  # noqa: PLC0415
+
+    LSP_SERVER.set_version(version("auto-typing-final"))
     LSP_SERVER.start_io()
     return 0
@@ -0,0 +1,353 @@
+import argparse
+import json
+import os
+import queue
+import shlex
+import shutil
+import statistics
+import subprocess  # noqa: S404
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Any, Final, get_args
+
+from auto_typing_final.transform import ImportStyle
+
+SERVER_EXECUTABLE_NAME: Final = "auto-typing-final-lsp-server"
+RESPONSE_TIMEOUT_SECONDS: Final = 60
+DEFAULT_KEYSTROKES_COUNT: Final = 200
+DEFAULT_CODE_ACTION_INTERVAL: Final = 50
+# Typed at the end of the file one character per change, like a person writing a new function
+TYPED_TEXT_TEMPLATE: Final = (
+    "\n\ndef typed_function_{index}(argument):\n    value = argument + {index}\n    return value\n"
+)
+
+
+class LspBenchError(Exception): ...
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class Message:
+    content: dict[str, Any]
+    size: int
+    received_at: float
+
+
+def _read_message(stream: IO[bytes]) -> tuple[dict[str, Any], int] | None:
+    content_length = None
+    while line := stream.readline():
+        if line in {b"\r\n", b"\n"}:
+            break
+        name, _, value = line.decode("ascii").partition(":")
+        if name.strip().lower() == "content-length":
+            content_length = int(value)
+    if content_length is None:
+        return None
+    body: Final = stream.read(content_length)
+    return json.loads(body), len(body)
+
+
+# A scripted stand-in for an editor: answers requests of the server, collects its responses and notifications
+@dataclass(slots=True, kw_only=True)
+class LspClient:
+    process: subprocess.Popen[bytes]
+    responses: dict[int, Message] = field(default_factory=dict)
+    responses_condition: threading.Condition = field(default_factory=threading.Condition)
+    diagnostics: queue.Queue[Message] = field(default_factory=queue.Queue)
+    sent_bytes_count: int = 0
+    received_bytes_count: int = 0
+    next_id: int = 1
+    write_lock: threading.Lock = field(default_factory=threading.Lock)
+
+    @staticmethod
+    def start(command: list[str], environment: dict[str, str]) -> "LspClient":
+        process: Final = subprocess.Popen(  # noqa: S603
+            command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=environment
+        )
+        client: Final = LspClient(process=process)
+        threading.Thread(target=client.read_messages, daemon=True).start()
+        return client
+
+    def _send(self, content: dict[str, Any]) -> None:
+        body: Final = json.dumps({"jsonrpc": "2.0", **content}).encode()
+        assert self.process.stdin  # noqa: S101
+        with self.write_lock:
+            self.process.stdin.write(f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            self.process.stdin.flush()
+            self.sent_bytes_count += len(body)
+
+    def read_messages(self) -> None:
+        assert self.process.stdout  # noqa: S101
+        while message_and_size := _read_message(self.process.stdout):
+            content, size = message_and_size
+            message = Message(content=content, size=size, received_at=time.perf_counter())
+            self.received_bytes_count += size
+            if "id" in content and "method" in content:
+                # Requests of the server, like client/registerCapability, are accepted without doing anything
+                self._send({"id": content["id"], "result": None})
+            elif "id" in content:
+                with self.responses_condition:
+                    self.responses[content["id"]] = message
+                    self.responses_condition.notify_all()
+            elif content.get("method") == "textDocument/publishDiagnostics":
+                self.diagnostics.put(message)
+
+    def notify(self, method: str, params: dict[str, Any] | None = None) -> None:
+        self._send({"method": method, "params": params})
+
+    def request(self, method: str, params: dict[str, Any] | None = None) -> Message:
+        request_id: Final = self.next_id
+        self.next_id += 1
+        self._send({"id": request_id, "method": method, "params": params})
+        with self.responses_condition:
+            if not self.responses_condition.wait_for(
+                lambda: request_id in self.responses, timeout=RESPONSE_TIMEOUT_SECONDS
+            ):
+                msg: Final = f"no response to {method} in {RESPONSE_TIMEOUT_SECONDS} seconds"
+                raise LspBenchError(msg)
+            return self.responses.pop(request_id)
+
+    def wait_for_diagnostics(self, uri: str) -> Message:
+        deadline: Final = time.perf_counter() + RESPONSE_TIMEOUT_SECONDS
+        while (timeout := deadline - time.perf_counter()) > 0:
+            try:
+                message = self.diagnostics.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if message.content["params"]["uri"] == uri:
+                return message
+        msg: Final = f"no diagnostics for {uri} in {RESPONSE_TIMEOUT_SECONDS} seconds"
+        raise LspBenchError(msg)
+
+    def stop(self) -> None:
+        try:
+            self.request("shutdown")
+            self.notify("exit")
+            self.process.wait(RESPONSE_TIMEOUT_SECONDS)
+        except (LspBenchError, OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+
+
+# Steps are plain JSON, so a session can be saved, edited by hand or recorded elsewhere and replayed:
+# {"type": "change", "range": <LSP range>, "text": "..."} or {"type": "code_action"}
+def make_typing_session(source: str, keystrokes_count: int, code_action_interval: int) -> list[dict[str, Any]]:
+    lines: Final = source.split("\n")
+    line, character = len(lines) - 1, len(lines[-1])
+    steps: Final[list[dict[str, Any]]] = []
+    typed_text = ""
+    for keystroke_index in range(keystrokes_count):
+        if not typed_text:
+            typed_text = TYPED_TEXT_TEMPLATE.format(index=keystroke_index)
+        typed_character, typed_text = typed_text[0], typed_text[1:]
+        position = {"line": line, "character": character}
+        steps.append({"type": "change", "range": {"start": position, "end": position}, "text": typed_character})
+        if typed_character == "\n":
+            line, character = line + 1, 0
+        else:
+            character += 1
+        if (keystroke_index + 1) % code_action_interval == 0:
+            steps.append({"type": "code_action"})
+    return steps
+
+
+def _read_memory_kilobytes(pid: int) -> dict[str, int]:
+    try:
+        status_lines: Final = Path(f"/proc/{pid}/status").read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return {}
+    return {
+        name: int(value.split()[0])
+        for name, _, value in (status_line.partition(":") for status_line in status_lines)
+        if name in {"VmRSS", "VmHWM"}
+    }
+
+
+@dataclass(slots=True, kw_only=True)
+class ReplayResult:
+    source_bytes_count: int
+    open_seconds: float = 0.0
+    keystroke_seconds: list[float] = field(default_factory=list)
+    code_action_seconds: list[float] = field(default_factory=list)
+    fix_all_resolve_seconds: list[float] = field(default_factory=list)
+    diagnostics_message_sizes: list[int] = field(default_factory=list)
+    sent_bytes_count: int = 0
+    received_bytes_count: int = 0
+    # None where /proc is not available
+    rss_after_open_kilobytes: int | None = None
+    peak_rss_kilobytes: int | None = None
+
+
+def _run_code_action(client: LspClient, result: ReplayResult, uri: str, diagnostics: list[Any]) -> None:
+    start: Final = time.perf_counter()
+    # The server offers fixes for the diagnostics it is given, so the range of the request doesn't matter
+    position: Final = {"line": 0, "character": 0}
+    response: Final = client.request(
+        "textDocument/codeAction",
+        {
+            "textDocument": {"uri": uri},
+            "range": {"start": position, "end": position},
+            "context": {"diagnostics": diagnostics},
+        },
+    )
+    result.code_action_seconds.append(response.received_at - start)
+    for action in response.content.get("result") or []:
+        if action.get("kind") == "source.fixAll":
+            resolve_start = time.perf_counter()
+            resolve_response = client.request("codeAction/resolve", action)
+            result.fix_all_resolve_seconds.append(resolve_response.received_at - resolve_start)
+
+
+def replay_session(
+    client: LspClient, path: Path, steps: list[dict[str, Any]], settings: dict[str, Any]
+) -> ReplayResult:
+    source: Final = path.read_text(encoding="utf-8")
+    uri: Final = path.resolve().as_uri()
+    result: Final = ReplayResult(source_bytes_count=len(source.encode()))
+
+    client.request(
+        "initialize", {"processId": os.getpid(), "rootUri": path.resolve().parent.as_uri(), "capabilities": {}}
+    )
+    client.notify("initialized", {})
+    client.notify("workspace/didChangeConfiguration", {"settings": settings})
+
+    start = time.perf_counter()
+    client.notify(
+        "textDocument/didOpen",
+        {"textDocument": {"uri": uri, "languageId": "python", "version": 1, "text": source}},
+    )
+    diagnostics_message = client.wait_for_diagnostics(uri)
+    result.open_seconds = diagnostics_message.received_at - start
+    result.rss_after_open_kilobytes = _read_memory_kilobytes(client.process.pid).get("VmRSS")
+
+    version = 1
+    for step in steps:
+        if step["type"] == "code_action":
+            _run_code_action(client, result, uri, diagnostics_message.content["params"]["diagnostics"])
+            continue
+        version += 1
+        start = time.perf_counter()
+        client.notify(
+            "textDocument/didChange",
+            {
+                "textDocument": {"uri": uri, "version": version},
+                "contentChanges": [{"range": step["range"], "text": step["text"]}],
+            },
+        )
+        diagnostics_message = client.wait_for_diagnostics(uri)
+        result.keystroke_seconds.append(diagnostics_message.received_at - start)
+        result.diagnostics_message_sizes.append(diagnostics_message.size)
+
+    result.peak_rss_kilobytes = _read_memory_kilobytes(client.process.pid).get("VmHWM")
+    result.sent_bytes_count = client.sent_bytes_count
+    result.received_bytes_count = client.received_bytes_count
+    return result
+
+
+def _format_latencies(name: str, seconds: list[float]) -> str:
+    if not seconds:
+        return f"{name:<26}{'-':>11}{'-':>11}{'-':>11}"
+    p95_seconds: Final = statistics.quantiles(seconds, n=20, method="inclusive")[-1] if len(seconds) > 1 else seconds[0]
+    return (
+        f"{name:<26}{statistics.median(seconds) * 1000:8.1f} ms"
+        f"{p95_seconds * 1000:8.1f} ms{max(seconds) * 1000:8.1f} ms"
+    )
+
+
+def _format_kilobytes(kilobytes: float | None) -> str:
+    return "n/a" if kilobytes is None else f"{kilobytes / 1024:.1f} MB"
+
+
+def format_replay_report(path: Path, result: ReplayResult) -> str:
+    lines: Final = [
+        f"file: {path}, size: {result.source_bytes_count / 1000:.1f} KB, keystrokes: {len(result.keystroke_seconds)}, "
+        f"code actions: {len(result.code_action_seconds)}, fix all resolves: {len(result.fix_all_resolve_seconds)}",
+        "",
+        f"{'':<26}{'median':>11}{'p95':>11}{'max':>11}",
+        _format_latencies("open → diagnostics", [result.open_seconds]),
+        _format_latencies("keystroke → diagnostics", result.keystroke_seconds),
+        _format_latencies("code action", result.code_action_seconds),
+        _format_latencies("fix all resolve", result.fix_all_resolve_seconds),
+        "",
+    ]
+    if result.diagnostics_message_sizes:
+        lines.append(
+            f"publishDiagnostics size: median {statistics.median(result.diagnostics_message_sizes) / 1000:.1f} KB, "
+            f"max {max(result.diagnostics_message_sizes) / 1000:.1f} KB"
+        )
+    lines.extend(
+        (
+            f"sent: {result.sent_bytes_count / 1_000_000:.2f} MB, "
+            f"received: {result.received_bytes_count / 1_000_000:.2f} MB",
+            f"server RSS after open: {_format_kilobytes(result.rss_after_open_kilobytes)}, "
+            f"peak: {_format_kilobytes(result.peak_rss_kilobytes)}",
+        )
+    )
+    return "\n".join(lines) + "\n"
+
+
+def _find_server_command() -> list[str] | None:
+    # Like the VS Code extension, prefer the server installed next to the current interpreter
+    executable: Final = shutil.which(SERVER_EXECUTABLE_NAME, path=str(Path(sys.executable).parent)) or shutil.which(
+        SERVER_EXECUTABLE_NAME
+    )
+    return [executable] if executable else None
+
+
+def lsp_bench_main(argv: list[str]) -> int:
+    parser: Final = argparse.ArgumentParser(
+        prog="auto-typing-final bench-lsp",
+        description="Replay a typing session against the language server over stdio and measure what an editor sees",
+    )
+    parser.add_argument("file", type=Path)
+    parser.add_argument("--keystrokes", type=int, default=DEFAULT_KEYSTROKES_COUNT)
+    parser.add_argument(
+        "--code-action-interval",
+        type=int,
+        default=DEFAULT_CODE_ACTION_INTERVAL,
+        metavar="N",
+        help="Request code actions and resolve Fix All after every N keystrokes",
+    )
+    parser.add_argument("--session", type=Path, help="Replay steps from a JSON file instead of generating them")
+    parser.add_argument("--save-session", type=Path, help="Write the replayed steps to a JSON file")
+    parser.add_argument(
+        "--server-command", type=shlex.split, help=f"Command to start the server instead of {SERVER_EXECUTABLE_NAME}"
+    )
+    parser.add_argument("--import-style", type=str, choices=get_args(ImportStyle), default="typing-final")
+    parser.add_argument("--ignore-global-vars", action="store_true")
+
+    args: Final = parser.parse_args(argv)
+    if args.keystrokes < 0 or args.code_action_interval < 1:
+        parser.error("--keystrokes must not be negative and --code-action-interval must be positive")
+    server_command: Final = args.server_command or _find_server_command()
+    if not server_command:
+        parser.error(f"cannot find {SERVER_EXECUTABLE_NAME}, pass --server-command")
+    try:
+        steps: Final = (
+            json.loads(args.session.read_text(encoding="utf-8"))
+            if args.session
+            else make_typing_session(args.file.read_text(encoding="utf-8"), args.keystrokes, args.code_action_interval)
+        )
+    except (OSError, ValueError) as exception:
+        parser.error(str(exception))
+    if args.save_session:
+        args.save_session.write_text(json.dumps(steps, indent=2) + "\n", encoding="utf-8")
+
+    settings: Final = {
+        "auto-typing-final": {"import-style": args.import_style, "ignore-global-vars": args.ignore_global_vars}
+    }
+    # A separate cache directory keeps the snapshot of this run from affecting the editor and later runs
+    with tempfile.TemporaryDirectory() as cache_directory:
+        client: Final = LspClient.start(server_command, {**os.environ, "XDG_CACHE_HOME": cache_directory})
+        try:
+            result: Final = replay_session(client, args.file, steps, settings)
+        except LspBenchError as exception:
+            sys.stderr.write(f"{exception}\n")
+            return 1
+        finally:
+            client.stop()
+    sys.stdout.write(format_replay_report(args.file, result))
+    return 0
@@ -1,96 +1,574 @@
 import argparse
 import sys
-from collections.abc import Iterable
-from difflib import unified_diff
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import partial
 from pathlib import Path
-from typing import Final, cast, get_args
+from typing import TYPE_CHECKING, Final, Protocol, get_args
 
-from ast_grep_py import SgRoot
+from auto_typing_final.config import ConfigError, FileLimits, FileLimitsFinder
+from auto_typing_final.files import (
+    SourceDecodeError,
+    SourceFile,
+    decode_source,
+    read_source_file,
+    write_source_file,
+)
+from auto_typing_final.transform import IMPORT_STYLES_TO_IMPORT_CONFIGS, ImportConfig, ImportStyle
+from auto_typing_final.transformer import Transformer, TransformResult
 
-from auto_typing_final.transform import IMPORT_STYLES_TO_IMPORT_CONFIGS, ImportConfig, ImportStyle, make_replacements
+# Modules that only some runs need are imported where they are used to keep startup fast, see tests/test_startup.py
+if TYPE_CHECKING:
+    from auto_typing_final.daemon import DaemonClient
+    from auto_typing_final.discovery import Shard
+    from auto_typing_final.git import GitBlobCache
+    from auto_typing_final.pipeline import Pipeline
 
 
 def transform_file_content(source: str, import_config: ImportConfig, ignore_global_vars: bool) -> str:
-    root: Final = SgRoot(source, "python").root()
-    result: Final = make_replacements(root, import_config, ignore_global_vars)
-    new_text: Final = root.commit_edits(
-        [edit.node.replace(edit.new_text) for replacement in result.replacements for edit in replacement.edits]
-    )
-    return root.commit_edits([root.replace(f"{result.import_text}\n{new_text}")]) if result.import_text else new_text
-
+    return Transformer(import_config=import_config, ignore_global_vars=ignore_global_vars).transform(source).new_source
 
-def take_python_source_files(paths: Iterable[Path]) -> Iterable[Path]:
-    for path in paths:
-        if path.suffix in {".py", ".pyi"}:
-            yield path
 
+def _parse_comma_separated(value: str) -> list[str]:
+    return [one_value.strip() for one_value in value.split(",") if one_value.strip()]
 
-def find_source_files_from_one_path(path: Path) -> Iterable[Path]:
-    if path.is_dir():
-        for inner_path in path.iterdir():
-            if inner_path.name.startswith("."):
-                continue
-            yield from take_python_source_files(find_source_files_from_one_path(inner_path))
 
-    else:
-        yield path
+def _parse_shard(value: str) -> "Shard":
+    from auto_typing_final.discovery import Shard  # noqa: PLC0415
 
+    try:
+        return Shard.parse(value)
+    except ValueError as exception:
+        raise argparse.ArgumentTypeError(str(exception)) from exception
 
-def find_all_source_files(paths: list[Path]) -> Iterable[Path]:
-    for path in paths:
-        yield from find_source_files_from_one_path(path)
 
-
-def main() -> int:
+def _make_parser() -> argparse.ArgumentParser:
     parser: Final = argparse.ArgumentParser()
-    parser.add_argument("files", type=Path, nargs="*", default=[Path()])
+    parser.add_argument("files", type=Path, nargs="*", help="Files and directories to process, `-` to read stdin")
     parser.add_argument("--check", action="store_true")
     parser.add_argument("--import-style", type=str, choices=get_args(ImportStyle), default="typing-final")
     parser.add_argument(
         "--ignore-global-vars", action="store_true", help="Ignore global variables when applying Final annotations"
     )
+    parser.add_argument(
+        "--exclude",
+        type=_parse_comma_separated,
+        help="Comma-separated glob patterns of files and directories to skip, replaces the default list",
+    )
+    parser.add_argument(
+        "--extend-exclude",
+        type=_parse_comma_separated,
+        default=[],
+        help="Comma-separated glob patterns to skip in addition to --exclude",
+    )
+    parser.add_argument("--no-respect-gitignore", action="store_true", help="Do not skip files ignored by .gitignore")
+    parser.add_argument(
+        "--changed-since",
+        metavar="REF",
+        help="Only process files changed relative to git REF, including uncommitted and untracked files",
+    )
+    parser.add_argument("--staged", action="store_true", help="Only process files with changes staged in git")
+    parser.add_argument(
+        "--git-cache",
+        action="store_true",
+        help="Remember git blobs that need no changes and skip them in later runs without reading them",
+    )
+    parser.add_argument(
+        "--shard",
+        type=_parse_shard,
+        metavar="INDEX/COUNT",
+        help="Only process the INDEX-th of COUNT deterministic parts of discovered files, e.g. 1/4",
+    )
+    parser.add_argument(
+        "--shard-by-size", action="store_true", help="Balance --shard parts by file size instead of by path hash"
+    )
+    parser.add_argument(
+        "--report-file",
+        type=Path,
+        help="Write a JSON summary of the run that can be merged with reports of other shards",
+    )
+    parser.add_argument(
+        "--files-from",
+        metavar="FILE",
+        help="Read additional paths from FILE (`-` for stdin), separated by newlines or NUL characters",
+    )
+    parser.add_argument(
+        "--stdin-filename",
+        metavar="NAME",
+        help="Read source from stdin and write the result to stdout, using NAME in diffs and for excludes",
+    )
+    parser.add_argument(
+        "--daemon",
+        nargs="?",
+        const="",
+        metavar="SOCKET",
+        help="Send sources to a daemon started with `auto-typing-final daemon start`, falling back to in-process",
+    )
+    parser.add_argument(
+        "--exit-code-only",
+        action="store_true",
+        help="With --check, print nothing and stop at the first file that would change, only the exit code matters",
+    )
+    parser.add_argument(
+        "--fail-fast", action="store_true", help="With --check, stop at the first file that would change"
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=("diff", "ndjson", "sarif"),
+        default="diff",
+        help="With --check, print diffs, one JSON record per edit, or a SARIF log, records are printed as files finish",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Analyze files in N worker processes, files are always read ahead and written in background threads",
+    )
+    parser.add_argument(
+        "--max-file-size",
+        type=int,
+        metavar="BYTES",
+        help="Skip larger files without reading them, set per directory in pyproject.toml when not passed",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        metavar="SECONDS",
+        help="Abandon analysis of a file that takes longer, set per directory in pyproject.toml when not passed",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After the initial pass, keep watching files and process the ones whose content changes",
+    )
+    return parser
 
-    args: Final = parser.parse_args()
-    import_config: Final = IMPORT_STYLES_TO_IMPORT_CONFIGS[args.import_style]
-    open_mode: Final = "r" if args.check else "r+"
-    changed_files_count = 0
-
-    for path in find_all_source_files(args.files):
-        with path.open(open_mode) as file:
-            source = file.read()
-            transformed_content = transform_file_content(
-                source=source, import_config=import_config, ignore_global_vars=args.ignore_global_vars
-            )
-            if source == transformed_content:
-                continue
-            changed_files_count += 1
-
-            if args.check:
-                sys.stdout.writelines(
-                    unified_diff(
-                        source.splitlines(keepends=True),
-                        transformed_content.splitlines(keepends=True),
-                        fromfile=str(path),
-                        tofile=str(path),
-                    )
-                )
-                sys.stdout.write("\n")
-            else:
-                file.seek(0)
-                file.write(transformed_content)
-                file.truncate()
-
-    match changed_files_count, cast(bool, args.check):
+
+def _read_paths_from(value: str) -> list[Path]:
+    content: Final = sys.stdin.read() if value == "-" else Path(value).read_text(encoding="utf-8")
+    return [Path(name) for name in (content.split("\0") if "\0" in content else content.splitlines()) if name]
+
+
+def _write_diff(result: TransformResult, name: str) -> None:
+    from auto_typing_final.diff import make_unified_diff  # noqa: PLC0415
+
+    sys.stdout.write(make_unified_diff(result.source, result.new_source, result.analysis, name))
+    sys.stdout.write("\n")
+
+
+# Yields a function that prints the result of one file that needs changes
+@contextmanager
+def _open_check_output(output_format: str) -> Iterator[Callable[[TransformResult, str], None]]:
+    match output_format:
+        case "ndjson":
+            from auto_typing_final.output import write_ndjson_records  # noqa: PLC0415
+
+            yield partial(write_ndjson_records, sys.stdout)
+        case "sarif":
+            from auto_typing_final.output import SarifWriter  # noqa: PLC0415
+
+            sarif_writer: Final = SarifWriter(stream=sys.stdout)
+            sarif_writer.start()
+            yield sarif_writer.write
+            sarif_writer.finish()
+        case _:
+            yield _write_diff
+
+
+class SourceTransformer(Protocol):
+    def transform(self, source: str) -> TransformResult: ...
+
+    def has_changes(self, source: str) -> bool: ...
+
+
+# Discovery and git are imported only once paths are processed, reading a single source from stdin needs neither
+def _get_exclude(args: argparse.Namespace) -> list[str]:
+    from auto_typing_final.discovery import DEFAULT_EXCLUDES  # noqa: PLC0415
+
+    return [*(DEFAULT_EXCLUDES if args.exclude is None else args.exclude), *args.extend_exclude]
+
+
+# Only the part of the path inside the project is matched, as the walker does, so that excludes and hidden
+# directories above it don't apply. A path outside of the project is matched by its name.
+def _is_stdin_filename_excluded(args: argparse.Namespace) -> bool:
+    from auto_typing_final.discovery import SourceFileWalker, get_project_relative_path  # noqa: PLC0415
+
+    relative_path: Final = get_project_relative_path(Path(args.stdin_filename))
+    return SourceFileWalker(exclude=_get_exclude(args)).is_excluded_path(
+        Path(relative_path.name) if relative_path.is_absolute() else relative_path
+    )
+
+
+def _transform_stdin(args: argparse.Namespace, transformer: SourceTransformer) -> int:
+    data: Final = sys.stdin.buffer.read()
+    name: Final = args.stdin_filename or "-"
+    try:
+        source_file: Final = decode_source(data)
+    except SourceDecodeError as exception:
+        # Like a skipped file, the input is left as it is
+        sys.stderr.write(f"{name}: skipped, cannot decode: {exception}\n")
+        if not args.check and not args.exit_code_only:
+            sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+        return 0
+    source: Final = source_file.text
+    is_excluded: Final = args.stdin_filename is not None and _is_stdin_filename_excluded(args)
+    if args.exit_code_only:
+        return int(not is_excluded and transformer.has_changes(source))
+    result: Final = None if is_excluded else transformer.transform(source)
+
+    if args.check:
+        has_changes: Final = result is not None and result.has_changes
+        with _open_check_output(args.output_format) as write_check_result:
+            if result and has_changes:
+                write_check_result(result, name)
+        return int(has_changes)
+    sys.stdout.buffer.write((result.new_source if result else source).encode(source_file.encoding))
+    sys.stdout.buffer.flush()
+    return 0
+
+
+def _find_source_files(args: argparse.Namespace) -> Iterable[Path]:
+    from auto_typing_final.discovery import find_all_source_files, take_shard  # noqa: PLC0415
+    from auto_typing_final.git import list_changed_files, select_changed_source_files  # noqa: PLC0415
+
+    exclude: Final = _get_exclude(args)
+    if args.changed_since is not None or args.staged:
+        changed_source_files: Final = select_changed_source_files(
+            list_changed_files(since=args.changed_since, staged=args.staged), paths=args.files, exclude=exclude
+        )
+        return (
+            take_shard(changed_source_files, args.shard, balance_by_size=args.shard_by_size)
+            if args.shard
+            else changed_source_files
+        )
+    source_files: Final = find_all_source_files(
+        args.files, exclude=exclude, respect_gitignore=not args.no_respect_gitignore
+    )
+    return take_shard(source_files, args.shard, balance_by_size=args.shard_by_size) if args.shard else source_files
+
+
+def _make_result_message(changed_files_count: int, check: bool) -> str:
+    match changed_files_count, check:
         case 0, _:
-            result_message = "No errors found!"
+            return "No errors found!"
         case 1, True:
-            result_message = "Found errors in 1 file."
+            return "Found errors in 1 file."
         case 1, False:
-            result_message = "Fixed errors in 1 file."
+            return "Fixed errors in 1 file."
         case _, True:
-            result_message = f"Found errors in {changed_files_count} files."
-        case _, False:
-            result_message = f"Fixed errors in {changed_files_count} files."
+            return f"Found errors in {changed_files_count} files."
+    return f"Fixed errors in {changed_files_count} files."
+
+
+def _write_result_message(args: argparse.Namespace, changed_files_count: int) -> None:
+    # Machine-readable output takes stdout, so that it can be piped as is
+    stream: Final = sys.stdout if args.output_format == "diff" else sys.stderr
+    stream.write(f"{_make_result_message(changed_files_count, args.check)}\n")
+    stream.flush()
+
+
+@dataclass(slots=True, kw_only=True)
+class RunSummary:
+    checked_files_count: int = 0
+    changed_files: list[Path] = field(default_factory=list)
+    # Too large or timed out files, they don't fail the run
+    skipped_files: list[Path] = field(default_factory=list)
+
+
+def _write_report_file(path: Path, args: argparse.Namespace, summary: RunSummary) -> None:
+    import json  # noqa: PLC0415
+
+    path.write_text(
+        json.dumps(
+            {
+                "shard": str(args.shard) if args.shard else None,
+                "check": args.check,
+                "checked_files_count": summary.checked_files_count,
+                "changed_files": [str(one_path) for one_path in summary.changed_files],
+                "skipped_files": [str(one_path) for one_path in summary.skipped_files],
+            },
+            indent=2,
+        )
+        + "\n",
+        encoding="utf-8",
+    )
+
+
+# Returns why the file is skipped if it can't be read
+def _read_source_file_within_limits(path_and_limits: tuple[Path, FileLimits]) -> SourceFile | str:
+    path, limits = path_and_limits
+    if limits.max_file_size is not None and path.stat().st_size > limits.max_file_size:
+        return f"larger than {limits.max_file_size} bytes"
+    try:
+        return read_source_file(path)
+    except SourceDecodeError as exception:
+        return f"cannot decode: {exception}"
+
+
+def _report_skipped_file(summary: RunSummary, path: Path, reason: str) -> None:
+    summary.skipped_files.append(path)
+    sys.stderr.write(f"{path}: skipped, {reason}\n")
+
+
+def _select_unknown_files(
+    summary: RunSummary, source_files: Iterable[Path], git_cache: "GitBlobCache | None", limits_finder: FileLimitsFinder
+) -> Iterator[tuple[tuple[Path, FileLimits], tuple[Path, FileLimits]]]:
+    for path in source_files:
+        summary.checked_files_count += 1
+        if not git_cache or not git_cache.is_known_clean(path):
+            path_and_limits = (path, limits_finder.find(path))
+            yield path_and_limits, path_and_limits
+
+
+def _select_read_files(
+    summary: RunSummary, read_files: Iterable[tuple[tuple[Path, FileLimits], SourceFile | str]]
+) -> Iterator[tuple[tuple[Path, FileLimits, SourceFile], tuple[str, float | None]]]:
+    for (path, limits), source_file in read_files:
+        if isinstance(source_file, SourceFile):
+            yield (path, limits, source_file), (source_file.text, limits.timeout)
+        else:
+            _report_skipped_file(summary, path, source_file)
+
+
+def _process_source_files(  # noqa: PLR0913
+    args: argparse.Namespace,
+    transformer: SourceTransformer,
+    source_files: Iterable[Path],
+    *,
+    git_cache: "GitBlobCache | None",
+    pipeline: "Pipeline",
+    limits_finder: FileLimitsFinder,
+    write_check_result: Callable[[TransformResult, str], None],
+) -> RunSummary:
+    summary: Final = RunSummary()
+    read_files: Final = pipeline.read(
+        _read_source_file_within_limits, _select_unknown_files(summary, source_files, git_cache, limits_finder)
+    )
+    analyze: Final[Callable[[str], TransformResult | bool]] = (
+        transformer.has_changes if args.exit_code_only else transformer.transform
+    )
+    for (path, limits, source_file), result in pipeline.analyze(analyze, _select_read_files(summary, read_files)):
+        if result is None:
+            _report_skipped_file(summary, path, f"analysis took longer than {limits.timeout} seconds")
+            continue
+        if not (result if isinstance(result, bool) else result.has_changes):
+            if git_cache:
+                git_cache.mark_clean(path)
+            continue
+        summary.changed_files.append(path)
+
+        if isinstance(result, bool):
+            break
+        if args.check:
+            pipeline.write(partial(write_check_result, result, str(path)))
+            if args.fail_fast:
+                break
+        else:
+            pipeline.write(partial(write_source_file, path, result.new_source, encoding=source_file.encoding))
+
+    pipeline.flush()
+    return summary
+
+
+def _connect_daemon(socket_path: str) -> "DaemonClient | None":
+    from auto_typing_final.daemon import DaemonClient, get_default_socket_path  # noqa: PLC0415
+
+    return DaemonClient.connect(Path(socket_path) if socket_path else get_default_socket_path())
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class DaemonTransformer:
+    client: "DaemonClient"
+    import_style: ImportStyle
+    ignore_global_vars: bool
+
+    def transform(self, source: str) -> TransformResult:
+        return self.client.transform(source, import_style=self.import_style, ignore_global_vars=self.ignore_global_vars)
 
-    sys.stdout.write(f"{result_message}\n")
-    return changed_files_count > 0 if args.check else 0
+    def has_changes(self, source: str) -> bool:
+        return self.transform(source).has_changes
+
+
+def _make_transformer(args: argparse.Namespace, daemon_client: "DaemonClient | None") -> SourceTransformer:
+    if daemon_client:
+        return DaemonTransformer(
+            client=daemon_client, import_style=args.import_style, ignore_global_vars=args.ignore_global_vars
+        )
+    return Transformer(
+        import_config=IMPORT_STYLES_TO_IMPORT_CONFIGS[args.import_style], ignore_global_vars=args.ignore_global_vars
+    )
+
+
+def _watch(  # noqa: PLR0913
+    args: argparse.Namespace,
+    transformer: SourceTransformer,
+    *,
+    pipeline: "Pipeline",
+    limits_finder: FileLimitsFinder,
+    written_files: list[Path],
+    write_check_result: Callable[[TransformResult, str], None],
+) -> int:
+    from auto_typing_final.discovery import SourceFileWalker  # noqa: PLC0415
+    from auto_typing_final.watch import (  # noqa: PLC0415
+        ContentHashes,
+        InotifyWatcher,
+        PollingWatcher,
+        make_source_file_filter,
+        watch,
+    )
+
+    walker: Final = SourceFileWalker(exclude=_get_exclude(args), respect_gitignore=not args.no_respect_gitignore)
+    # Remembering hashes of our own writes keeps them from triggering another pass
+    content_hashes: Final = ContentHashes()
+    content_hashes.remember(written_files)
+    watcher: Final = InotifyWatcher.try_create(args.files, walker) or PollingWatcher(lambda: _find_source_files(args))
+
+    # The pipeline with its worker processes, the limits finder and the content hashes stay warm between events.
+    # Parse trees are not kept: ast-grep can't reparse incrementally, and a changed file needs a new tree anyway.
+    def process(paths: list[Path]) -> list[Path]:
+        summary: Final = _process_source_files(
+            args,
+            transformer,
+            paths,
+            git_cache=None,
+            pipeline=pipeline,
+            limits_finder=limits_finder,
+            write_check_result=write_check_result,
+        )
+        _write_result_message(args, len(summary.changed_files))
+        return [] if args.check else summary.changed_files
+
+    try:
+        watch(
+            watcher,
+            find_source_files=lambda: _find_source_files(args),
+            is_source_file=make_source_file_filter(args.files, walker),
+            process=process,
+            content_hashes=content_hashes,
+        )
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        watcher.close()
+    return 0
+
+
+def _run(parser: argparse.ArgumentParser, args: argparse.Namespace, transformer: SourceTransformer) -> int:
+    file_names: Final = [str(path) for path in args.files]
+    if args.stdin_filename is not None or "-" in file_names:
+        if args.files_from or any(name != "-" for name in file_names):
+            parser.error("`-` and --stdin-filename read one source from stdin, other paths can't be passed with them")
+        return _transform_stdin(args, transformer)
+    if args.files_from:
+        try:
+            args.files.extend(_read_paths_from(args.files_from))
+        except OSError as exception:
+            parser.error(f"cannot read --files-from: {exception}")
+    elif not args.files:
+        args.files.append(Path())
+
+    from auto_typing_final.git import GitBlobCache, GitError  # noqa: PLC0415
+
+    try:
+        source_files: Final = _find_source_files(args)
+        git_cache: Final = (
+            GitBlobCache.load(config_key=f"{args.import_style}:{args.ignore_global_vars}") if args.git_cache else None
+        )
+    except GitError as exception:
+        parser.error(str(exception))
+    return _run_pipeline(parser, args, transformer, source_files, git_cache)
+
+
+def _run_pipeline(
+    parser: argparse.ArgumentParser,
+    args: argparse.Namespace,
+    transformer: SourceTransformer,
+    source_files: Iterable[Path],
+    git_cache: "GitBlobCache | None",
+) -> int:
+    from auto_typing_final.pipeline import Pipeline  # noqa: PLC0415
+
+    limits_finder: Final = FileLimitsFinder(
+        command_line_limits=FileLimits(max_file_size=args.max_file_size, timeout=args.timeout)
+    )
+    # A daemon client talks over one connection, so only in-process analysis is moved to worker processes
+    is_in_process: Final = isinstance(transformer, Transformer)
+    with (
+        Pipeline.start(jobs=args.jobs if is_in_process else 1, uses_workers=is_in_process) as pipeline,
+        _open_check_output(args.output_format) as write_check_result,
+    ):
+        try:
+            summary: Final = _process_source_files(
+                args,
+                transformer,
+                source_files,
+                git_cache=git_cache,
+                pipeline=pipeline,
+                limits_finder=limits_finder,
+                write_check_result=write_check_result,
+            )
+        except ConfigError as exception:
+            parser.error(str(exception))
+
+        if git_cache:
+            git_cache.save()
+        if args.report_file:
+            _write_report_file(args.report_file, args, summary)
+
+        if not args.exit_code_only:
+            _write_result_message(args, len(summary.changed_files))
+        if args.watch:
+            return _watch(
+                args,
+                transformer,
+                pipeline=pipeline,
+                limits_finder=limits_finder,
+                written_files=[] if args.check else summary.changed_files,
+                write_check_result=write_check_result,
+            )
+    return len(summary.changed_files) > 0 if args.check else 0
+
+
+def _validate_args(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    if (args.exit_code_only or args.fail_fast) and not args.check:
+        parser.error("--exit-code-only and --fail-fast require --check")
+    if args.output_format != "diff" and (not args.check or args.exit_code_only):
+        parser.error("--output-format requires --check and can't be used with --exit-code-only")
+    if args.output_format == "sarif" and args.watch:
+        parser.error("--output-format sarif can't be used with --watch, a SARIF log is written once per run")
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if (args.max_file_size is not None and args.max_file_size < 1) or (args.timeout is not None and args.timeout <= 0):
+        parser.error("--max-file-size and --timeout must be positive")
+    # Timeouts kill worker processes, while the daemon analyzes files in its own process
+    if args.daemon is not None and args.timeout is not None:
+        parser.error("--timeout can't be used with --daemon")
+
+
+def main() -> int:
+    match sys.argv[1:2]:
+        case ["bench"]:
+            from auto_typing_final.bench import bench_main  # noqa: PLC0415
+
+            return bench_main(sys.argv[2:])
+        case ["bench-lsp"]:
+            from auto_typing_final.lsp_bench import lsp_bench_main  # noqa: PLC0415
+
+            return lsp_bench_main(sys.argv[2:])
+        case ["daemon"]:
+            from auto_typing_final.daemon import daemon_main  # noqa: PLC0415
+
+            return daemon_main(sys.argv[2:])
+
+    parser: Final = _make_parser()
+    args: Final = parser.parse_args()
+    _validate_args(parser, args)
+    daemon_client: Final = _connect_daemon(args.daemon) if args.daemon is not None else None
+    try:
+        return _run(parser, args, _make_transformer(args, daemon_client))
+    finally:
+        if daemon_client:
+            daemon_client.close()
@@ -0,0 +1,165 @@
+import json
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Final, Literal, TextIO
+from urllib.parse import quote
+
+from auto_typing_final.transform import find_import_index
+from auto_typing_final.transformer import TransformResult, detect_newline
+
+OutputFormat = Literal["diff", "ndjson", "sarif"]
+EditKind = Literal["add-final", "remove-final", "add-import"]
+
+SARIF_VERSION: Final = "2.1.0"
+SARIF_SCHEMA_URL: Final = "https://json.schemastore.org/sarif-2.1.0.json"
+TOOL_NAME: Final = "auto-typing-final"
+TOOL_URL: Final = "https://github.com/community-of-python/auto-typing-final"
+KINDS_TO_MESSAGES: Final[dict[EditKind, str]] = {
+    "add-final": "Missing Final annotation",
+    "remove-final": "Unexpected Final annotation",
+    "add-import": "Missing import of Final",
+}
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class EditRecord:
+    path: str
+    kind: EditKind
+    # 1-based, columns are counted in characters and the end is exclusive, an insertion has an empty range
+    start_line: int
+    start_column: int
+    end_line: int
+    end_column: int
+    new_text: str
+
+
+# Edits are sorted and don't overlap, so lines are counted once from the previous offset instead of from the start
+def _iter_positions(data: bytes, offsets: Iterator[int]) -> Iterator[tuple[int, int]]:
+    line = 1
+    line_start = previous_offset = 0
+    for offset in offsets:
+        if (newlines_count := data.count(b"\n", previous_offset, offset)) > 0:
+            line += newlines_count
+            line_start = data.rfind(b"\n", previous_offset, offset) + 1
+        previous_offset = offset
+        yield line, len(data[line_start:offset].decode("utf-8")) + 1
+
+
+def iter_edit_records(result: TransformResult, path: str) -> Iterator[EditRecord]:
+    if result.analysis.import_text:
+        import_line: Final = result.source.count("\n", 0, find_import_index(result.source)) + 1
+        yield EditRecord(
+            path=path,
+            kind="add-import",
+            start_line=import_line,
+            start_column=1,
+            end_line=import_line,
+            end_column=1,
+            new_text=f"{result.analysis.import_text}{detect_newline(result.source)}",
+        )
+    edits: Final = result.analysis.edits
+    positions: Final = _iter_positions(
+        result.source.encode("utf-8"), (offset for edit in edits for offset in (edit.start, edit.end))
+    )
+    for edit in edits:
+        start_line, start_column = next(positions)
+        end_line, end_column = next(positions)
+        yield EditRecord(
+            path=path,
+            kind=edit.operation,
+            start_line=start_line,
+            start_column=start_column,
+            end_line=end_line,
+            end_column=end_column,
+            new_text=edit.new_text,
+        )
+
+
+def _make_ndjson_line(record: EditRecord) -> str:
+    return json.dumps(
+        {
+            "path": record.path,
+            "kind": record.kind,
+            "start": {"line": record.start_line, "column": record.start_column},
+            "end": {"line": record.end_line, "column": record.end_column},
+            "new_text": record.new_text,
+        },
+        ensure_ascii=False,
+    )
+
+
+def write_ndjson_records(stream: TextIO, result: TransformResult, path: str) -> None:
+    stream.writelines(f"{_make_ndjson_line(record)}\n" for record in iter_edit_records(result, path))
+    stream.flush()
+
+
+# SARIF locations are URI references: paths under the current directory are made relative, so that code scanning
+# services can match them with the repository, and others become file URIs
+def _make_artifact_uri(path: str) -> str:
+    path_: Final = Path(path)
+    if not path_.is_absolute():
+        return quote(path_.as_posix())
+    current_directory: Final = Path.cwd()
+    if path_.is_relative_to(current_directory):
+        return quote(path_.relative_to(current_directory).as_posix())
+    return path_.as_uri()
+
+
+def _make_sarif_result(record: EditRecord) -> dict[str, object]:
+    artifact_location: Final = {"uri": _make_artifact_uri(record.path)}
+    region: Final = {
+        "startLine": record.start_line,
+        "startColumn": record.start_column,
+        "endLine": record.end_line,
+        "endColumn": record.end_column,
+    }
+    return {
+        "ruleId": record.kind,
+        "level": "error",
+        "message": {"text": KINDS_TO_MESSAGES[record.kind]},
+        "locations": [{"physicalLocation": {"artifactLocation": artifact_location, "region": region}}],
+        "fixes": [
+            {
+                "description": {"text": KINDS_TO_MESSAGES[record.kind]},
+                "artifactChanges": [
+                    {
+                        "artifactLocation": artifact_location,
+                        "replacements": [{"deletedRegion": region, "insertedContent": {"text": record.new_text}}],
+                    }
+                ],
+            }
+        ],
+    }
+
+
+def _make_sarif_run_header() -> str:
+    driver: Final = {
+        "name": TOOL_NAME,
+        "informationUri": TOOL_URL,
+        "rules": [{"id": kind, "shortDescription": {"text": message}} for kind, message in KINDS_TO_MESSAGES.items()],
+    }
+    return json.dumps({"tool": {"driver": driver}, "columnKind": "unicodeCodePoints"})[:-1]
+
+
+# SARIF is a single JSON document, so it is written by hand around results, which are streamed as files finish
+@dataclass(slots=True, kw_only=True)
+class SarifWriter:
+    stream: TextIO
+    has_results: bool = False
+
+    def start(self) -> None:
+        self.stream.write(
+            f'{{"version": "{SARIF_VERSION}", "$schema": "{SARIF_SCHEMA_URL}", '
+            f'"runs": [{_make_sarif_run_header()}, "results": ['
+        )
+
+    def write(self, result: TransformResult, path: str) -> None:
+        for record in iter_edit_records(result, path):
+            self.stream.write(f"{',' if self.has_results else ''}\n{json.dumps(_make_sarif_result(record))}")
+            self.has_results = True
+        self.stream.flush()
+
+    def finish(self) -> None:
+        self.stream.write("\n]}]}\n")
+        self.stream.flush()
@@ -0,0 +1,185 @@
+import multiprocessing
+import threading
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Final, TypeVar
+
+if TYPE_CHECKING:
+    from multiprocessing.connection import Connection
+    from multiprocessing.process import BaseProcess
+
+KeyT = TypeVar("KeyT")
+ArgumentT = TypeVar("ArgumentT")
+ResultT = TypeVar("ResultT")
+
+READER_THREADS_COUNT: Final = 4
+# Items that may be read, analyzed or waiting to be written at once, keeps memory bounded regardless of tree size
+MAX_PENDING_COUNT: Final = 32
+WORKER_STOP_TIMEOUT_SECONDS: Final = 5
+
+
+def map_bounded(
+    function: Callable[[ArgumentT], ResultT],
+    items: Iterable[tuple[KeyT, ArgumentT]],
+    *,
+    executor: Executor | None,
+    max_pending: int = MAX_PENDING_COUNT,
+) -> Iterator[tuple[KeyT, ResultT]]:
+    if not executor:
+        yield from ((key, function(argument)) for key, argument in items)
+        return
+    # Results come out in the order of items, a slow item holds back the ones after it but never blocks their work
+    pending: Final[deque[tuple[KeyT, Future[ResultT]]]] = deque()
+    try:
+        for key, argument in items:
+            pending.append((key, executor.submit(function, argument)))
+            if len(pending) >= max_pending:
+                ready_key, future = pending.popleft()
+                yield ready_key, future.result()
+        while pending:
+            ready_key, future = pending.popleft()
+            yield ready_key, future.result()
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+def _serve(connection: "Connection") -> None:
+    while True:
+        try:
+            function, argument = connection.recv()
+        except EOFError:
+            return
+        try:
+            result = function(argument)
+        except Exception as exception:  # noqa: BLE001
+            connection.send((False, exception))
+        else:
+            connection.send((True, result))
+
+
+@dataclass(frozen=True, slots=True)
+class _Worker:
+    process: "BaseProcess"
+    connection: "Connection"
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+
+# Runs calls in long-lived worker processes, one call per process at a time. Unlike a process pool,
+# a call that runs out of time can be abandoned for real: its process is killed and replaced on the next call.
+@dataclass(slots=True, kw_only=True)
+class ProcessWorkers:
+    idle_workers: list[_Worker] = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def _take_worker(self) -> _Worker:
+        with self.lock:
+            if self.idle_workers:
+                return self.idle_workers.pop()
+        # Forking a process that already runs reader threads can deadlock
+        context: Final = multiprocessing.get_context("spawn")
+        parent_connection, child_connection = context.Pipe()
+        process: Final = context.Process(target=_serve, args=(child_connection,), daemon=True)
+        process.start()
+        child_connection.close()
+        return _Worker(process, parent_connection)
+
+    # Returns None when the call takes longer than the timeout
+    def call(
+        self, function: Callable[[ArgumentT], ResultT], argument: ArgumentT, *, timeout: float | None
+    ) -> ResultT | None:
+        worker: Final = self._take_worker()
+        try:
+            worker.connection.send((function, argument))
+            if not worker.connection.poll(timeout):
+                worker.kill()
+                return None
+            is_successful, value = worker.connection.recv()
+        except BaseException:
+            worker.kill()
+            raise
+        with self.lock:
+            self.idle_workers.append(worker)
+        if not is_successful:
+            raise value
+        return value  # type: ignore[no-any-return]
+
+    def close(self) -> None:
+        with self.lock:
+            workers: Final = self.idle_workers.copy()
+            self.idle_workers.clear()
+        for worker in workers:
+            worker.connection.close()
+        for worker in workers:
+            worker.process.join(WORKER_STOP_TIMEOUT_SECONDS)
+            if worker.process.is_alive():
+                worker.kill()
+
+
+# Reads files ahead on a thread pool, analyzes them in the current thread or in worker processes
+# and writes results on a single thread, so the order of writes and of printed diffs stays the same
+@dataclass(slots=True, kw_only=True)
+class Pipeline:
+    reader: ThreadPoolExecutor
+    # Feeds several worker processes at once, without it analysis runs in the current thread
+    analyzer: ThreadPoolExecutor | None
+    workers: ProcessWorkers
+    # Analysis in the current process can't be abandoned, so timeouts are ignored for it
+    uses_workers: bool
+    writer: ThreadPoolExecutor
+    pending_writes: deque[Future[None]] = field(default_factory=deque)
+
+    @staticmethod
+    @contextmanager
+    def start(jobs: int, *, uses_workers: bool = True) -> Iterator["Pipeline"]:
+        pipeline: Final = Pipeline(
+            reader=ThreadPoolExecutor(max_workers=READER_THREADS_COUNT, thread_name_prefix="reader"),
+            analyzer=ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="analyzer")
+            if jobs > 1 and uses_workers
+            else None,
+            workers=ProcessWorkers(),
+            uses_workers=uses_workers,
+            writer=ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer"),
+        )
+        try:
+            yield pipeline
+        finally:
+            pipeline.reader.shutdown(cancel_futures=True)
+            if pipeline.analyzer:
+                pipeline.analyzer.shutdown(cancel_futures=True)
+            pipeline.workers.close()
+            pipeline.writer.shutdown()
+
+    def read(
+        self, function: Callable[[ArgumentT], ResultT], items: Iterable[tuple[KeyT, ArgumentT]]
+    ) -> Iterator[tuple[KeyT, ResultT]]:
+        return map_bounded(function, items, executor=self.reader)
+
+    # Items come with their timeouts, results of items that ran out of time are None
+    def analyze(
+        self, function: Callable[[ArgumentT], ResultT], items: Iterable[tuple[KeyT, tuple[ArgumentT, float | None]]]
+    ) -> Iterator[tuple[KeyT, ResultT | None]]:
+        def run(argument_and_timeout: tuple[ArgumentT, float | None]) -> ResultT | None:
+            argument, timeout = argument_and_timeout
+            if not self.uses_workers or (timeout is None and not self.analyzer):
+                return function(argument)
+            return self.workers.call(function, argument, timeout=timeout)
+
+        return map_bounded(run, items, executor=self.analyzer)
+
+    def write(self, function: Callable[[], None]) -> None:
+        self.pending_writes.append(self.writer.submit(function))
+        if len(self.pending_writes) >= MAX_PENDING_COUNT:
+            self.pending_writes.popleft().result()
+
+    # Waits for all submitted writes, raising the first error of them
+    def flush(self) -> None:
+        while self.pending_writes:
+            self.pending_writes.popleft().result()
@@ -1,9 +1,10 @@
+import re
 import typing
-from collections.abc import Iterable
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass
 from typing import Final, Literal
 
-from ast_grep_py import SgNode
+from ast_grep_py import Pos, SgNode
 
 from auto_typing_final.finder import (
     ImportsResult,
@@ -20,6 +21,11 @@ class ImportConfig:
     import_text: str
     import_identifier: str
 
+    # Name of the annotation in the typing module, that is looked for in existing annotations
+    @property
+    def identifier_name(self) -> str:
+        return self.value.rpartition(".")[2]
+
 
 ImportStyle = Literal["typing-final", "final"]
 IMPORT_STYLES_TO_IMPORT_CONFIGS: Final[dict[ImportStyle, ImportConfig]] = {
@@ -27,21 +33,26 @@ IMPORT_STYLES_TO_IMPORT_CONFIGS: Final[dict[ImportStyle, ImportConfig]] = {
     "final": ImportConfig(value="Final", import_text="from typing import Final", import_identifier="Final"),
 }
 IGNORED_DEFINITION_PATTERNS: typing.Final = {"TypeVar", "ParamSpec"}
+# Any name followed by an annotation or a value, matches more than actual assignments
+ASSIGNMENT_CANDIDATE_REGEX: typing.Final = re.compile(r"(\w+)[\s\\]*[:=]")
+# As in PEP 263
+CODING_COOKIE_REGEX: typing.Final = re.compile(r"[ \t\f]*#.*?coding[:=][ \t]*[-\w.]+")
 
 
+# Parts of assignments are kept as nodes, their text is only read when needed: right-hand sides can be huge literals
 @dataclass(frozen=True, slots=True)
 class EditableAssignmentWithoutAnnotation:
     node: SgNode
-    left: str
-    right: str
+    left: SgNode
+    right: SgNode
 
 
 @dataclass(frozen=True, slots=True)
 class EditableAssignmentWithAnnotation:
     node: SgNode
-    left: str
+    left: SgNode
     annotation: SgNode
-    right: str
+    right: SgNode
 
 
 @dataclass(frozen=True, slots=True)
@@ -75,7 +86,7 @@ def _make_definition_from_definition_node(node: SgNode) -> Definition:
             ("=", _),
             (right_kind, right),
         ) if right_kind != "assignment" and not ((parent := node.parent()) and parent.kind() == "assignment"):
-            return EditableAssignmentWithoutAnnotation(node=node, left=left.text(), right=right.text())
+            return EditableAssignmentWithoutAnnotation(node=node, left=left, right=right)
         case (
             ("identifier", left),
             (":", _),
@@ -83,17 +94,19 @@ def _make_definition_from_definition_node(node: SgNode) -> Definition:
             ("=", _),
             (right_kind, right),
         ) if right_kind != "assignment" and not ((parent := node.parent()) and parent.kind() == "assignment"):
-            return EditableAssignmentWithAnnotation(
-                node=node, left=left.text(), annotation=annotation, right=right.text()
-            )
+            return EditableAssignmentWithAnnotation(node=node, left=left, annotation=annotation, right=right)
         case _:
             return OtherDefinition(node)
 
 
+def _is_constant_name(name: str) -> bool:
+    return name.isupper() and len(name) > 1
+
+
 def _should_skip_global_variable(definition: Definition) -> bool:
     return isinstance(definition, EditableAssignmentWithoutAnnotation | EditableAssignmentWithAnnotation) and (
-        not (definition.left.isupper() and len(definition.left) > 1)
-        or any(one_pattern in definition.right for one_pattern in IGNORED_DEFINITION_PATTERNS)
+        not _is_constant_name(definition.left.text())
+        or any(one_pattern in definition.right.text() for one_pattern in IGNORED_DEFINITION_PATTERNS)
     )
 
 
@@ -138,9 +151,10 @@ def _match_exact_identifier(node: SgNode, imports_result: ImportsResult, identif
     return None
 
 
-def _strip_value_from_type_annotation_that_is_indeed_inside_given_identifier(
+# Returns nodes of the value inside `Final[...]`, an empty list for bare `Final` and None for other annotations
+def _find_value_in_type_annotation_that_is_indeed_inside_given_identifier(
     node: SgNode, imports_result: ImportsResult, identifier_name: str
-) -> str | None:
+) -> list[SgNode] | None:
     type_node_children: Final = node.children()
     if len(type_node_children) != 1:
         return None
@@ -151,7 +165,7 @@ def _strip_value_from_type_annotation_that_is_indeed_inside_given_identifier(
         match tuple((child.kind(), child) for child in inner_type_node.children()):
             case (("attribute", attribute), ("[", _), *kinds_and_nodes, ("]", _)):
                 if _match_exact_identifier(attribute, imports_result, identifier_name):
-                    return "".join(node.text() for _, node in kinds_and_nodes)
+                    return [node for _, node in kinds_and_nodes]
     elif kind == "generic_type" and imports_result.has_from_import:
         match tuple((child.kind(), child) for child in inner_type_node.children()):
             case (("identifier", identifier), ("type_parameter", type_parameter)):
@@ -159,50 +173,60 @@ def _strip_value_from_type_annotation_that_is_indeed_inside_given_identifier(
                     return None
                 match tuple((inner_child.kind(), inner_child) for inner_child in type_parameter.children()):
                     case (("[", _), *kinds_and_nodes, ("]", _)):
-                        return "".join(node.text() for _, node in kinds_and_nodes)
+                        return [node for _, node in kinds_and_nodes]
     elif (kind == "identifier" and inner_type_node.text() == identifier_name) or (
         kind == "attribute" and _match_exact_identifier(inner_type_node, imports_result, identifier_name)
     ):
-        return ""
+        return []
     return None
 
 
-def _make_changed_text_from_operation(
-    operation: Operation, final_value: str, imports_result: ImportsResult, identifier_name: str
-) -> Iterable[tuple[SgNode, str]]:
-    match operation:
-        case AddFinal(assignment):
-            match assignment:
-                case EditableAssignmentWithoutAnnotation(node, left, right):
-                    yield node, f"{left}: {final_value} = {right}"
-                case EditableAssignmentWithAnnotation(node, left, annotation, right) if (
-                    _strip_value_from_type_annotation_that_is_indeed_inside_given_identifier(
-                        annotation, imports_result, identifier_name
-                    )
-                    is None
-                ):
-                    yield node, f"{left}: {final_value}[{annotation.text()}] = {right}"
-        case RemoveFinal(assignments):
-            for assignment in assignments:
-                match assignment:
-                    case EditableAssignmentWithoutAnnotation(node, left, right):
-                        yield node, node.text()
-                    case EditableAssignmentWithAnnotation(node, left, annotation, right):
-                        match _strip_value_from_type_annotation_that_is_indeed_inside_given_identifier(
-                            annotation, imports_result, identifier_name
-                        ):
-                            case "":
-                                yield node, f"{left} = {right}"
-                            case str(new_annotation):
-                                yield node, f"{left}: {new_annotation} = {right}"
-
-
+# Smallest change of the source: an insertion when start and end are equal, a deletion when new_text is empty
 @dataclass(frozen=True, slots=True)
 class Edit:
+    # The whole definition, used as the range of diagnostics
     node: SgNode
+    start: Pos
+    end: Pos
     new_text: str
 
 
+def _make_edits_from_operation(
+    operation: Operation, import_config: ImportConfig, imports_result: ImportsResult
+) -> Iterable[Edit]:
+    final_value: Final = import_config.value
+    match operation:
+        case AddFinal(EditableAssignmentWithoutAnnotation(node, left, _)):
+            # a = 1 -> a: Final = 1
+            end: Final = left.range().end
+            yield Edit(node, end, end, f": {final_value}")
+        case AddFinal(EditableAssignmentWithAnnotation(node, _, annotation, _)) if (
+            _find_value_in_type_annotation_that_is_indeed_inside_given_identifier(
+                annotation, imports_result, import_config.identifier_name
+            )
+            is None
+        ):
+            # a: int = 1 -> a: Final[int] = 1
+            annotation_range = annotation.range()
+            yield Edit(node, annotation_range.start, annotation_range.start, f"{final_value}[")
+            yield Edit(node, annotation_range.end, annotation_range.end, "]")
+        case RemoveFinal(assignments):
+            for assignment in assignments:
+                if not isinstance(assignment, EditableAssignmentWithAnnotation):
+                    continue
+                match _find_value_in_type_annotation_that_is_indeed_inside_given_identifier(
+                    assignment.annotation, imports_result, import_config.identifier_name
+                ):
+                    case []:
+                        # a: Final = 1 -> a = 1
+                        yield Edit(assignment.node, assignment.left.range().end, assignment.annotation.range().end, "")
+                    case [first_value_node, *_] as value_nodes:
+                        # a: Final[int] = 1 -> a: int = 1
+                        annotation_range = assignment.annotation.range()
+                        yield Edit(assignment.node, annotation_range.start, first_value_node.range().start, "")
+                        yield Edit(assignment.node, value_nodes[-1].range().end, annotation_range.end, "")
+
+
 @dataclass(frozen=True, slots=True)
 class Replacement:
     operation_type: type[Operation]
@@ -215,53 +239,84 @@ class MakeReplacementsResult:
     import_text: str | None
 
 
-def make_replacements(root: SgNode, import_config: ImportConfig, ignore_global_vars: bool) -> MakeReplacementsResult:
-    replacements: Final = []
-    has_added_final = False
-    imports_result: Final = find_imports_of_identifier_in_scope(root, module_name="typing", identifier_name="Final")
+# Python reads a shebang only from the first line and a coding cookie only from the first two lines, the second one
+# only if the first one is a comment or blank, so the import goes after them. Returns the index of the line start.
+def find_import_index(source: str) -> int:
+    first_line_end: Final = source.find("\n")
+    if first_line_end == -1:
+        return 0
+    first_line: Final = source[:first_line_end]
+    if CODING_COOKIE_REGEX.match(first_line):
+        return first_line_end + 1
+    second_line_end: Final = source.find("\n", first_line_end + 1)
+    if (
+        second_line_end != -1
+        and (not first_line.strip() or first_line.lstrip().startswith("#"))
+        and CODING_COOKIE_REGEX.match(source, first_line_end + 1, second_line_end)
+    ):
+        return second_line_end + 1
+    return first_line_end + 1 if first_line.startswith("#!") else 0
+
+
+# Cheap textual check that proves that a source cannot get any edits, so it does not have to be parsed. Edits need
+# an assignment, and outside of functions only constants get Final.
+def can_have_replacements(source: str, ignore_global_vars: bool) -> bool:
+    if "=" not in source:
+        return False
+    if "def" in source:
+        return True
+    return not ignore_global_vars and any(
+        _is_constant_name(match.group(1)) for match in ASSIGNMENT_CANDIDATE_REGEX.finditer(source)
+    )
+
+
+def _make_edits(operation: Operation, import_config: ImportConfig, imports_result: ImportsResult) -> list[Edit]:
+    return list(_make_edits_from_operation(operation, import_config, imports_result))
 
+
+def iter_function_replacements(
+    root: SgNode, import_config: ImportConfig, imports_result: ImportsResult, ignore_global_vars: bool
+) -> Iterator[Replacement]:
     for current_definitions in find_all_definitions_in_functions(root):
-        if not (operation := _make_operation_from_definitions_of_one_name(current_definitions, ignore_global_vars)):
-            continue
-        edits = [
-            Edit(node=node, new_text=new_text)
-            for node, new_text in _make_changed_text_from_operation(
-                operation=operation,
-                final_value=import_config.value,
-                imports_result=imports_result,
-                identifier_name="Final",
+        if operation := _make_operation_from_definitions_of_one_name(current_definitions, ignore_global_vars):
+            yield Replacement(
+                operation_type=type(operation), edits=_make_edits(operation, import_config, imports_result)
             )
-            if node.text() != new_text
-        ]
 
-        if (operation_type := type(operation)) == AddFinal and edits:
-            has_added_final = True
 
-        replacements.append(Replacement(operation_type=operation_type, edits=edits))
+# Only global constants defined once get Final, other global definitions are left as they are
+def make_global_replacement(
+    definitions: list[SgNode], import_config: ImportConfig, imports_result: ImportsResult
+) -> Replacement | None:
+    if (
+        not (operation := _make_operation_from_definitions_of_one_name(definitions, ignore_global_vars=False))
+        or (operation_type := type(operation)) == RemoveFinal
+    ):
+        return None
+    if edits := _make_edits(operation, import_config, imports_result):
+        return Replacement(operation_type=operation_type, edits=edits)
+    return None
+
+
+# Yields replacements function by function as they are found, so callers can stop at the first edit
+def iter_replacements(root: SgNode, import_config: ImportConfig, ignore_global_vars: bool) -> Iterator[Replacement]:
+    imports_result: Final = find_imports_of_identifier_in_scope(
+        root, module_name="typing", identifier_name=import_config.identifier_name
+    )
+
+    yield from iter_function_replacements(root, import_config, imports_result, ignore_global_vars)
 
     if not ignore_global_vars:
         for current_definitions in find_global_definitions(root):
-            if (
-                not (operation := _make_operation_from_definitions_of_one_name(current_definitions, ignore_global_vars))
-                or (operation_type := type(operation)) == RemoveFinal
-            ):
-                continue
-
-            edits = [
-                Edit(node=node, new_text=new_text)
-                for node, new_text in _make_changed_text_from_operation(
-                    operation=operation,
-                    final_value=import_config.value,
-                    imports_result=imports_result,
-                    identifier_name="Final",
-                )
-                if node.text() != new_text
-            ]
-            if not edits:
-                continue
-            has_added_final = True
-            replacements.append(Replacement(operation_type=operation_type, edits=edits))
+            if replacement := make_global_replacement(current_definitions, import_config, imports_result):
+                yield replacement
+
 
+def make_replacements(root: SgNode, import_config: ImportConfig, ignore_global_vars: bool) -> MakeReplacementsResult:
+    replacements: Final = list(iter_replacements(root, import_config, ignore_global_vars))
+    has_added_final: Final = any(
+        replacement.operation_type == AddFinal and replacement.edits for replacement in replacements
+    )
     return MakeReplacementsResult(
         replacements=replacements,
         import_text=(
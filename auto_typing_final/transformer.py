@@ -0,0 +1,264 @@
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Final, Literal
+
+from ast_grep_py import SgNode, SgRoot
+
+from auto_typing_final.chunks import split_into_chunks
+from auto_typing_final.finder import (
+    IGNORE_COMMENT_TEXT,
+    ImportsResult,
+    find_global_definitions_by_name,
+    find_imports_of_identifier_in_scope,
+    has_global_identifier_with_name,
+)
+from auto_typing_final.transform import (
+    AddFinal,
+    ImportConfig,
+    MakeReplacementsResult,
+    Operation,
+    Replacement,
+    can_have_replacements,
+    find_import_index,
+    iter_function_replacements,
+    iter_replacements,
+    make_global_replacement,
+    make_replacements,
+)
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+# Smaller sources are parsed whole, which is faster than splitting them
+CHUNKED_ANALYSIS_MIN_LENGTH: Final = 1024 * 1024
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class SpanEdit:
+    operation: Literal["add-final", "remove-final"]
+    # Byte offsets in UTF-8 encoded source
+    start: int
+    end: int
+    new_text: str
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class AnalysisResult:
+    edits: list[SpanEdit]
+    # Inserted as a separate line after a shebang and a coding cookie, see find_import_index()
+    import_text: str | None
+    # False when a textual pre-check proved that there is nothing to change without parsing the source
+    is_parsed: bool = True
+
+    @property
+    def has_changes(self) -> bool:
+        return bool(self.edits) or self.import_text is not None
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class TransformResult:
+    source: str
+    new_source: str
+    analysis: AnalysisResult
+
+    @property
+    def has_changes(self) -> bool:
+        return self.new_source != self.source
+
+
+def _make_byte_offsets(source: str, indices: Iterable[int]) -> dict[int, int]:
+    result: Final = {}
+    previous_index = previous_offset = 0
+    for index in sorted(set(indices)):
+        previous_offset += len(source[previous_index:index].encode("utf-8"))
+        previous_index = index
+        result[index] = previous_offset
+    return result
+
+
+@dataclass(frozen=True, slots=True)
+class _IndexEdit:
+    operation_type: type[Operation]
+    # Character indices in source
+    start: int
+    end: int
+    new_text: str
+
+
+def _iter_index_edits(replacements: Iterable[Replacement], offset: int = 0) -> Iterator[_IndexEdit]:
+    for replacement in replacements:
+        for edit in replacement.edits:
+            yield _IndexEdit(
+                replacement.operation_type, offset + edit.start.index, offset + edit.end.index, edit.new_text
+            )
+
+
+def _make_index_edits(replacements_result: MakeReplacementsResult) -> list[_IndexEdit]:
+    return sorted(_iter_index_edits(replacements_result.replacements), key=lambda edit: edit.start)
+
+
+def _find_imports_in_chunks(source: str, chunks: list[tuple[int, int]], identifier_name: str) -> ImportsResult:
+    result: Final = ImportsResult(module_aliases={"typing"}, has_from_import=False)
+    for start, end in chunks:
+        if source.find("import", start, end) == -1:
+            continue
+        chunk_result = find_imports_of_identifier_in_scope(
+            SgRoot(source[start:end], "python").root(), module_name="typing", identifier_name=identifier_name
+        )
+        result.module_aliases.update(chunk_result.module_aliases)
+        result.has_from_import = result.has_from_import or chunk_result.has_from_import
+    return result
+
+
+# A global constant gets Final only when it is defined once in the whole module, not once in a chunk
+@dataclass(slots=True, kw_only=True)
+class _GlobalDefinitions:
+    counts: dict[str, int] = field(default_factory=dict)
+    index_edits: dict[str, list[_IndexEdit]] = field(default_factory=dict)
+
+    def add(self, root: SgNode, offset: int, import_config: ImportConfig, imports_result: ImportsResult) -> None:
+        for name, definitions in find_global_definitions_by_name(root).items():
+            self.counts[name] = self.counts.get(name, 0) + len(definitions)
+            if self.counts[name] == 1 and (
+                replacement := make_global_replacement(definitions, import_config, imports_result)
+            ):
+                self.index_edits[name] = list(_iter_index_edits([replacement], offset))
+
+    def iter_index_edits(self) -> Iterator[_IndexEdit]:
+        for name, index_edits in self.index_edits.items():
+            if self.counts[name] == 1:
+                yield from index_edits
+
+
+# Functions are analyzed independently, so huge modules are parsed chunk by chunk and the tree of each chunk is
+# released before the next one is parsed. Returns None if a chunk doesn't parse cleanly on its own.
+def _analyze_in_chunks(
+    source: str, chunks: list[tuple[int, int]], import_config: ImportConfig, ignore_global_vars: bool
+) -> tuple[list[_IndexEdit], str | None] | None:
+    imports_result: Final = _find_imports_in_chunks(source, chunks, import_config.identifier_name)
+    index_edits: Final[list[_IndexEdit]] = []
+    global_definitions: Final = _GlobalDefinitions()
+    has_import_identifier = False
+
+    for start, end in chunks:
+        root = SgRoot(source[start:end], "python").root()
+        if root.find(kind="ERROR"):
+            return None
+        index_edits.extend(
+            _iter_index_edits(
+                iter_function_replacements(root, import_config, imports_result, ignore_global_vars), start
+            )
+        )
+        if not ignore_global_vars:
+            global_definitions.add(root, start, import_config, imports_result)
+        has_import_identifier = has_import_identifier or has_global_identifier_with_name(
+            root, import_config.import_identifier
+        )
+
+    index_edits.extend(global_definitions.iter_index_edits())
+    index_edits.sort(key=lambda edit: edit.start)
+    has_added_final: Final = any(edit.operation_type == AddFinal for edit in index_edits)
+    return index_edits, import_config.import_text if has_added_final and not has_import_identifier else None
+
+
+def _make_analysis_result(source: str, index_edits: list[_IndexEdit], import_text: str | None) -> AnalysisResult:
+    byte_offsets: Final = (
+        None
+        if source.isascii()
+        else _make_byte_offsets(source, (index for edit in index_edits for index in (edit.start, edit.end)))
+    )
+    return AnalysisResult(
+        edits=[
+            SpanEdit(
+                operation="add-final" if edit.operation_type == AddFinal else "remove-final",
+                start=byte_offsets[edit.start] if byte_offsets else edit.start,
+                end=byte_offsets[edit.end] if byte_offsets else edit.end,
+                new_text=edit.new_text,
+            )
+            for edit in index_edits
+        ],
+        import_text=import_text,
+    )
+
+
+# The inserted import line follows line endings of the source, judging by the first line
+def detect_newline(source: str) -> str:
+    first_newline_index: Final = source.find("\n")
+    return "\r\n" if first_newline_index > 0 and source[first_newline_index - 1] == "\r" else "\n"
+
+
+# Splices sorted, non-overlapping edits into one output string. The import is just a zero-width edit before them.
+def _apply_edits(source: str, index_edits: list[_IndexEdit], import_text: str | None) -> str:
+    if not index_edits and not import_text:
+        return source
+    parts: Final[list[str]] = []
+    previous_end = 0
+    if import_text:
+        previous_end = find_import_index(source)
+        parts.extend((source[:previous_end], f"{import_text}{detect_newline(source)}"))
+    for edit in index_edits:
+        parts.extend((source[previous_end : edit.start], edit.new_text))
+        previous_end = edit.end
+    parts.append(source[previous_end:])
+    return "".join(parts)
+
+
+# Built once per configuration and reused for many sources, safe to share between threads and to send to processes
+@dataclass(frozen=True, slots=True, kw_only=True)
+class Transformer:
+    import_config: ImportConfig
+    ignore_global_vars: bool = False
+
+    def _make_replacements(self, root: SgNode) -> MakeReplacementsResult:
+        return make_replacements(root, import_config=self.import_config, ignore_global_vars=self.ignore_global_vars)
+
+    def _find_index_edits(self, source: str) -> tuple[list[_IndexEdit], str | None]:
+        # An ignore comment applies to its whole block, and for top-level statements that is the whole module
+        if (
+            len(source) >= CHUNKED_ANALYSIS_MIN_LENGTH
+            and IGNORE_COMMENT_TEXT not in source
+            and (chunks := split_into_chunks(source))
+            and len(chunks) > 1
+            and (result := _analyze_in_chunks(source, chunks, self.import_config, self.ignore_global_vars))
+        ):
+            return result
+        replacements_result: Final = self._make_replacements(SgRoot(source, "python").root())
+        return _make_index_edits(replacements_result), replacements_result.import_text
+
+    def analyze(self, source: str) -> AnalysisResult:
+        if not can_have_replacements(source, ignore_global_vars=self.ignore_global_vars):
+            return AnalysisResult(edits=[], import_text=None, is_parsed=False)
+        index_edits, import_text = self._find_index_edits(source)
+        return _make_analysis_result(source, index_edits, import_text)
+
+    def transform(self, source: str) -> TransformResult:
+        if not can_have_replacements(source, ignore_global_vars=self.ignore_global_vars):
+            return TransformResult(
+                source=source, new_source=source, analysis=AnalysisResult(edits=[], import_text=None, is_parsed=False)
+            )
+        index_edits, import_text = self._find_index_edits(source)
+        return TransformResult(
+            source=source,
+            new_source=_apply_edits(source, index_edits, import_text),
+            analysis=_make_analysis_result(source, index_edits, import_text),
+        )
+
+    # Stops at the first edit instead of analyzing the whole source, huge sources are analyzed in chunks instead
+    def has_changes(self, source: str) -> bool:
+        if not can_have_replacements(source, ignore_global_vars=self.ignore_global_vars):
+            return False
+        if len(source) >= CHUNKED_ANALYSIS_MIN_LENGTH:
+            return bool(self._find_index_edits(source)[0])
+        return any(
+            replacement.edits
+            for replacement in iter_replacements(
+                SgRoot(source, "python").root(),
+                import_config=self.import_config,
+                ignore_global_vars=self.ignore_global_vars,
+            )
+        )
+
+    def transform_many(
+        self, sources: Iterable[str], *, executor: "Executor | None" = None
+    ) -> Iterator[TransformResult]:
+        return executor.map(self.transform, sources) if executor else map(self.transform, sources)
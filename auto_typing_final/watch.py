@@ -0,0 +1,206 @@
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import select
+import struct
+import sys
+import time
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from typing import Final, Protocol
+
+from auto_typing_final.discovery import SOURCE_FILE_SUFFIXES, SourceFileWalker
+
+DEFAULT_DEBOUNCE_SECONDS: Final = 0.1
+POLL_INTERVAL_SECONDS: Final = 0.5
+
+IN_CLOSE_WRITE: Final = 0x00000008
+IN_MOVED_TO: Final = 0x00000080
+IN_CREATE: Final = 0x00000100
+IN_Q_OVERFLOW: Final = 0x00004000
+IN_ISDIR: Final = 0x40000000
+INOTIFY_EVENT_HEADER: Final = struct.Struct("iIII")
+
+
+class Watcher(Protocol):
+    # Blocks until something changes or the timeout passes. None means that changes are unknown and everything
+    # should be rescanned.
+    def wait_for_changes(self, timeout: float | None) -> set[Path] | None: ...
+
+    def close(self) -> None: ...
+
+
+def _iter_watched_directories(roots: list[Path], walker: SourceFileWalker) -> Iterable[Path]:
+    for root in roots:
+        if root.is_dir():
+            yield from walker.iter_directories(root)
+        else:
+            yield root.parent
+
+
+# Changed paths are matched the same way the walk would find them: excludes, hidden and gitignored paths are skipped
+def _is_walked_path(walker: SourceFileWalker, root: Path, path: Path, *, is_dir: bool) -> bool:
+    if not path.is_relative_to(root):
+        return False
+    relative_path: Final = path.relative_to(root)
+    return not walker.is_excluded_path(relative_path) and not walker.is_ignored_path(root, relative_path, is_dir=is_dir)
+
+
+class InotifyWatcher:
+    def __init__(self, roots: list[Path], walker: SourceFileWalker) -> None:
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._walker = walker
+        self._roots = roots
+        self._directories: dict[int, Path] = {}
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        for directory in _iter_watched_directories(roots, walker):
+            self._add_watch(directory)
+
+    @staticmethod
+    def try_create(roots: list[Path], walker: SourceFileWalker) -> "InotifyWatcher | None":
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            return InotifyWatcher(roots, walker)
+        except (OSError, AttributeError):
+            return None
+
+    def _add_watch(self, directory: Path) -> None:
+        watch_descriptor: Final = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        )
+        if watch_descriptor >= 0:
+            self._directories[watch_descriptor] = directory
+
+    def _is_watched_directory(self, path: Path) -> bool:
+        return any(_is_walked_path(self._walker, root, path, is_dir=True) for root in self._roots if root.is_dir())
+
+    def wait_for_changes(self, timeout: float | None) -> set[Path] | None:
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        buffer: Final = os.read(self._fd, 64 * 1024)
+        result: Final[set[Path]] = set()
+        offset = 0
+        while offset < len(buffer):
+            watch_descriptor, mask, _, name_length = INOTIFY_EVENT_HEADER.unpack_from(buffer, offset)
+            name = buffer[offset + INOTIFY_EVENT_HEADER.size : offset + INOTIFY_EVENT_HEADER.size + name_length]
+            offset += INOTIFY_EVENT_HEADER.size + name_length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if not (directory := self._directories.get(watch_descriptor)):
+                continue
+            path = directory / os.fsdecode(name.rstrip(b"\0"))
+            if mask & IN_ISDIR:
+                if self._is_watched_directory(path):
+                    for new_directory in _iter_watched_directories([path], self._walker):
+                        self._add_watch(new_directory)
+                    # Files could have been written before the watch was added
+                    result.update(path for path in path.rglob("*") if path.name.endswith(SOURCE_FILE_SUFFIXES))
+            else:
+                result.add(path)
+        return result
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    def __init__(self, find_source_files: Callable[[], Iterable[Path]]) -> None:
+        self._find_source_files = find_source_files
+        self._snapshot = self._take_snapshot()
+
+    def _take_snapshot(self) -> dict[Path, tuple[int, int]]:
+        result: Final = {}
+        for path in self._find_source_files():
+            try:
+                stat_result = path.stat()
+            except OSError:
+                continue
+            result[path] = (stat_result.st_mtime_ns, stat_result.st_size)
+        return result
+
+    def wait_for_changes(self, timeout: float | None) -> set[Path] | None:
+        time.sleep(POLL_INTERVAL_SECONDS if timeout is None else min(timeout, POLL_INTERVAL_SECONDS))
+        new_snapshot: Final = self._take_snapshot()
+        changed_paths: Final = {
+            path for path, signature in new_snapshot.items() if self._snapshot.get(path) != signature
+        }
+        self._snapshot = new_snapshot
+        return changed_paths
+
+    def close(self) -> None: ...
+
+
+def hash_file(path: Path) -> str | None:
+    try:
+        return hashlib.blake2b(path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+
+
+class ContentHashes:
+    def __init__(self) -> None:
+        self._hashes: dict[Path, str | None] = {}
+
+    def remember(self, paths: Iterable[Path]) -> None:
+        for path in paths:
+            self._hashes[path.absolute()] = hash_file(path)
+
+    def take_changed(self, paths: Iterable[Path]) -> list[Path]:
+        result: Final = []
+        for path in paths:
+            absolute_path = path.absolute()
+            if (content_hash := hash_file(path)) is None or self._hashes.get(absolute_path) == content_hash:
+                continue
+            self._hashes[absolute_path] = content_hash
+            result.append(path)
+        return result
+
+
+def make_source_file_filter(roots: list[Path], walker: SourceFileWalker) -> Callable[[Path], bool]:
+    absolute_roots: Final = [root.absolute() for root in roots]
+
+    def is_source_file(path: Path) -> bool:
+        absolute_path: Final = path.absolute()
+        return any(
+            absolute_path == root
+            or (
+                absolute_path.name.endswith(SOURCE_FILE_SUFFIXES)
+                and _is_walked_path(walker, root, absolute_path, is_dir=False)
+            )
+            for root in absolute_roots
+        )
+
+    return is_source_file
+
+
+def watch(  # noqa: PLR0913
+    watcher: Watcher,
+    *,
+    find_source_files: Callable[[], Iterable[Path]],
+    is_source_file: Callable[[Path], bool],
+    process: Callable[[list[Path]], list[Path]],
+    content_hashes: ContentHashes,
+    debounce: float = DEFAULT_DEBOUNCE_SECONDS,
+) -> None:
+    while True:
+        changes = watcher.wait_for_changes(timeout=None)
+        # Editors and formatters write in bursts, so wait until things settle down
+        while changes is not None:
+            more_changes = watcher.wait_for_changes(timeout=debounce)
+            if more_changes is None:
+                changes = None
+            elif more_changes:
+                changes.update(more_changes)
+            else:
+                break
+
+        candidates = (
+            list(find_source_files()) if changes is None else sorted(path for path in changes if is_source_file(path))
+        )
+        if changed_paths := content_hashes.take_changed(candidates):
+            content_hashes.remember(process(changed_paths))
@@ -0,0 +1,100 @@
+import pathlib
+from typing import Final
+
+import pytest
+
+from auto_typing_final.bench import bench_main, run_ffi_accounting, run_once
+from auto_typing_final.transform import IMPORT_STYLES_TO_IMPORT_CONFIGS
+
+
+def test_run_once_does_not_write(tmp_path: pathlib.Path) -> None:
+    source: Final = "def foo():\n    a = 1\n"
+    (tmp_path / "module.py").write_text(source, encoding="utf-8")
+    (tmp_path / "other.txt").write_text(source, encoding="utf-8")
+
+    run: Final = run_once([tmp_path], import_config=IMPORT_STYLES_TO_IMPORT_CONFIGS["final"], ignore_global_vars=False)
+
+    assert (run.files_count, run.bytes_count, run.changed_files_count) == (1, len(source), 1)
+    assert (tmp_path / "module.py").read_text(encoding="utf-8") == source
+
+
+def test_bench_main_reports_phases(tmp_path: pathlib.Path, capsys: pytest.CaptureFixture[str]) -> None:
+    (tmp_path / "module.py").write_text("def foo():\n    a = 1\n", encoding="utf-8")
+
+    assert bench_main([str(tmp_path), "--repeat", "2"]) == 0
+
+    output: Final = capsys.readouterr().out
+    for phase in (
+        "discovery",
+        "read",
+        "transform",
+        "total",
+        "files/s",
+        "cold / warm",
+        "skipped without parsing: 0",
+        "not decoded: 0",
+    ):
+        assert phase in output
+
+
+def test_bench_skips_undecodable_files(tmp_path: pathlib.Path, capsys: pytest.CaptureFixture[str]) -> None:
+    (tmp_path / "broken.py").write_bytes(b"# -*- coding: bogus -*-\ndef foo():\n    a = 1\n")
+    (tmp_path / "module.py").write_text("def foo():\n    a = 1\n", encoding="utf-8")
+
+    assert bench_main([str(tmp_path), "--repeat", "1"]) == 0
+    assert "files: 1, " in capsys.readouterr().out
+    run: Final = run_once([tmp_path], import_config=IMPORT_STYLES_TO_IMPORT_CONFIGS["final"], ignore_global_vars=False)
+    assert (run.files_count, run.undecodable_files_count) == (1, 1)
+
+
+def test_bench_main_reports_ffi_calls(tmp_path: pathlib.Path, capsys: pytest.CaptureFixture[str]) -> None:
+    path: Final = tmp_path / "module.py"
+    path.write_text("def foo():\n    a = 1\n", encoding="utf-8")
+
+    assert bench_main([str(tmp_path), "--repeat", "1", "--ffi-calls"]) == 0
+
+    output: Final = capsys.readouterr().out
+    assert "ast-grep calls: " in output
+    assert "auto_typing_final.finder.find_all_definitions_in_functions: find_all" in output
+    assert output.endswith(f"  {path}\n")
+
+
+def test_bench_main_analyzes_in_worker_processes(tmp_path: pathlib.Path, capsys: pytest.CaptureFixture[str]) -> None:
+    for index in range(3):
+        (tmp_path / f"module_{index}.py").write_text("def foo():\n    a = 1\n", encoding="utf-8")
+
+    assert bench_main([str(tmp_path), "--repeat", "2", "--jobs", "2"]) == 0
+    assert "files: 3, " in capsys.readouterr().out
+
+
+def test_run_once_reads_declared_encoding(tmp_path: pathlib.Path) -> None:
+    source: Final = "# coding: latin-1\ndef foo():\n    a = 'é'\n"
+    (tmp_path / "module.py").write_bytes(source.encode("latin-1"))
+
+    run: Final = run_once([tmp_path], import_config=IMPORT_STYLES_TO_IMPORT_CONFIGS["final"], ignore_global_vars=False)
+
+    assert (run.files_count, run.changed_files_count) == (1, 1)
+
+
+def test_ffi_accounting_reads_declared_encoding(tmp_path: pathlib.Path) -> None:
+    path: Final = tmp_path / "module.py"
+    path.write_bytes("# coding: latin-1\ndef foo():\n    a = 'é'\n".encode("latin-1"))
+
+    file_accountings: Final = run_ffi_accounting(
+        [tmp_path], import_config=IMPORT_STYLES_TO_IMPORT_CONFIGS["final"], ignore_global_vars=False
+    )
+
+    assert [file_path for file_path, _ in file_accountings] == [path]
+    assert file_accountings[0][1].total.calls_count
+
+
+def test_ffi_accounting_skips_undecodable_files(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "broken.py").write_bytes(b"# -*- coding: bogus -*-\ndef foo():\n    a = 1\n")
+    path: Final = tmp_path / "module.py"
+    path.write_text("def foo():\n    a = 1\n", encoding="utf-8")
+
+    file_accountings: Final = run_ffi_accounting(
+        [tmp_path], import_config=IMPORT_STYLES_TO_IMPORT_CONFIGS["final"], ignore_global_vars=False
+    )
+
+    assert [file_path for file_path, _ in file_accountings] == [path]
@@ -0,0 +1,63 @@
+import random
+from typing import Final
+
+import pytest
+
+from auto_typing_final import transformer
+from auto_typing_final.chunks import split_into_chunks
+from auto_typing_final.transform import ImportConfig
+from auto_typing_final.transformer import Transformer
+from tests.conftest import parse_md_test_cases
+
+CASES: Final = [
+    case
+    for file_name in ("function_vars.md", "global_vars_enabled.md", "syntax_and_scopes.md")
+    for case in parse_md_test_cases(file_name)
+]
+MODULE_LEVEL_SNIPPETS: Final = (
+    "import typing as t",
+    "from typing import Final",
+    "Final = 1",
+    "MY_CONSTANT = 1",
+    "@decorator\n@other_decorator(\n    1,\n)\ndef foo():\n    a = 1",
+    "if condition:\n    MY_CONSTANT = 1\nelse:\n    MY_CONSTANT = 2",
+    "def foo():\n    global MY_CONSTANT\n    MY_CONSTANT = 1",
+    "text = '''\nMY_CONSTANT = 1\n'''",
+)
+
+
+def test_split_into_chunks() -> None:
+    source: Final = (
+        "import os\n@decorator\ndef foo():\n    a = '''\nb = 1\n'''\nif a:\n    pass\nelse:\n    pass\n# comment\n"
+        "b = [\n1]\nc = 1 \\\n+ 2\n"
+    )
+    assert [source[start:end] for start, end in split_into_chunks(source, target_length=1) or []] == [
+        "import os\n",
+        "@decorator\ndef foo():\n    a = '''\nb = 1\n'''\n",
+        "if a:\n    pass\nelse:\n    pass\n# comment\n",
+        "b = [\n1]\n",
+        "c = 1 \\\n+ 2\n",
+    ]
+    assert split_into_chunks(source) == [(0, len(source))]
+
+
+@pytest.mark.parametrize("source", ["a = (\n", "a = 'b\n", "a = 1)\n", "a = 1\rb = 2\n"])
+def test_split_into_chunks_gives_up(source: str) -> None:
+    assert split_into_chunks(source, target_length=1) is None
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_chunked_analysis_matches_whole_module_analysis(
+    monkeypatch: pytest.MonkeyPatch, import_config: ImportConfig, ignore_global_vars: bool, seed: int
+) -> None:
+    generator: Final = random.Random(seed)  # noqa: S311
+    source: Final = "\n".join(
+        generator.choice((*CASES, *MODULE_LEVEL_SNIPPETS)) for _ in range(generator.randint(2, 20))
+    )
+    one_transformer: Final = Transformer(import_config=import_config, ignore_global_vars=ignore_global_vars)
+    expected: Final = one_transformer.transform(source)
+
+    monkeypatch.setattr(transformer, "CHUNKED_ANALYSIS_MIN_LENGTH", 0)
+    monkeypatch.setattr(transformer, "split_into_chunks", lambda source: split_into_chunks(source, target_length=1))
+    assert one_transformer.transform(source) == expected
+    assert one_transformer.has_changes(source) == any(expected.analysis.edits)
@@ -0,0 +1,50 @@
+import pathlib
+from typing import Final
+
+import pytest
+
+from auto_typing_final.config import ConfigError, FileLimits, FileLimitsFinder
+
+COMMAND_LINE_LIMITS: Final = FileLimits(max_file_size=100, timeout=1.0)
+
+
+def test_nearest_pyproject_sets_limits(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "pyproject.toml").write_text("[tool.auto-typing-final]\ntimeout = 5\n", encoding="utf-8")
+    (tmp_path / "generated" / "nested").mkdir(parents=True)
+    (tmp_path / "generated" / "pyproject.toml").write_text(
+        "[tool.auto-typing-final]\nmax-file-size = 1_000_000\n", encoding="utf-8"
+    )
+    (tmp_path / "other").mkdir()
+    (tmp_path / "other" / "pyproject.toml").write_text("[project]\nname = 'other'\n", encoding="utf-8")
+    finder: Final = FileLimitsFinder(command_line_limits=FileLimits())
+
+    assert finder.find(tmp_path / "module.py") == FileLimits(timeout=5)
+    assert finder.find(tmp_path / "generated" / "nested" / "module.py") == FileLimits(max_file_size=1_000_000)
+    assert finder.find(tmp_path / "generated" / "module.py") == FileLimits(max_file_size=1_000_000)
+    assert finder.find(tmp_path / "other" / "module.py") == FileLimits()
+
+
+def test_command_line_limits_override_pyproject(tmp_path: pathlib.Path) -> None:
+    (tmp_path / "pyproject.toml").write_text(
+        "[tool.auto-typing-final]\nmax-file-size = 1_000_000\ntimeout = 5\n", encoding="utf-8"
+    )
+
+    assert FileLimitsFinder(command_line_limits=COMMAND_LINE_LIMITS).find(tmp_path / "module.py") == COMMAND_LINE_LIMITS
+    assert FileLimitsFinder(command_line_limits=FileLimits(timeout=1.0)).find(tmp_path / "module.py") == FileLimits(
+        max_file_size=1_000_000, timeout=1.0
+    )
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "[tool.auto-typing-final]\ntimeout = 0\n",
+        "[tool.auto-typing-final]\nmax-file-size = true\n",
+        "[tool",
+        "tool = 1",
+    ],
+)
+def test_invalid_config(tmp_path: pathlib.Path, content: str) -> None:
+    (tmp_path / "pyproject.toml").write_text(content, encoding="utf-8")
+    with pytest.raises(ConfigError):
+        FileLimitsFinder(command_line_limits=COMMAND_LINE_LIMITS).find(tmp_path / "module.py")
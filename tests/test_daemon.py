@@ -0,0 +1,138 @@
+import pathlib
+import stat
+import sys
+import threading
+import time
+from collections.abc import Iterator
+from typing import Final
+
+import pytest
+
+from auto_typing_final import daemon
+from auto_typing_final.daemon import DaemonClient, DaemonError, serve
+from auto_typing_final.main import main
+from auto_typing_final.transform import IMPORT_STYLES_TO_IMPORT_CONFIGS
+from auto_typing_final.transformer import Transformer
+
+SOURCE: Final = "def foo():\n    a = 1\n"
+TRANSFORMED_SOURCE: Final = "from typing import Final\ndef foo():\n    a: Final = 1\n"
+START_TIMEOUT_SECONDS: Final = 10
+
+
+@pytest.fixture
+def socket_path(tmp_path: pathlib.Path) -> Iterator[pathlib.Path]:
+    path: Final = tmp_path / "daemon.sock"
+    thread: Final = threading.Thread(target=serve, args=(path,), kwargs={"idle_timeout": 10})
+    thread.start()
+    deadline: Final = time.monotonic() + START_TIMEOUT_SECONDS
+    while not (client := DaemonClient.connect(path)):
+        if time.monotonic() > deadline or not thread.is_alive():
+            pytest.fail(f"daemon did not start at {path}")
+        time.sleep(0.01)
+    client.close()
+    yield path
+    if client := DaemonClient.connect(path):
+        client.request({"method": "shutdown"})
+        client.close()
+    thread.join()
+    assert not path.exists()
+
+
+def test_daemon_transforms_and_caches(socket_path: pathlib.Path) -> None:
+    client: Final = DaemonClient.connect(socket_path)
+    assert client
+    for _ in range(2):
+        result = client.transform(SOURCE, import_style="final", ignore_global_vars=False)
+        assert result.new_source == TRANSFORMED_SOURCE
+        assert result.analysis.import_text == "from typing import Final"
+    assert client.request({"method": "status"})["cached_results_count"] == 1
+    with pytest.raises(DaemonError, match="invalid request"):
+        client.request({"method": "transform", "source": SOURCE, "import_style": "unknown"})
+    client.close()
+
+
+def test_cli_uses_daemon(
+    socket_path: pathlib.Path,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    (tmp_path / "module.py").write_text(SOURCE, encoding="utf-8")
+    monkeypatch.setattr(
+        sys, "argv", ["auto-typing-final", "--import-style", "final", "--daemon", str(socket_path), str(tmp_path)]
+    )
+
+    assert main() == 0
+
+    assert capsys.readouterr().out == "Fixed errors in 1 file.\n"
+    assert (tmp_path / "module.py").read_text(encoding="utf-8") == TRANSFORMED_SOURCE
+    status_client: Final = DaemonClient.connect(socket_path)
+    assert status_client
+    assert status_client.request({"method": "status"})["handled_requests_count"] == 2  # noqa: PLR2004
+    status_client.close()
+
+
+def test_daemon_stops_after_idle_timeout(tmp_path: pathlib.Path) -> None:
+    path: Final = tmp_path / "daemon.sock"
+    serve(path, idle_timeout=0.01)
+    assert not path.exists()
+
+
+def test_daemon_socket_is_private(socket_path: pathlib.Path) -> None:
+    assert stat.S_IMODE(socket_path.stat().st_mode) == 0o600  # noqa: PLR2004
+
+    socket_path.parent.chmod(0o777)
+    try:
+        assert DaemonClient.connect(socket_path) is None
+    finally:
+        socket_path.parent.chmod(0o700)
+    client: Final = DaemonClient.connect(socket_path)
+    assert client
+    client.close()
+
+
+def test_daemon_refuses_shared_directory(tmp_path: pathlib.Path) -> None:
+    tmp_path.chmod(0o777)
+    with pytest.raises(DaemonError, match="not writable by others"):
+        serve(tmp_path / "daemon.sock", idle_timeout=0.01)
+
+
+def test_daemon_of_other_version_is_not_used(
+    socket_path: pathlib.Path,
+    tmp_path: pathlib.Path,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    monkeypatch.setattr(daemon, "get_version", lambda: "other")
+    assert DaemonClient.connect(socket_path) is None
+    unchecked_client: Final = DaemonClient.connect(socket_path, is_version_checked=False)
+    assert unchecked_client
+    with pytest.raises(DaemonError, match="does not match client version other"):
+        unchecked_client.transform(SOURCE, import_style="final", ignore_global_vars=False)
+    unchecked_client.close()
+
+    (tmp_path / "module.py").write_text(SOURCE, encoding="utf-8")
+    monkeypatch.setattr(
+        sys, "argv", ["auto-typing-final", "--import-style", "final", "--daemon", str(socket_path), str(tmp_path)]
+    )
+    assert main() == 0
+    assert capsys.readouterr().out == "Fixed errors in 1 file.\n"
+    assert (tmp_path / "module.py").read_text(encoding="utf-8") == TRANSFORMED_SOURCE
+
+
+def test_daemon_results_cache_is_bounded_by_size(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    sources: Final = [f"def foo():\n    a = {'1' * length}\n" for length in range(1, 4)]
+    transformer: Final = Transformer(import_config=IMPORT_STYLES_TO_IMPORT_CONFIGS["final"], ignore_global_vars=False)
+    monkeypatch.setattr(daemon, "CACHE_MAX_BYTES", 2 * daemon.get_result_size(transformer.transform(sources[-1])))
+    server: Final = daemon.DaemonServer(tmp_path / "daemon.sock", idle_timeout=10)
+    try:
+        for source in sources:
+            server.handle_message(
+                {"method": "transform", "source": source, "import_style": "final", "ignore_global_vars": False}
+            )
+        status: Final = server.handle_message({"method": "status"})
+    finally:
+        server.server_close()
+
+    assert status["cached_results_count"] == 2  # noqa: PLR2004
+    assert status["cached_results_bytes"] <= daemon.CACHE_MAX_BYTES
@@ -0,0 +1,92 @@
+import random
+from difflib import unified_diff
+from typing import Final
+
+import pytest
+
+from auto_typing_final import IMPORT_STYLES_TO_IMPORT_CONFIGS, ImportConfig, Transformer, diff
+from auto_typing_final.diff import make_unified_diff
+from tests.conftest import parse_md_test_cases
+
+LONG_FUNCTION: Final = "def foo():\n" + "".join(f"    print({index})\n" for index in range(20))
+SOURCES: Final = [
+    "",
+    "def foo():\n    a = 1",
+    "def foo():\n    a = 1\r\n    b = 2\r\n",
+    "def foo():\n    a = 1\r    b = 2\n",
+    "import typing\n\n\ndef foo():\n    a = 'привет 😀'\n    a: typing.Final = 2\n",
+    "def foo():\n    a: Final[\n        int\n    ] = 1\n    a = 2\n    b: typing.Final[\n        int\n    ] = 3\n",
+    f"{LONG_FUNCTION}    a = 1\n{LONG_FUNCTION}    b = 2\n    print()\n    c = 3\n{LONG_FUNCTION}",
+    "#!/usr/bin/env python\n# -*- coding: latin-1 -*-\ndef foo():\n    a = 1\n",
+    "x = 1\ndef foo():\n    a = 1\n    b = 2\n\n\n\n\n\n\n    c = 3\n\n\n\n\n\n\n    d = 4\n",
+    *(
+        test_case
+        for file_name in ("function_vars.md", "global_vars_enabled.md", "syntax_and_scopes.md")
+        for test_case in parse_md_test_cases(file_name)
+    ),
+]
+
+REPEATED_LINES: Final = ("    a = 1\n", "    a: Final = 1\n", "    b = 1\n", "    print()\n", "\n")
+
+
+def _make_source_with_repeated_lines(seed: int) -> str:
+    random_: Final = random.Random(seed)  # noqa: S311
+    return "def foo():\n" + "".join(random_.choice(REPEATED_LINES) for _ in range(random_.randint(1, 15)))
+
+
+def _make_difflib_diff(source: str, new_source: str) -> str:
+    return "".join(
+        unified_diff(source.splitlines(keepends=True), new_source.splitlines(keepends=True), fromfile="x", tofile="x")
+    )
+
+
+@pytest.mark.parametrize("source", SOURCES)
+def test_diff_matches_difflib(source: str, import_config: ImportConfig, ignore_global_vars: bool) -> None:
+    result: Final = Transformer(import_config=import_config, ignore_global_vars=ignore_global_vars).transform(source)
+    assert make_unified_diff(source, result.new_source, result.analysis, "x") == _make_difflib_diff(
+        source, result.new_source
+    )
+
+
+# The same line being changed in one place and kept in another lets difflib align it differently from the edits
+@pytest.mark.parametrize("seed", range(200))
+def test_diff_with_repeated_lines_matches_difflib(seed: int, import_config: ImportConfig) -> None:
+    source: Final = _make_source_with_repeated_lines(seed)
+    result: Final = Transformer(import_config=import_config).transform(source)
+    assert make_unified_diff(source, result.new_source, result.analysis, "x") == _make_difflib_diff(
+        source, result.new_source
+    )
+
+
+# difflib doesn't anchor matches on lines that make up more than 1% of a file of 200 or more lines, such as blank lines
+@pytest.mark.parametrize("blank_lines_count", [1, 2, 3])
+def test_diff_of_long_file_with_blank_lines_matches_difflib(
+    blank_lines_count: int, import_config: ImportConfig
+) -> None:
+    blank_lines: Final = "\n" * blank_lines_count
+    source: Final = "".join(
+        f"def foo_{index}():\n    a = {index}\n{blank_lines}    b = [{index}]\n{blank_lines}"
+        f"    print(a, b)\n{blank_lines}    c = {index}\n\n\n"
+        for index in range(30)
+    )
+    assert source.count("\n") > 200  # noqa: PLR2004
+    result: Final = Transformer(import_config=import_config).transform(source)
+    assert make_unified_diff(source, result.new_source, result.analysis, "x") == _make_difflib_diff(
+        source, result.new_source
+    )
+
+
+@pytest.mark.parametrize("block_length", [1, 2, 5])
+def test_diff_of_non_ascii_source_matches_difflib(monkeypatch: pytest.MonkeyPatch, block_length: int) -> None:
+    monkeypatch.setattr(diff, "ENCODED_BLOCK_LENGTH", block_length)
+    source: Final = "def foo():\n    ё = 'привет 😀'\n    b: 'é' = ё\n    print('😀')\n    c = 1\n"
+    result: Final = Transformer(import_config=IMPORT_STYLES_TO_IMPORT_CONFIGS["final"]).transform(source)
+    assert make_unified_diff(source, result.new_source, result.analysis, "x") == _make_difflib_diff(
+        source, result.new_source
+    )
+
+
+def test_diff_is_empty_without_changes() -> None:
+    source: Final = "from typing import Final\ndef foo():\n    a: Final = 1\n"
+    result: Final = Transformer(import_config=IMPORT_STYLES_TO_IMPORT_CONFIGS["final"]).transform(source)
+    assert not make_unified_diff(source, result.new_source, result.analysis, "x")
@@ -0,0 +1,147 @@
+import pathlib
+from typing import Final
+
+import pytest
+
+from auto_typing_final.discovery import DEFAULT_EXCLUDES, Shard, find_all_source_files, take_shard
+
+
+def _make_tree(root: pathlib.Path, files: list[str]) -> None:
+    for one_file in files:
+        path = root / one_file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("", encoding="utf-8")
+
+
+def _find(
+    root: pathlib.Path, paths: list[pathlib.Path], *, exclude: list[str] | None = None, respect_gitignore: bool = True
+) -> list[str]:
+    return [
+        path.relative_to(root).as_posix()
+        for path in find_all_source_files(
+            paths, exclude=DEFAULT_EXCLUDES if exclude is None else exclude, respect_gitignore=respect_gitignore
+        )
+    ]
+
+
+def test_default_excludes_and_hidden_directories(tmp_path: pathlib.Path) -> None:
+    _make_tree(
+        tmp_path,
+        [
+            "a.py",
+            "b.pyi",
+            "c.txt",
+            "pkg/d.py",
+            ".hidden/e.py",
+            "venv/lib/site-packages/f.py",
+            "node_modules/g.py",
+            "build/h.py",
+        ],
+    )
+    assert _find(tmp_path, [tmp_path]) == ["a.py", "b.pyi", "pkg/d.py"]
+
+
+@pytest.mark.parametrize(
+    ("exclude", "expected"),
+    [
+        (["pkg"], ["a.py", "build/h.py"]),
+        (["*.py"], []),
+        (["pkg/inner"], ["a.py", "build/h.py", "pkg/d.py"]),
+        ([], ["a.py", "build/h.py", "pkg/d.py", "pkg/inner/e.py"]),
+    ],
+)
+def test_exclude(tmp_path: pathlib.Path, exclude: list[str], expected: list[str]) -> None:
+    _make_tree(tmp_path, ["a.py", "pkg/d.py", "pkg/inner/e.py", "build/h.py"])
+    assert _find(tmp_path, [tmp_path], exclude=exclude) == expected
+
+
+def test_gitignore(tmp_path: pathlib.Path) -> None:
+    (tmp_path / ".git").mkdir()
+    _make_tree(tmp_path, ["a.py", "generated/b.py", "pkg/c.py", "pkg/c_pb2.py", "pkg/keep_pb2.py", "pkg/sub/d.py"])
+    (tmp_path / ".gitignore").write_text("generated/\n*_pb2.py\n!keep_pb2.py\n", encoding="utf-8")
+    (tmp_path / "pkg" / ".gitignore").write_text("/sub\n", encoding="utf-8")
+
+    assert _find(tmp_path, [tmp_path]) == ["a.py", "pkg/c.py", "pkg/keep_pb2.py"]
+    assert _find(tmp_path, [tmp_path / "pkg"]) == ["pkg/c.py", "pkg/keep_pb2.py"]
+    assert _find(tmp_path, [tmp_path], respect_gitignore=False) == [
+        "a.py",
+        "generated/b.py",
+        "pkg/c.py",
+        "pkg/c_pb2.py",
+        "pkg/keep_pb2.py",
+        "pkg/sub/d.py",
+    ]
+
+
+def test_overlapping_paths_are_deduplicated(tmp_path: pathlib.Path) -> None:
+    _make_tree(tmp_path, ["a.py", "src/b.py"])
+    (tmp_path / "zz-link").symlink_to(tmp_path / "src")
+    expected: Final = ["a.py", "src/b.py"]
+
+    assert _find(tmp_path, [tmp_path, tmp_path / "src", tmp_path / "src" / "b.py"]) == expected
+    assert sorted(_find(tmp_path, [tmp_path / "src", tmp_path])) == expected
+
+
+def test_symlinked_files_are_deduplicated(tmp_path: pathlib.Path) -> None:
+    _make_tree(tmp_path, ["src/a.py", "src/b.py", "other/c.py"])
+    (tmp_path / "src" / "link.py").symlink_to(tmp_path / "src" / "b.py")
+    (tmp_path / "other" / "link.py").symlink_to(tmp_path / "src" / "a.py")
+    (tmp_path / "other" / "broken.py").symlink_to(tmp_path / "missing.py")
+
+    assert _find(tmp_path, [tmp_path / "src", tmp_path / "other"]) == ["src/a.py", "src/b.py", "other/c.py"]
+    assert _find(tmp_path, [tmp_path / "other", tmp_path / "src"]) == ["other/c.py", "other/link.py", "src/b.py"]
+
+
+def test_explicit_files_are_kept(tmp_path: pathlib.Path) -> None:
+    _make_tree(tmp_path, ["build/a.py", "script"])
+    assert _find(tmp_path, [tmp_path / "build" / "a.py", tmp_path / "script"]) == ["build/a.py", "script"]
+
+
+@pytest.mark.parametrize("balance_by_size", [True, False])
+def test_shards_partition_files(tmp_path: pathlib.Path, balance_by_size: bool) -> None:
+    files: Final = [f"module_{index}.py" for index in range(50)]
+    for index, one_file in enumerate(files):
+        (tmp_path / one_file).write_text("a = 1\n" * index, encoding="utf-8")
+    all_paths: Final = sorted(find_all_source_files([tmp_path]))
+
+    shards: Final = [
+        list(take_shard(all_paths, Shard(index=index, count=3), balance_by_size=balance_by_size))
+        for index in range(1, 4)
+    ]
+
+    assert sorted(path for shard in shards for path in shard) == all_paths
+    assert all(shards)
+    assert sorted(take_shard(reversed(all_paths), Shard(index=2, count=3), balance_by_size=balance_by_size)) == sorted(
+        shards[1]
+    )
+
+
+@pytest.mark.parametrize("is_repository", [True, False])
+@pytest.mark.parametrize("balance_by_size", [True, False])
+def test_shards_agree_across_roots(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, balance_by_size: bool, is_repository: bool
+) -> None:
+    _make_tree(tmp_path, [f"package/module_{index}.py" for index in range(20)])
+    if is_repository:
+        (tmp_path / ".git").mkdir()
+
+    def take_own_shard(directory: pathlib.Path, root: pathlib.Path) -> list[pathlib.Path]:
+        monkeypatch.chdir(directory)
+        paths: Final = find_all_source_files([root])
+        return sorted(
+            path.resolve() for path in take_shard(paths, Shard(index=1, count=3), balance_by_size=balance_by_size)
+        )
+
+    shard: Final = take_own_shard(tmp_path, pathlib.Path())
+    assert shard
+    assert take_own_shard(tmp_path, tmp_path) == shard
+    # Outside of a repository paths are relative to the current directory, so only the way it is passed may differ
+    if is_repository:
+        assert take_own_shard(tmp_path.parent, tmp_path) == shard
+        assert take_own_shard(tmp_path / "package", pathlib.Path("..")) == shard
+
+
+@pytest.mark.parametrize("value", ["0/3", "4/3", "1", "a/b", "1/0"])
+def test_invalid_shard(value: str) -> None:
+    with pytest.raises(ValueError, match="INDEX/COUNT"):
+        Shard.parse(value)
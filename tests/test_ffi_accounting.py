@@ -0,0 +1,34 @@
+from typing import Final
+
+from ast_grep_py import SgRoot
+
+from auto_typing_final.ffi_accounting import CallStats, FfiCallAccounting
+
+
+def _count_children(source: str) -> int:
+    return len(SgRoot(source, "python").root().children())
+
+
+def test_counts_calls_by_calling_function() -> None:
+    accounting: Final = FfiCallAccounting()
+    with accounting.record():
+        _count_children("a = 1\nb = 2\n")
+    _count_children("c = 3\n")
+
+    assert {key: stats.calls_count for key, stats in accounting.calls.items()} == {
+        (f"{__name__}._count_children", "root"): 1,
+        (f"{__name__}._count_children", "children"): 1,
+    }
+    assert accounting.total.calls_count == 2  # noqa: PLR2004
+
+
+def test_add_merges_stats() -> None:
+    first: Final = FfiCallAccounting(calls={("f", "kind"): CallStats(calls_count=1, seconds=0.5)})
+    second: Final = FfiCallAccounting(
+        calls={("f", "kind"): CallStats(calls_count=2, seconds=1), ("g", "text"): CallStats(calls_count=1)}
+    )
+    first.add(second)
+    assert first.calls == {
+        ("f", "kind"): CallStats(calls_count=3, seconds=1.5),
+        ("g", "text"): CallStats(calls_count=1),
+    }
@@ -0,0 +1,104 @@
+import pathlib
+from typing import Final
+
+import pytest
+
+from auto_typing_final import files
+from auto_typing_final.files import SourceDecodeError, read_source_file, write_source_file
+from auto_typing_final.main import main
+
+SOURCE: Final = "def foo():\r\n    a = 'é'\r\n"
+TRANSFORMED_SOURCE: Final = "from typing import Final\r\ndef foo():\r\n    a: Final = 'é'\r\n"
+FILE_MODE: Final = 0o640
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_read_source_file_keeps_newlines(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, use_mmap: bool
+) -> None:
+    if use_mmap:
+        monkeypatch.setattr(files, "MMAP_THRESHOLD_BYTES", 1)
+    path: Final = tmp_path / "module.py"
+    path.write_bytes(SOURCE.encode())
+
+    source_file: Final = read_source_file(path)
+
+    assert source_file.text == SOURCE
+    assert source_file.encoding == "utf-8"
+
+
+@pytest.mark.parametrize(
+    ("content", "encoding"),
+    [
+        (b"# -*- coding: latin-1 -*-\ndef foo():\n    a = '\xe9'\n", "iso-8859-1"),
+        (b"\xef\xbb\xbfdef foo():\n    a = 1\n", "utf-8-sig"),
+    ],
+)
+def test_round_trip_keeps_encoding(tmp_path: pathlib.Path, content: bytes, encoding: str) -> None:
+    path: Final = tmp_path / "module.py"
+    path.write_bytes(content)
+
+    source_file: Final = read_source_file(path)
+    assert source_file.encoding == encoding
+    write_source_file(path, source_file.text, encoding=source_file.encoding)
+
+    assert path.read_bytes() == content
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+@pytest.mark.parametrize(
+    "content",
+    [
+        b"# -*- coding: bogus -*-\na = 1\n",
+        b"\xef\xbb\xbf# -*- coding: latin-1 -*-\na = 1\n",
+        b"a = '\xe9'\n",
+    ],
+)
+def test_read_source_file_with_wrong_encoding(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, content: bytes, use_mmap: bool
+) -> None:
+    if use_mmap:
+        monkeypatch.setattr(files, "MMAP_THRESHOLD_BYTES", 1)
+    path: Final = tmp_path / "module.py"
+    path.write_bytes(content)
+
+    with pytest.raises(SourceDecodeError):
+        read_source_file(path)
+
+
+def test_write_source_file_replaces_symlink_target(tmp_path: pathlib.Path) -> None:
+    target: Final = tmp_path / "module.py"
+    target.write_text("a = 1\n", encoding="utf-8")
+    target.chmod(FILE_MODE)
+    link: Final = tmp_path / "link.py"
+    link.symlink_to(target)
+
+    write_source_file(link, "a = 2\n", encoding="utf-8")
+
+    assert link.is_symlink()
+    assert target.read_text(encoding="utf-8") == "a = 2\n"
+    assert target.stat().st_mode & 0o777 == FILE_MODE
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["link.py", "module.py"]
+
+
+def test_cli_keeps_crlf(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    path: Final = tmp_path / "module.py"
+    path.write_bytes(SOURCE.encode())
+    monkeypatch.setattr("sys.argv", ["auto-typing-final", "--import-style", "final", str(path)])
+
+    assert main() == 0
+    assert path.read_bytes() == TRANSFORMED_SOURCE.encode()
+
+
+# The cookie must stay on one of the first two lines, or the file written back in latin-1 doesn't compile
+def test_cli_keeps_coding_cookie_after_shebang(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    path: Final = tmp_path / "module.py"
+    path.write_bytes(b"#!/usr/bin/env python\n# -*- coding: latin-1 -*-\ndef foo():\n    a = '\xe9'\n")
+    monkeypatch.setattr("sys.argv", ["auto-typing-final", "--import-style", "final", str(path)])
+
+    assert main() == 0
+    assert path.read_bytes() == (
+        b"#!/usr/bin/env python\n# -*- coding: latin-1 -*-\nfrom typing import Final\n"
+        b"def foo():\n    a: Final = '\xe9'\n"
+    )
+    compile(path.read_bytes(), str(path), "exec")
@@ -0,0 +1,73 @@
+import pathlib
+import subprocess  # noqa: S404
+from typing import Final
+
+import pytest
+
+from auto_typing_final.git import GitBlobCache, list_changed_files, select_changed_source_files
+
+
+def _git(*args: str) -> None:
+    subprocess.run(["git", *args], check=True)  # noqa: S603, S607
+
+
+@pytest.fixture
+def repository(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> pathlib.Path:
+    monkeypatch.chdir(tmp_path)
+    _git("init", "-q")
+    _git("config", "user.email", "test@example.com")
+    _git("config", "user.name", "test")
+    for one_file in ("committed.py", "modified.py", "staged.py", "pkg/inner.py", "notes.txt"):
+        (tmp_path / one_file).parent.mkdir(exist_ok=True)
+        (tmp_path / one_file).write_text("a = 1\n", encoding="utf-8")
+    _git("add", ".")
+    _git("commit", "-q", "-m", "initial")
+    return tmp_path
+
+
+def test_list_changed_files(repository: pathlib.Path) -> None:
+    (repository / "modified.py").write_text("a = 2\n", encoding="utf-8")
+    (repository / "staged.py").write_text("a = 2\n", encoding="utf-8")
+    (repository / "pkg" / "inner.py").write_text("a = 2\n", encoding="utf-8")
+    (repository / "untracked.py").write_text("a = 2\n", encoding="utf-8")
+    (repository / "notes.txt").write_text("changed\n", encoding="utf-8")
+    _git("add", "staged.py")
+
+    changed_since_head: Final = list_changed_files(since="HEAD", staged=False)
+    assert [str(path) for path in select_changed_source_files(changed_since_head, [pathlib.Path()], exclude=[])] == [
+        "modified.py",
+        "pkg/inner.py",
+        "staged.py",
+        "untracked.py",
+    ]
+    assert [
+        str(path) for path in select_changed_source_files(changed_since_head, [pathlib.Path("pkg")], exclude=[])
+    ] == ["pkg/inner.py"]
+    assert [
+        str(path) for path in select_changed_source_files(changed_since_head, [pathlib.Path()], exclude=["pkg"])
+    ] == [
+        "modified.py",
+        "staged.py",
+        "untracked.py",
+    ]
+    assert [
+        str(path)
+        for path in select_changed_source_files(
+            list_changed_files(since=None, staged=True), [pathlib.Path()], exclude=[]
+        )
+    ] == ["staged.py"]
+
+
+def test_git_blob_cache(repository: pathlib.Path) -> None:
+    cache: Final = GitBlobCache.load(config_key="final:False")
+    assert not cache.is_known_clean(pathlib.Path("committed.py"))
+    cache.mark_clean(pathlib.Path("committed.py"))
+    cache.mark_clean(pathlib.Path("modified.py"))
+    cache.save()
+
+    (repository / "modified.py").write_text("a = 2\n", encoding="utf-8")
+    reloaded_cache: Final = GitBlobCache.load(config_key="final:False")
+    assert reloaded_cache.is_known_clean(pathlib.Path("committed.py"))
+    assert reloaded_cache.is_known_clean(repository / "staged.py")
+    assert not reloaded_cache.is_known_clean(pathlib.Path("modified.py"))
+    assert not GitBlobCache.load(config_key="final:True").is_known_clean(pathlib.Path("committed.py"))
@@ -0,0 +1,56 @@
+from typing import Final
+
+from auto_typing_final.lru import CacheStats, LruCache
+
+
+def _make_cache(*, max_entries: int = 10, max_bytes: int = 100) -> LruCache[str, str]:
+    return LruCache(max_entries=max_entries, max_bytes=max_bytes, get_size=len)
+
+
+def test_evicts_least_recently_used_entry() -> None:
+    cache: Final = _make_cache(max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("a") == "1"
+    cache.put("c", "3")
+
+    assert cache.get("b") is None
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.stats == CacheStats(entries_count=2, resident_bytes=2, hits_count=1, misses_count=1, evictions_count=1)
+
+
+def test_evicts_by_size() -> None:
+    cache: Final = _make_cache(max_bytes=10)
+    cache.put("a", "x" * 4)
+    cache.put("b", "x" * 4)
+    cache.put("c", "x" * 4)
+    assert list(cache.entries) == ["b", "c"]
+    assert cache.resident_bytes == 8  # noqa: PLR2004
+
+    cache.put("huge", "x" * 11)
+    assert "huge" not in cache.entries
+    assert list(cache.entries) == ["b", "c"]
+
+
+def test_replaces_and_pops_entries() -> None:
+    cache: Final = _make_cache()
+    cache.put("a", "1")
+    cache.put("a", "22")
+    assert cache.resident_bytes == len("22")
+
+    cache.pop("a")
+    cache.pop("missing")
+    assert not cache.entries
+    assert not cache.resident_bytes
+
+
+def test_stale_entry_is_a_miss() -> None:
+    cache: Final = _make_cache()
+    cache.put("a", "old")
+
+    assert cache.get("a", lambda value: value == "new") is None
+    assert not cache.entries
+    assert cache.stats.hit_rate == 0
+    cache.put("a", "new")
+    assert cache.get("a", lambda value: value == "new") == "new"
+    assert cache.stats.hit_rate == 0.5  # noqa: PLR2004
@@ -0,0 +1,268 @@
+import asyncio
+import json
+import pathlib
+import threading
+from collections.abc import Iterator
+from typing import Final
+
+import lsprotocol.types as lsp
+import pytest
+
+from auto_typing_final.lsp import (
+    CustomLanguageServer,
+    DocumentAnalysis,
+    Service,
+    hash_source,
+    load_snapshot,
+    rediagnose,
+    save_snapshot,
+    workspace_did_change_configuration,
+)
+
+LS_NAME: Final = "auto-typing-final"
+VERSION: Final = "1.0"
+SETTINGS: Final = {"auto-typing-final": {"import-style": "final", "ignore-global-vars": False}}
+OTHER_SETTINGS: Final = {"auto-typing-final": {"import-style": "typing-final", "ignore-global-vars": False}}
+URI: Final = "file:///module.py"
+SOURCE: Final = "def foo():\n    a = 1\n"
+
+
+def _make_service() -> Service:
+    service: Final = Service.try_from_settings(ls_name=LS_NAME, settings=SETTINGS)
+    assert service
+    return service
+
+
+@pytest.fixture
+def server() -> Iterator[CustomLanguageServer]:
+    server: Final = CustomLanguageServer(name=LS_NAME, version=VERSION)
+    server.lsp.lsp_initialize(lsp.InitializeParams(capabilities=lsp.ClientCapabilities()))
+    yield server
+    server.rediagnosis_executor.shutdown()
+    server.loop.close()
+
+
+def test_initialize_reports_version_set_later() -> None:
+    server: Final = CustomLanguageServer(name=LS_NAME, version="")
+    server.set_version(VERSION)
+
+    result: Final = server.lsp.lsp_initialize(lsp.InitializeParams(capabilities=lsp.ClientCapabilities()))
+
+    assert result.server_info == lsp.InitializeResultServerInfoType(name=LS_NAME, version=VERSION)
+    assert server.version == VERSION
+    server.rediagnosis_executor.shutdown()
+    server.loop.close()
+
+
+def test_snapshot_is_saved_and_loaded(tmp_path: pathlib.Path) -> None:
+    path: Final = tmp_path / "cache" / "snapshot.json"
+    service: Final = _make_service()
+    analysis: Final = service.analyze_document(URI, SOURCE)
+    assert analysis.diagnostics
+
+    save_snapshot(path, service, VERSION)
+
+    assert [one_path.name for one_path in path.parent.iterdir()] == [path.name]
+    loaded_service: Final = load_snapshot(path, LS_NAME, VERSION)
+    assert loaded_service
+    assert loaded_service.settings == SETTINGS
+    assert list(loaded_service.snapshot_analyses) == [hash_source(SOURCE)]
+    assert loaded_service.analyze_document(URI, SOURCE) == analysis
+
+
+def test_snapshot_analysis_is_used_once(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    path: Final = tmp_path / "snapshot.json"
+    service: Final = _make_service()
+    analysis: Final = service.analyze_document(URI, SOURCE)
+    save_snapshot(path, service, VERSION)
+    loaded_service: Final = load_snapshot(path, LS_NAME, VERSION)
+    assert loaded_service
+    analyzed_sources: Final[list[str]] = []
+
+    def analyze_source(_: Service, source: str) -> DocumentAnalysis:
+        analyzed_sources.append(source)
+        return analysis
+
+    monkeypatch.setattr(Service, "analyze_source", analyze_source)
+
+    assert loaded_service.analyze_document(URI, SOURCE) == analysis
+    assert not analyzed_sources
+    assert not loaded_service.snapshot_analyses
+    loaded_service.analyze_document("file:///copy.py", SOURCE)
+    assert analyzed_sources == [SOURCE]
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "",
+        "{",
+        '{"version": "1.0", "settings": ',
+        "[]",
+        json.dumps({"version": "0.9", "settings": SETTINGS, "documents": {}}),
+        json.dumps({"version": VERSION, "settings": {"auto-typing-final": {}}, "documents": {}}),
+        json.dumps({"version": VERSION, "settings": SETTINGS, "documents": []}),
+    ],
+)
+def test_invalid_snapshot_is_not_loaded(tmp_path: pathlib.Path, content: str) -> None:
+    path: Final = tmp_path / "snapshot.json"
+    path.write_text(content, encoding="utf-8")
+    assert load_snapshot(path, LS_NAME, VERSION) is None
+
+
+def test_snapshot_of_other_version_is_not_loaded(tmp_path: pathlib.Path) -> None:
+    path: Final = tmp_path / "snapshot.json"
+    save_snapshot(path, _make_service(), VERSION)
+    assert load_snapshot(path, LS_NAME, "2.0") is None
+    assert load_snapshot(tmp_path / "missing.json", LS_NAME, VERSION) is None
+
+
+@pytest.mark.parametrize(
+    "raw_analysis",
+    [
+        "not an object",
+        {"diagnostics": []},
+        {"diagnostics": [{"range": 1}], "fix_all_text_edits": []},
+        {"diagnostics": [], "fix_all_text_edits": [{"new_text": 1}]},
+    ],
+)
+def test_corrupt_snapshot_analysis_is_made_again(tmp_path: pathlib.Path, raw_analysis: object) -> None:
+    path: Final = tmp_path / "snapshot.json"
+    path.write_text(
+        json.dumps({"version": VERSION, "settings": SETTINGS, "documents": {hash_source(SOURCE): raw_analysis}}),
+        encoding="utf-8",
+    )
+    loaded_service: Final = load_snapshot(path, LS_NAME, VERSION)
+    assert loaded_service
+    assert loaded_service.analyze_document(URI, SOURCE) == _make_service().analyze_source(SOURCE)
+
+
+def test_same_settings_keep_snapshot_service(server: CustomLanguageServer) -> None:
+    service: Final = _make_service()
+    server.service = service
+
+    workspace_did_change_configuration(server, lsp.DidChangeConfigurationParams(settings=SETTINGS))
+    assert server.service is service
+
+    workspace_did_change_configuration(server, lsp.DidChangeConfigurationParams(settings=OTHER_SETTINGS))
+    assert server.service is not service
+    assert server.service
+    assert server.service.settings == OTHER_SETTINGS
+
+
+def _open_documents(server: CustomLanguageServer, uris_to_sources: dict[str, str]) -> None:
+    for uri, source in uris_to_sources.items():
+        server.workspace.put_text_document(lsp.TextDocumentItem(uri=uri, language_id="python", version=1, text=source))
+
+
+def _record_publications(server: CustomLanguageServer, monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    published_uris: Final[list[str]] = []
+    monkeypatch.setattr(server, "publish_diagnostics", lambda uri, diagnostics: published_uris.append(uri))
+    return published_uris
+
+
+# The pass runs on the single rediagnosis thread, then its results are published by the event loop
+def _finish_rediagnosis(server: CustomLanguageServer) -> None:
+    server.rediagnosis_executor.submit(lambda: None).result()
+    server.loop.run_until_complete(asyncio.sleep(0))
+
+
+def test_rediagnosis_starts_with_recent_documents(
+    server: CustomLanguageServer, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _open_documents(server, {"file:///a.py": SOURCE, "file:///b.py": SOURCE, "file:///c.py": SOURCE})
+    server.service = _make_service()
+    server.service.analyze_document("file:///c.py", SOURCE)
+    server.service.analyze_document("file:///a.py", SOURCE)
+    published_uris: Final = _record_publications(server, monkeypatch)
+
+    workspace_did_change_configuration(server, lsp.DidChangeConfigurationParams(settings=OTHER_SETTINGS))
+    _finish_rediagnosis(server)
+
+    assert published_uris == ["file:///a.py", "file:///c.py", "file:///b.py"]
+    assert list(server.service.document_cache.entries) == published_uris
+
+
+def test_new_configuration_cancels_rediagnosis(server: CustomLanguageServer, monkeypatch: pytest.MonkeyPatch) -> None:
+    _open_documents(server, {"file:///a.py": SOURCE, "file:///b.py": SOURCE})
+    server.service = _make_service()
+    published_uris: Final = _record_publications(server, monkeypatch)
+    analyzed_import_styles: Final[list[str]] = []
+    is_first_analysis_started: Final = threading.Event()
+    is_first_analysis_released: Final = threading.Event()
+    analyze_source: Final = Service.analyze_source
+
+    def analyze_source_slowly(service: Service, source: str) -> DocumentAnalysis:
+        analyzed_import_styles.append(service.settings["auto-typing-final"]["import-style"])
+        is_first_analysis_started.set()
+        is_first_analysis_released.wait()
+        return analyze_source(service, source)
+
+    monkeypatch.setattr(Service, "analyze_source", analyze_source_slowly)
+
+    workspace_did_change_configuration(server, lsp.DidChangeConfigurationParams(settings=OTHER_SETTINGS))
+    is_first_analysis_started.wait()
+    workspace_did_change_configuration(server, lsp.DidChangeConfigurationParams(settings=SETTINGS))
+    is_first_analysis_released.set()
+    _finish_rediagnosis(server)
+
+    assert analyzed_import_styles == ["typing-final", "final", "final"]
+    assert published_uris == ["file:///a.py", "file:///b.py"]
+    assert server.service.settings == SETTINGS
+
+
+def test_rediagnosis_drops_results_of_closed_and_edited_documents(
+    server: CustomLanguageServer, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    _open_documents(server, {"file:///closed.py": SOURCE, "file:///edited.py": SOURCE, "file:///kept.py": SOURCE})
+    service: Final = _make_service()
+    server.service = service
+    published_uris: Final = _record_publications(server, monkeypatch)
+
+    rediagnose(
+        server,
+        service,
+        [(uri, SOURCE) for uri in ("file:///closed.py", "file:///edited.py", "file:///kept.py")],
+        threading.Event(),
+    )
+    server.workspace.remove_text_document("file:///closed.py")
+    server.workspace.remove_text_document("file:///edited.py")
+    _open_documents(server, {"file:///edited.py": "a = 1\n"})
+    server.loop.run_until_complete(asyncio.sleep(0))
+
+    assert published_uris == ["file:///kept.py"]
+    assert list(service.document_cache.entries) == ["file:///kept.py"]
+
+
+def test_rediagnosis_continues_after_error(server: CustomLanguageServer, monkeypatch: pytest.MonkeyPatch) -> None:
+    _open_documents(server, {"file:///broken.py": "broken", "file:///module.py": SOURCE})
+    service: Final = _make_service()
+    server.service = service
+    published_uris: Final = _record_publications(server, monkeypatch)
+    messages: Final[list[str]] = []
+    monkeypatch.setattr(server, "show_message_log", messages.append)
+    analyze_source: Final = Service.analyze_source
+
+    def analyze_source_or_fail(service: Service, source: str) -> DocumentAnalysis:
+        if source == "broken":
+            raise ValueError(source)
+        return analyze_source(service, source)
+
+    monkeypatch.setattr(Service, "analyze_source", analyze_source_or_fail)
+
+    rediagnose(server, service, [("file:///broken.py", "broken"), ("file:///module.py", SOURCE)], threading.Event())
+    server.loop.run_until_complete(asyncio.sleep(0))
+
+    assert messages == ["cannot analyze file:///broken.py: ValueError('broken')"]
+    assert published_uris == ["file:///module.py"]
+
+    server.loop.close()
+    rediagnose(server, service, [("file:///module.py", SOURCE)], threading.Event())
+
+
+def test_import_edit_goes_after_coding_cookie() -> None:
+    analysis: Final = _make_service().analyze_source(f"#!/usr/bin/env python\n# coding: latin-1\n{SOURCE}")
+    import_edits: Final = [
+        edit for edit in analysis.fix_all_text_edits if edit.new_text == "from typing import Final\n"
+    ]
+    assert [edit.range.start for edit in import_edits] == [lsp.Position(line=2, character=0)]
@@ -0,0 +1,65 @@
+import json
+import pathlib
+import shlex
+import sys
+from typing import Final
+
+import pytest
+
+from auto_typing_final.lsp_bench import lsp_bench_main, make_typing_session
+
+SERVER_COMMAND: Final = shlex.join(
+    [sys.executable, "-c", "from auto_typing_final.lsp import LSP_SERVER; LSP_SERVER.start_io()"]
+)
+
+
+def test_make_typing_session() -> None:
+    steps: Final = make_typing_session("a = 1\nb = 2", keystrokes_count=4, code_action_interval=3)
+
+    assert steps == [
+        {"type": "change", "range": {"start": position, "end": position}, "text": text}
+        for position, text in (
+            ({"line": 1, "character": 5}, "\n"),
+            ({"line": 2, "character": 0}, "\n"),
+            ({"line": 3, "character": 0}, "d"),
+        )
+    ] + [
+        {"type": "code_action"},
+        {
+            "type": "change",
+            "range": {"start": {"line": 3, "character": 1}, "end": {"line": 3, "character": 1}},
+            "text": "e",
+        },
+    ]
+
+
+def test_lsp_bench_main_replays_session(tmp_path: pathlib.Path, capsys: pytest.CaptureFixture[str]) -> None:
+    path: Final = tmp_path / "module.py"
+    path.write_text("def foo():\n    a = 1\n", encoding="utf-8")
+    session_path: Final = tmp_path / "session.json"
+
+    assert (
+        lsp_bench_main(
+            [
+                str(path),
+                "--keystrokes",
+                "6",
+                "--code-action-interval",
+                "3",
+                "--server-command",
+                SERVER_COMMAND,
+                "--save-session",
+                str(session_path),
+            ]
+        )
+        == 0
+    )
+
+    output: Final = capsys.readouterr().out
+    assert "keystrokes: 6, code actions: 2, fix all resolves: 2" in output
+    for line_start in ("keystroke → diagnostics", "publishDiagnostics size", "server RSS"):
+        assert f"\n{line_start}" in output
+    assert len(json.loads(session_path.read_text(encoding="utf-8"))) == 8  # noqa: PLR2004
+
+    assert lsp_bench_main([str(path), "--session", str(session_path), "--server-command", SERVER_COMMAND]) == 0
+    assert "keystrokes: 6, code actions: 2" in capsys.readouterr().out
@@ -0,0 +1,266 @@
+import io
+import json
+import pathlib
+import sys
+from typing import Final
+
+import pytest
+
+from auto_typing_final.main import main
+
+SOURCE: Final = "def foo():\n    a = 1\n"
+TRANSFORMED_SOURCE: Final = "from typing import Final\ndef foo():\n    a: Final = 1\n"
+
+
+def _run_main(monkeypatch: pytest.MonkeyPatch, *args: str, stdin: str = "") -> int:
+    monkeypatch.setattr(sys, "argv", ["auto-typing-final", "--import-style", "final", *args])
+    monkeypatch.setattr(sys, "stdin", io.TextIOWrapper(io.BytesIO(stdin.encode()), encoding="utf-8"))
+    return main()
+
+
+def test_stdin_to_stdout(monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    assert _run_main(monkeypatch, "-", stdin=SOURCE) == 0
+    assert capsys.readouterr().out == TRANSFORMED_SOURCE
+
+
+def test_stdin_check(monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    assert _run_main(monkeypatch, "--check", "--stdin-filename", "module.py", stdin=SOURCE) == 1
+    assert capsys.readouterr().out.startswith("--- module.py\n+++ module.py\n")
+
+    assert _run_main(monkeypatch, "--check", "--stdin-filename", "module.py", stdin=TRANSFORMED_SOURCE) == 0
+    assert not capsys.readouterr().out
+
+
+def test_stdin_with_wrong_encoding_is_kept(
+    monkeypatch: pytest.MonkeyPatch, capsysbinary: pytest.CaptureFixture[bytes]
+) -> None:
+    source: Final = "# -*- coding: bogus -*-\n" + SOURCE
+    assert _run_main(monkeypatch, "-", stdin=source) == 0
+    output: Final = capsysbinary.readouterr()
+    assert output.out == source.encode()
+    assert output.err == b"-: skipped, cannot decode: unknown encoding: bogus\n"
+
+
+def test_stdin_filename_excluded(monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    assert _run_main(monkeypatch, "--stdin-filename", "build/module.py", stdin=SOURCE) == 0
+    assert capsys.readouterr().out == SOURCE
+
+
+def test_stdin_filename_is_matched_inside_project(
+    monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str], tmp_path: pathlib.Path
+) -> None:
+    project: Final = tmp_path / ".hidden" / "build" / "project"
+    project.mkdir(parents=True)
+    monkeypatch.chdir(project)
+    assert _run_main(monkeypatch, "--stdin-filename", str(project / "module.py"), stdin=SOURCE) == 0
+    assert capsys.readouterr().out == TRANSFORMED_SOURCE
+
+    (project / ".git").mkdir()
+    monkeypatch.chdir(tmp_path)
+    assert _run_main(monkeypatch, "--stdin-filename", str(project / "module.py"), stdin=SOURCE) == 0
+    assert capsys.readouterr().out == TRANSFORMED_SOURCE
+    assert _run_main(monkeypatch, "--stdin-filename", str(project / "build" / "module.py"), stdin=SOURCE) == 0
+    assert capsys.readouterr().out == SOURCE
+
+
+@pytest.mark.parametrize("args", [["-", "module.py"], ["--stdin-filename", "module.py", "module.py"]])
+def test_stdin_rejects_other_paths(monkeypatch: pytest.MonkeyPatch, args: list[str]) -> None:
+    with pytest.raises(SystemExit):
+        _run_main(monkeypatch, *args, stdin=SOURCE)
+
+
+@pytest.mark.parametrize("separator", ["\n", "\0"])
+def test_files_from(
+    monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str], tmp_path: pathlib.Path, separator: str
+) -> None:
+    paths: Final = [tmp_path / f"module {index}.py" for index in range(3)]
+    for path in paths:
+        path.write_text(SOURCE, encoding="utf-8")
+    (tmp_path / "not_listed.py").write_text(SOURCE, encoding="utf-8")
+
+    assert _run_main(monkeypatch, "--files-from", "-", stdin=separator.join(map(str, paths[:2])) + separator) == 0
+
+    assert capsys.readouterr().out == "Fixed errors in 2 files.\n"
+    assert [path.read_text(encoding="utf-8") for path in paths] == [TRANSFORMED_SOURCE, TRANSFORMED_SOURCE, SOURCE]
+    assert (tmp_path / "not_listed.py").read_text(encoding="utf-8") == SOURCE
+
+
+def test_files_from_is_merged_with_positional_paths(
+    monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str], tmp_path: pathlib.Path
+) -> None:
+    listed_path: Final = tmp_path / "listed.py"
+    positional_path: Final = tmp_path / "positional.py"
+    files_from_path: Final = tmp_path / "files.txt"
+    for path in (listed_path, positional_path):
+        path.write_text(SOURCE, encoding="utf-8")
+    files_from_path.write_text(f"{listed_path}\n{positional_path}\n", encoding="utf-8")
+
+    assert _run_main(monkeypatch, "--files-from", str(files_from_path), str(positional_path)) == 0
+
+    assert capsys.readouterr().out == "Fixed errors in 2 files.\n"
+    assert {path.read_text(encoding="utf-8") for path in (listed_path, positional_path)} == {TRANSFORMED_SOURCE}
+    with pytest.raises(SystemExit):
+        _run_main(monkeypatch, "--files-from", str(files_from_path), "-")
+
+
+def test_exit_code_only_and_fail_fast(
+    monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str], tmp_path: pathlib.Path
+) -> None:
+    for name in ("a.py", "b.py"):
+        (tmp_path / name).write_text(SOURCE, encoding="utf-8")
+
+    assert _run_main(monkeypatch, "--check", "--exit-code-only", str(tmp_path)) == 1
+    assert not capsys.readouterr().out
+
+    assert _run_main(monkeypatch, "--check", "--fail-fast", str(tmp_path)) == 1
+    output: Final = capsys.readouterr().out
+    assert output.count("+++ ") == 1
+    assert output.endswith("Found errors in 1 file.\n")
+
+    assert _run_main(monkeypatch, "--check", "--exit-code-only", "-", stdin=TRANSFORMED_SOURCE) == 0
+    with pytest.raises(SystemExit):
+        _run_main(monkeypatch, "--exit-code-only", str(tmp_path))
+
+
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_jobs(
+    monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str], tmp_path: pathlib.Path, jobs: str
+) -> None:
+    paths: Final = [tmp_path / f"module_{index}.py" for index in range(5)]
+    for path in paths[1:]:
+        path.write_text(SOURCE, encoding="utf-8")
+    paths[0].write_text(TRANSFORMED_SOURCE, encoding="utf-8")
+
+    assert _run_main(monkeypatch, "--check", "--jobs", jobs, str(tmp_path)) == 1
+    output: Final = capsys.readouterr().out
+    assert [line.removeprefix("+++ ") for line in output.splitlines() if line.startswith("+++ ")] == [
+        str(path) for path in paths[1:]
+    ]
+    assert output.endswith("Found errors in 4 files.\n")
+
+    assert _run_main(monkeypatch, "--jobs", jobs, str(tmp_path)) == 0
+    assert capsys.readouterr().out == "Fixed errors in 4 files.\n"
+    assert {path.read_text(encoding="utf-8") for path in paths} == {TRANSFORMED_SOURCE}
+
+
+def test_output_format_ndjson(
+    monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str], tmp_path: pathlib.Path
+) -> None:
+    path: Final = tmp_path / "module.py"
+    path.write_text("def foo():\n    ё = 1\n    b: Final = ё\n", encoding="utf-8")
+
+    assert _run_main(monkeypatch, "--check", "--output-format", "ndjson", str(path)) == 1
+    output: Final = capsys.readouterr()
+    assert [json.loads(line) for line in output.out.splitlines()] == [
+        {
+            "path": str(path),
+            "kind": "add-import",
+            "start": {"line": 1, "column": 1},
+            "end": {"line": 1, "column": 1},
+            "new_text": "from typing import Final\n",
+        },
+        {
+            "path": str(path),
+            "kind": "add-final",
+            "start": {"line": 2, "column": 6},
+            "end": {"line": 2, "column": 6},
+            "new_text": ": Final",
+        },
+    ]
+    assert output.err == "Found errors in 1 file.\n"
+    with pytest.raises(SystemExit):
+        _run_main(monkeypatch, "--output-format", "ndjson", str(path))
+
+
+def test_output_format_sarif(
+    monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str], tmp_path: pathlib.Path
+) -> None:
+    directory: Final = tmp_path / "my project"
+    directory.mkdir()
+    for name in ("a.py", "b.py"):
+        (directory / name).write_text("def foo():\n    a: Final = 1\n    a = 2\n", encoding="utf-8")
+
+    assert _run_main(monkeypatch, "--check", "--output-format", "sarif", "--jobs", "2", str(directory)) == 1
+    sarif_log: Final = json.loads(capsys.readouterr().out)
+    assert sarif_log["version"] == "2.1.0"
+    assert [
+        (
+            result["ruleId"],
+            result["locations"][0]["physicalLocation"]["artifactLocation"]["uri"],
+            result["locations"][0]["physicalLocation"]["region"],
+            result["fixes"][0]["artifactChanges"][0]["replacements"][0]["insertedContent"]["text"],
+        )
+        for result in sarif_log["runs"][0]["results"]
+    ] == [
+        (
+            "remove-final",
+            (directory / name).as_uri(),
+            {"startLine": 2, "startColumn": 6, "endLine": 2, "endColumn": 13},
+            "",
+        )
+        for name in ("a.py", "b.py")
+    ]
+
+    # Paths under the current directory are relative URI references
+    monkeypatch.chdir(tmp_path)
+    assert _run_main(monkeypatch, "--check", "--output-format", "sarif", str(directory / "a.py")) == 1
+    assert [
+        result["locations"][0]["physicalLocation"]["artifactLocation"]["uri"]
+        for result in json.loads(capsys.readouterr().out)["runs"][0]["results"]
+    ] == ["my%20project/a.py"]
+
+    assert _run_main(monkeypatch, "--check", "--output-format", "sarif", "-", stdin=TRANSFORMED_SOURCE) == 0
+    assert json.loads(capsys.readouterr().out)["runs"][0]["results"] == []
+
+
+def test_max_file_size(
+    monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str], tmp_path: pathlib.Path
+) -> None:
+    large_source: Final = SOURCE + "# padding\n" * 10
+    (tmp_path / "small.py").write_text(SOURCE, encoding="utf-8")
+    (tmp_path / "large.py").write_text(large_source, encoding="utf-8")
+    report_path: Final = tmp_path / "report.json"
+
+    assert (
+        _run_main(
+            monkeypatch,
+            "--check",
+            "--max-file-size",
+            str(len(SOURCE)),
+            "--report-file",
+            str(report_path),
+            str(tmp_path),
+        )
+        == 1
+    )
+    output: Final = capsys.readouterr()
+    assert output.err == f"{tmp_path / 'large.py'}: skipped, larger than {len(SOURCE)} bytes\n"
+    assert output.out.endswith("Found errors in 1 file.\n")
+    assert json.loads(report_path.read_text(encoding="utf-8"))["skipped_files"] == [str(tmp_path / "large.py")]
+
+    (tmp_path / "pyproject.toml").write_text("[tool.auto-typing-final]\nmax-file-size = 1000\n", encoding="utf-8")
+    assert _run_main(monkeypatch, "--check", "--max-file-size", str(len(SOURCE)), str(tmp_path)) == 1
+    assert capsys.readouterr().out.endswith("Found errors in 1 file.\n")
+    assert _run_main(monkeypatch, str(tmp_path)) == 0
+    assert capsys.readouterr().out == "Fixed errors in 2 files.\n"
+
+
+def test_timeout_is_rejected_with_daemon(monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]) -> None:
+    with pytest.raises(SystemExit):
+        _run_main(monkeypatch, "--daemon", "--timeout", "1", ".")
+    assert "--timeout can't be used with --daemon" in capsys.readouterr().err
+
+
+def test_file_with_wrong_encoding_is_skipped(
+    monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str], tmp_path: pathlib.Path
+) -> None:
+    broken_path: Final = tmp_path / "broken.py"
+    broken_path.write_bytes(b"# -*- coding: bogus -*-\n" + SOURCE.encode())
+    (tmp_path / "module.py").write_text(SOURCE, encoding="utf-8")
+    report_path: Final = tmp_path / "report.json"
+
+    assert _run_main(monkeypatch, "--check", "--report-file", str(report_path), str(tmp_path)) == 1
+    output: Final = capsys.readouterr()
+    assert output.err == f"{broken_path}: skipped, cannot decode: unknown encoding: bogus\n"
+    assert output.out.endswith("Found errors in 1 file.\n")
+    assert json.loads(report_path.read_text(encoding="utf-8"))["skipped_files"] == [str(broken_path)]
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Final
+
+import pytest
+
+from auto_typing_final.pipeline import Pipeline, ProcessWorkers, map_bounded
+
+MAX_PENDING_COUNT: Final = 4
+
+
+def _sleep_and_square(value: int) -> int:
+    time.sleep((5 - value % 5) / 1000)
+    return value * value
+
+
+def test_map_bounded_keeps_order() -> None:
+    items: Final = [(str(value), value) for value in range(20)]
+    expected: Final = [(str(value), value * value) for value in range(20)]
+
+    assert list(map_bounded(_sleep_and_square, items, executor=None)) == expected
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert list(map_bounded(_sleep_and_square, items, executor=executor, max_pending=3)) == expected
+
+
+def test_map_bounded_reads_items_lazily() -> None:
+    consumed_count = 0
+
+    def make_items() -> Iterator[tuple[int, int]]:
+        nonlocal consumed_count
+        for value in range(100):
+            consumed_count += 1
+            yield value, value
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results: Final = map_bounded(_sleep_and_square, make_items(), executor=executor, max_pending=MAX_PENDING_COUNT)
+        assert next(results) == (0, 0)
+        assert consumed_count == MAX_PENDING_COUNT
+
+
+def test_pipeline_writes_in_order_on_one_thread() -> None:
+    written: Final[list[tuple[int, str]]] = []
+
+    def write(value: int) -> None:
+        written.append((value, threading.current_thread().name))
+
+    with Pipeline.start(jobs=1) as pipeline:
+        for value in range(50):
+            pipeline.write(partial(write, value))
+        pipeline.flush()
+        assert [value for value, _ in written] == list(range(50))
+        assert len({thread_name for _, thread_name in written}) == 1
+
+
+def test_pipeline_flush_raises_write_errors() -> None:
+    def fail() -> None:
+        raise OSError
+
+    with Pipeline.start(jobs=1) as pipeline:
+        pipeline.write(fail)
+        with pytest.raises(OSError):  # noqa: PT011
+            pipeline.flush()
+
+
+def test_process_workers_abandon_slow_calls() -> None:
+    workers: Final = ProcessWorkers()
+    try:
+        assert workers.call(abs, -1, timeout=None) == 1
+        worker_process: Final = workers.idle_workers[0].process
+
+        assert workers.call(time.sleep, 60, timeout=0.5) is None
+        assert not worker_process.is_alive()
+        assert not workers.idle_workers
+
+        with pytest.raises(ValueError, match="invalid literal"):
+            workers.call(int, "x", timeout=None)
+        assert workers.call(abs, -2, timeout=None) == 2  # noqa: PLR2004
+    finally:
+        workers.close()
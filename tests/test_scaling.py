@@ -0,0 +1,209 @@
+import hashlib
+import math
+import os
+import pathlib
+import random
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Final
+
+import pytest
+from ast_grep_py import SgNode, SgRoot
+
+from auto_typing_final.ffi_accounting import FfiCallAccounting
+from auto_typing_final.transform import IMPORT_STYLES_TO_IMPORT_CONFIGS, make_replacements
+
+# Statement templates the fuzzer builds programs from. `{name}` is replaced with an identifier that is unique
+# to one repetition of the unit, so growing a program along an axis never changes how existing names are analysed.
+STATEMENT_TEMPLATES: Final = (
+    "{name} = 1",
+    "{name}: int = 1",
+    "{name}: Final = 1",
+    "{name}: Final[int] = 1",
+    "{name} = [1, 2, 3]",
+    "{name} += 1",
+    "({name} := 1)",
+    "for {name} in range(3): pass",
+    "with open('file') as {name}: pass",
+    "{name} = 1  # some comment",
+    "{name} = 1  # auto-typing-final: ignore",
+    "# just a comment",
+    "import {name}",
+    "from typing import {name}",
+)
+MAX_GROWTH_EXPONENT: Final = float(os.environ.get("AUTO_TYPING_FINAL_MAX_GROWTH_EXPONENT", "1.5"))
+FUZZ_SEEDS: Final = range(int(os.environ.get("AUTO_TYPING_FINAL_FUZZ_SEEDS", "3")))
+# The fuzzer measures wall-clock time of random programs, which is slow and flaky on loaded machines
+IS_FUZZING_ENABLED: Final = os.environ.get("AUTO_TYPING_FINAL_FUZZ_SCALING") == "1"
+MIN_SIZE: Final = 4
+MAX_SIZE: Final = 2048
+MEASUREMENT_TIME_CAP_SECONDS: Final = 0.05
+MEASUREMENT_CALLS_CAP: Final = 100_000
+REGRESSIONS_DIRECTORY: Final = pathlib.Path(__file__).parent / "scaling_regressions"
+
+
+def _indent(lines: list[str], level: int) -> str:
+    return "".join(f"{'    ' * level}{line}\n" for line in lines)
+
+
+def _fill_unit(unit: list[str], index: int, *, upper: bool = False) -> list[str]:
+    return [
+        template.format(name=f"{'V' if upper else 'v'}{index}_{statement_index}")
+        for statement_index, template in enumerate(unit)
+    ]
+
+
+def _make_nesting(unit: list[str], size: int) -> str:
+    return "".join(
+        f"{'    ' * index}def f{index}():\n{_indent(_fill_unit(unit, index), index + 1)}" for index in range(size)
+    )
+
+
+def _make_siblings(unit: list[str], size: int) -> str:
+    return "".join(f"def f{index}():\n{_indent(_fill_unit(unit, index), 1)}" for index in range(size))
+
+
+def _make_names(unit: list[str], size: int) -> str:
+    return "def f():\n" + "".join(_indent(_fill_unit(unit, index), 1) for index in range(size))
+
+
+def _make_comments(unit: list[str], size: int) -> str:
+    return "def f():\n" + "".join(_indent([*_fill_unit(unit, index), f"# comment {index}"], 1) for index in range(size))
+
+
+def _make_globals(unit: list[str], size: int) -> str:
+    return "".join(_indent(_fill_unit(unit, index, upper=True), 0) for index in range(size))
+
+
+def _make_methods(unit: list[str], size: int) -> str:
+    return "def outer():\n    x = 0\n\n    class A:\n" + "".join(
+        f"        def m{index}(self):\n            nonlocal x\n{_indent(_fill_unit(unit, index), 3)}"
+        for index in range(size)
+    )
+
+
+AXES: Final[dict[str, Callable[[list[str], int], str]]] = {
+    "nesting": _make_nesting,
+    "siblings": _make_siblings,
+    "names": _make_names,
+    "comments": _make_comments,
+    "globals": _make_globals,
+    "methods": _make_methods,
+}
+# Every function scope is searched with its own `find_all`, so a chain of nested functions is inherently
+# quadratic: the bound documents that and catches anything worse.
+AXES_MAX_GROWTH_EXPONENTS: Final = {"nesting": max(MAX_GROWTH_EXPONENT, 2.5)}
+
+
+@dataclass(frozen=True, slots=True, kw_only=True)
+class Measurement:
+    measure_cost: Callable[[SgNode], float]
+    cost_cap: float
+
+
+def _measure_seconds(root: SgNode) -> float:
+    import_config: Final = IMPORT_STYLES_TO_IMPORT_CONFIGS["typing-final"]
+    best = math.inf
+    for _ in range(3):
+        start = time.perf_counter()
+        make_replacements(root, import_config, ignore_global_vars=False)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+# Every step of the analysis goes through ast-grep, so the number of its calls grows like the analysis time,
+# but unlike time it doesn't depend on how loaded the machine is.
+def _count_ast_grep_calls(root: SgNode) -> float:
+    accounting: Final = FfiCallAccounting()
+    with accounting.record():
+        make_replacements(root, IMPORT_STYLES_TO_IMPORT_CONFIGS["typing-final"], ignore_global_vars=False)
+    return accounting.total.calls_count
+
+
+WALL_CLOCK_MEASUREMENT: Final = Measurement(measure_cost=_measure_seconds, cost_cap=MEASUREMENT_TIME_CAP_SECONDS)
+CALLS_MEASUREMENT: Final = Measurement(measure_cost=_count_ast_grep_calls, cost_cap=MEASUREMENT_CALLS_CAP)
+
+
+# Fits `cost ~ size ** exponent` over the largest sizes that were measured within the cost cap.
+# Returns None when fewer than two sizes parse, as there is nothing to fit then.
+def measure_growth_exponent(axis: str, unit: list[str], measurement: Measurement) -> float | None:
+    points: Final[list[tuple[float, float]]] = []
+    size = MIN_SIZE
+    while size <= MAX_SIZE:
+        root = SgRoot(AXES[axis](unit, size), "python").root()
+        # tree-sitter gives up on very deep indentation, and analysing an error tree says nothing about scaling
+        if root.find(kind="ERROR"):
+            break
+        cost = measurement.measure_cost(root)
+        points.append((math.log(size), math.log(cost)))
+        if cost > measurement.cost_cap and len(points) >= 4:  # noqa: PLR2004
+            break
+        size *= 2
+    if len(points) < 2:  # noqa: PLR2004
+        return None
+
+    last_points: Final = points[-3:]
+    mean_x: Final = sum(x for x, _ in last_points) / len(last_points)
+    mean_y: Final = sum(y for _, y in last_points) / len(last_points)
+    return sum((x - mean_x) * (y - mean_y) for x, y in last_points) / sum((x - mean_x) ** 2 for x, _ in last_points)
+
+
+# Timing is noisy, so an axis is only flagged when two independent measurements exceed the bound.
+def _is_superlinear(axis: str, unit: list[str], measurement: Measurement) -> bool:
+    max_exponent: Final = AXES_MAX_GROWTH_EXPONENTS.get(axis, MAX_GROWTH_EXPONENT)
+    return all(
+        (exponent := measure_growth_exponent(axis, unit, measurement)) is not None and exponent > max_exponent
+        for _ in range(2 if measurement is WALL_CLOCK_MEASUREMENT else 1)
+    )
+
+
+def minimise_unit(axis: str, unit: list[str], measurement: Measurement) -> list[str]:
+    result: Final = list(unit)
+    index = 0
+    while index < len(result) and len(result) > 1:
+        candidate = result[:index] + result[index + 1 :]
+        if _is_superlinear(axis, candidate, measurement):
+            del result[index]
+        else:
+            index += 1
+    return result
+
+
+def make_random_unit(seed: int) -> list[str]:
+    random_: Final = random.Random(seed)  # noqa: S311
+    return random_.sample(STATEMENT_TEMPLATES, k=random_.randint(1, 4))
+
+
+def save_regression(directory: pathlib.Path, axis: str, unit: list[str]) -> pathlib.Path:
+    digest: Final = hashlib.sha256("\n".join(unit).encode()).hexdigest()[:8]
+    path: Final = directory / f"{axis}-{digest}.txt"
+    path.write_text("\n".join([axis, *unit]) + "\n", encoding="utf-8")
+    return path
+
+
+def load_regression(path: pathlib.Path) -> tuple[str, list[str]]:
+    axis, *unit = path.read_text(encoding="utf-8").splitlines()
+    return axis, unit
+
+
+@pytest.mark.skipif(not IS_FUZZING_ENABLED, reason="set AUTO_TYPING_FINAL_FUZZ_SCALING=1 to run the scaling fuzzer")
+@pytest.mark.parametrize("seed", FUZZ_SEEDS)
+@pytest.mark.parametrize("axis", AXES)
+def test_analysis_scales_along_axis(axis: str, seed: int, tmp_path: pathlib.Path) -> None:
+    unit: Final = make_random_unit(seed)
+    if measure_growth_exponent(axis, unit, WALL_CLOCK_MEASUREMENT) is None:
+        pytest.skip(f"{axis} can't be measured for {unit}: fewer than two sizes parse")
+    if not _is_superlinear(axis, unit, WALL_CLOCK_MEASUREMENT):
+        return
+    minimised_unit: Final = minimise_unit(axis, unit, WALL_CLOCK_MEASUREMENT)
+    path: Final = save_regression(tmp_path, axis, minimised_unit)
+    print(f"Saved the scaling regression to {path}, copy it into {REGRESSIONS_DIRECTORY} to keep it")  # noqa: T201
+    pytest.fail(f"{axis} grows super-linearly for {minimised_unit}, saved to {path}")
+
+
+# Saved regressions run with every test run, so they count ast-grep calls instead of timing the analysis
+@pytest.mark.parametrize("path", sorted(REGRESSIONS_DIRECTORY.glob("*.txt")), ids=lambda path: path.stem)
+def test_scaling_regressions(path: pathlib.Path) -> None:
+    axis, unit = load_regression(path)
+    assert not _is_superlinear(axis, unit, CALLS_MEASUREMENT), path.name
@@ -0,0 +1,70 @@
+import os
+import subprocess  # noqa: S404
+import sys
+from typing import Final
+
+# Generous enough for slow CI machines, lower it with the environment variable to profile locally
+IMPORT_TIME_BUDGET_MICROSECONDS: Final = int(os.environ.get("AUTO_TYPING_FINAL_IMPORT_BUDGET_US", "150000"))
+LAZY_MODULES: Final = (
+    "auto_typing_final.bench",
+    "auto_typing_final.daemon",
+    "auto_typing_final.discovery",
+    "auto_typing_final.git",
+    "auto_typing_final.lsp_bench",
+    "auto_typing_final.output",
+    "auto_typing_final.pipeline",
+    "auto_typing_final.watch",
+    "concurrent.futures",
+    "difflib",
+    "importlib.metadata",
+    "json",
+    "socketserver",
+    "subprocess",
+    "tempfile",
+)
+
+
+def _run_python(*args: str, stdin: str | None = None) -> subprocess.CompletedProcess[str]:
+    return subprocess.run([sys.executable, *args], check=True, capture_output=True, text=True, input=stdin)  # noqa: S603
+
+
+def test_cli_does_not_import_optional_modules() -> None:
+    output: Final = _run_python("-c", "import sys, auto_typing_final.main; print('\\n'.join(sys.modules))").stdout
+    assert not set(LAZY_MODULES).intersection(output.splitlines())
+
+
+def _measure_import_microseconds(module_name: str, *preimported_module_names: str) -> int:
+    output: Final = _run_python(
+        "-X", "importtime", "-c", "; ".join(f"import {name}" for name in (*preimported_module_names, module_name))
+    ).stderr
+    return next(
+        int(line.split("|")[1]) for line in reversed(output.splitlines()) if line.split("|")[-1].strip() == module_name
+    )
+
+
+def test_cli_import_time_budget() -> None:
+    assert _measure_import_microseconds("auto_typing_final.main") < IMPORT_TIME_BUDGET_MICROSECONDS
+
+
+def test_stdin_run_does_not_import_discovery() -> None:
+    output: Final = _run_python(
+        "-c",
+        "import sys; from auto_typing_final.main import main; sys.argv = ['auto-typing-final', '-']; main(); "
+        "sys.stderr.write('\\n'.join(sys.modules))",
+        stdin="def foo():\n    a = 1\n",
+    )
+    assert output.stdout == "import typing\ndef foo():\n    a: typing.Final = 1\n"
+    assert not {"auto_typing_final.discovery", "auto_typing_final.git", "subprocess"}.intersection(
+        output.stderr.splitlines()
+    )
+
+
+# The language server protocol types alone take several hundred milliseconds to import,
+# so they are imported beforehand and only the server's own modules are measured
+def test_lsp_import_time_budget() -> None:
+    assert (
+        _measure_import_microseconds(
+            "auto_typing_final.lsp", "lsprotocol.types", "lsprotocol.converters", "pygls.server", "cattrs"
+        )
+        < IMPORT_TIME_BUDGET_MICROSECONDS
+    )
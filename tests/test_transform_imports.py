@@ -284,3 +284,10 @@ def f():
 def test_different_import_styles(case: str, import_config: ImportConfig, ignore_global_vars: bool) -> None:
     before, after = parse_before_after_test_case(case)
     assert transform_file_content(before, import_config=import_config, ignore_global_vars=ignore_global_vars) == after
+
+
+def test_import_config_identifier_name() -> None:
+    assert {config.identifier_name for config in IMPORT_STYLES_TO_IMPORT_CONFIGS.values()} == {"Final"}
+    assert ImportConfig(value="t.Final", import_text="import typing as t", import_identifier="t").identifier_name == (
+        "Final"
+    )
@@ -0,0 +1,161 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Final
+
+import pytest
+from ast_grep_py import SgRoot
+
+from auto_typing_final import IMPORT_STYLES_TO_IMPORT_CONFIGS, ImportConfig, SpanEdit, Transformer
+from auto_typing_final.transform import can_have_replacements, make_replacements
+from tests.conftest import parse_md_test_cases
+
+TRANSFORMER: Final = Transformer(import_config=IMPORT_STYLES_TO_IMPORT_CONFIGS["final"])
+
+
+def test_analyze_returns_byte_spans() -> None:
+    source: Final = (
+        "from typing import Final\ndef foo():\n    s = 'привет'\n    a: int = 1\n"
+        "    b: Final = 1\n    b = 2\n    c: Final[list[int]] = []\n    c = []\n"
+    )
+    result: Final = TRANSFORMER.analyze(source)
+    encoded_source: Final = source.encode()
+
+    assert result.import_text is None
+    assert result.edits == [
+        SpanEdit(
+            operation="add-final",
+            start=encoded_source.index(" = 'привет'".encode()),
+            end=encoded_source.index(" = 'привет'".encode()),
+            new_text=": Final",
+        ),
+        SpanEdit(
+            operation="add-final",
+            start=encoded_source.index(b"int = 1"),
+            end=encoded_source.index(b"int = 1"),
+            new_text="Final[",
+        ),
+        SpanEdit(
+            operation="add-final",
+            start=encoded_source.index(b" = 1\n    b"),
+            end=encoded_source.index(b" = 1\n    b"),
+            new_text="]",
+        ),
+        SpanEdit(
+            operation="remove-final",
+            start=encoded_source.index(b": Final = 1"),
+            end=encoded_source.index(b" = 1\n    b = 2"),
+            new_text="",
+        ),
+        SpanEdit(
+            operation="remove-final",
+            start=encoded_source.index(b"Final[list"),
+            end=encoded_source.index(b"list[int]]"),
+            new_text="",
+        ),
+        SpanEdit(
+            operation="remove-final",
+            start=encoded_source.index(b"] = []"),
+            end=encoded_source.index(b" = []"),
+            new_text="",
+        ),
+    ]
+    assert TRANSFORMER.transform(source).new_source == (
+        "from typing import Final\ndef foo():\n    s: Final = 'привет'\n    a: Final[int] = 1\n"
+        "    b = 1\n    b = 2\n    c: list[int] = []\n    c = []\n"
+    )
+
+
+def test_transform_keeps_formatting_around_edits() -> None:
+    assert TRANSFORMER.transform("def foo():\n    a=1\n    b :int=[  # comment\n        1,\n    ]\n").new_source == (
+        "from typing import Final\ndef foo():\n    a: Final=1\n    b :Final[int]=[  # comment\n        1,\n    ]\n"
+    )
+
+
+def test_transform() -> None:
+    result: Final = TRANSFORMER.transform("def foo():\n    a = 1\n")
+    assert result.has_changes
+    assert result.analysis.import_text == "from typing import Final"
+    assert result.new_source == "from typing import Final\ndef foo():\n    a: Final = 1\n"
+
+    unchanged_result: Final = TRANSFORMER.transform(result.new_source)
+    assert not unchanged_result.has_changes
+    assert not unchanged_result.analysis.has_changes
+
+
+def test_transform_many() -> None:
+    sources: Final = [f"def foo():\n    a{index} = 1\n" for index in range(4)]
+    expected: Final = [TRANSFORMER.transform(source) for source in sources]
+
+    assert list(TRANSFORMER.transform_many(sources)) == expected
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert list(TRANSFORMER.transform_many(sources, executor=executor)) == expected
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        assert list(TRANSFORMER.transform_many(sources, executor=executor)) == expected
+
+
+def test_transform_splices_edits_in_non_ascii_source() -> None:
+    result: Final = TRANSFORMER.transform("def foo():\n    a = '😀'\r\n    b: 'é' = 1\n")
+    assert result.new_source == "from typing import Final\ndef foo():\n    a: Final = '😀'\r\n    b: Final['é'] = 1\n"
+
+
+@pytest.mark.parametrize(
+    ("header", "expected_header"),
+    [
+        ("#!/usr/bin/env python\n", "#!/usr/bin/env python\nfrom typing import Final\n"),
+        ("# -*- coding: latin-1 -*-\n", "# -*- coding: latin-1 -*-\nfrom typing import Final\n"),
+        (
+            "#!/usr/bin/env python\n# vim: set fileencoding=latin-1 :\n",
+            "#!/usr/bin/env python\n# vim: set fileencoding=latin-1 :\nfrom typing import Final\n",
+        ),
+        ("\n# coding=utf-8\n", "\n# coding=utf-8\nfrom typing import Final\n"),
+        ("# comment\n", "from typing import Final\n# comment\n"),
+        ("import os\n# coding: latin-1\n", "from typing import Final\nimport os\n# coding: latin-1\n"),
+    ],
+)
+def test_import_goes_after_shebang_and_coding_cookie(header: str, expected_header: str) -> None:
+    assert TRANSFORMER.transform(f"{header}def foo():\n    a = 1\n").new_source == (
+        f"{expected_header}def foo():\n    a: Final = 1\n"
+    )
+
+
+@pytest.mark.parametrize(
+    ("source", "ignore_global_vars", "is_parsed"),
+    [
+        ("import os\nprint(os.name)\n", False, False),
+        ("value = 1\nclass A:\n    attribute = 2\n", False, False),
+        ("VALUE = 1\n", True, False),
+        ("VALUE = 1\n", False, True),
+        ("VALUE: int = 1\n", False, True),
+        ("def foo(): ...\n", True, False),
+        ("def foo():\n    a = 1\n", True, True),
+    ],
+)
+def test_prefilter_skips_parsing(source: str, ignore_global_vars: bool, is_parsed: bool) -> None:
+    transformer: Final = Transformer(
+        import_config=IMPORT_STYLES_TO_IMPORT_CONFIGS["final"], ignore_global_vars=ignore_global_vars
+    )
+    assert transformer.analyze(source).is_parsed == is_parsed
+    assert transformer.transform(source).analysis.is_parsed == is_parsed
+
+
+@pytest.mark.parametrize(
+    "case",
+    [
+        case
+        for file_name in ("function_vars.md", "global_vars_enabled.md", "syntax_and_scopes.md")
+        for case in parse_md_test_cases(file_name)
+    ],
+)
+def test_prefilter_is_conservative(case: str, import_config: ImportConfig, ignore_global_vars: bool) -> None:
+    if not can_have_replacements(case, ignore_global_vars=ignore_global_vars):
+        result: Final = make_replacements(
+            SgRoot(case, "python").root(), import_config=import_config, ignore_global_vars=ignore_global_vars
+        )
+        assert not any(replacement.edits for replacement in result.replacements)
+        assert result.import_text is None
+
+
+def test_has_changes() -> None:
+    assert TRANSFORMER.has_changes("def foo():\n    a = 1\n")
+    assert TRANSFORMER.has_changes("def foo():\n    a: Final = 1\n    a = 2\n")
+    assert not TRANSFORMER.has_changes("def foo():\n    a = 1\n    a = 2\n")
+    assert not TRANSFORMER.has_changes("import os\n")
@@ -0,0 +1,118 @@
+import pathlib
+from typing import Final
+
+import pytest
+
+from auto_typing_final.discovery import SourceFileWalker
+from auto_typing_final.watch import ContentHashes, InotifyWatcher, PollingWatcher, make_source_file_filter, watch
+
+
+class ScriptedWatcher:
+    def __init__(self, events: list[set[pathlib.Path] | None]) -> None:
+        self.events = events
+
+    def wait_for_changes(self, timeout: float | None) -> set[pathlib.Path] | None:
+        if not self.events:
+            if timeout is None:
+                raise KeyboardInterrupt
+            return set()
+        return self.events.pop(0)
+
+    def close(self) -> None: ...
+
+
+def test_watch_skips_own_writes_and_unchanged_content(tmp_path: pathlib.Path) -> None:
+    first_file: Final = tmp_path / "a.py"
+    second_file: Final = tmp_path / "b.py"
+    first_file.write_text("a = 1\n", encoding="utf-8")
+    second_file.write_text("b = 1\n", encoding="utf-8")
+    content_hashes: Final = ContentHashes()
+    content_hashes.remember([second_file])
+    processed_batches: Final[list[list[pathlib.Path]]] = []
+
+    def process(paths: list[pathlib.Path]) -> list[pathlib.Path]:
+        processed_batches.append(paths)
+        for path in paths:
+            path.write_text("a: Final = 1\n", encoding="utf-8")
+        return paths
+
+    watcher: Final = ScriptedWatcher(
+        [{first_file}, {second_file, tmp_path / "c.txt"}, set(), {first_file}, set(), None]
+    )
+    with pytest.raises(KeyboardInterrupt):
+        watch(
+            watcher,
+            find_source_files=lambda: [first_file, second_file],
+            is_source_file=make_source_file_filter([tmp_path], SourceFileWalker()),
+            process=process,
+            content_hashes=content_hashes,
+            debounce=0,
+        )
+
+    # Events are debounced into one batch, `b.py` is unchanged, then `a.py` was written by ourselves and the rescan
+    # finds nothing new
+    assert processed_batches == [[first_file]]
+
+
+def test_source_file_filter(tmp_path: pathlib.Path) -> None:
+    is_source_file: Final = make_source_file_filter([tmp_path / "pkg", tmp_path / "script"], SourceFileWalker())
+    assert is_source_file(tmp_path / "pkg" / "a.py")
+    assert is_source_file(tmp_path / "script")
+    assert not is_source_file(tmp_path / "pkg" / "a.txt")
+    assert not is_source_file(tmp_path / "pkg" / "build" / "a.py")
+    assert not is_source_file(tmp_path / "pkg" / ".hidden" / "a.py")
+    assert not is_source_file(tmp_path / "other.py")
+
+
+def test_source_file_filter_respects_gitignore(tmp_path: pathlib.Path) -> None:
+    (tmp_path / ".gitignore").write_text("generated/\n*_pb2.py\n", encoding="utf-8")
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / ".gitignore").write_text("local.py\n", encoding="utf-8")
+    is_source_file: Final = make_source_file_filter([tmp_path], SourceFileWalker())
+
+    assert is_source_file(tmp_path / "pkg" / "a.py")
+    assert not is_source_file(tmp_path / "generated" / "nested" / "a.py")
+    assert not is_source_file(tmp_path / "pkg" / "a_pb2.py")
+    assert not is_source_file(tmp_path / "pkg" / "local.py")
+    assert is_source_file(tmp_path / "local.py")
+    assert make_source_file_filter([tmp_path], SourceFileWalker(respect_gitignore=False))(
+        tmp_path / "generated" / "a.py"
+    )
+
+
+def test_polling_watcher_detects_changes(tmp_path: pathlib.Path) -> None:
+    path: Final = tmp_path / "a.py"
+    path.write_text("a = 1\n", encoding="utf-8")
+    watcher: Final = PollingWatcher(lambda: [path])
+    assert watcher.wait_for_changes(timeout=0) == set()
+    path.write_text("a = 10\n", encoding="utf-8")
+    assert watcher.wait_for_changes(timeout=0) == {path}
+
+
+def test_inotify_watcher_detects_changes(tmp_path: pathlib.Path) -> None:
+    watcher: Final = InotifyWatcher.try_create([tmp_path], SourceFileWalker())
+    if not watcher:
+        pytest.skip("inotify is not available")
+    try:
+        (tmp_path / "a.py").write_text("a = 1\n", encoding="utf-8")
+        (tmp_path / "pkg").mkdir()
+        (tmp_path / "pkg" / "b.py").write_text("b = 1\n", encoding="utf-8")
+        changes: Final[set[pathlib.Path]] = set()
+        while (new_changes := watcher.wait_for_changes(timeout=1)) is not None and new_changes:
+            changes.update(new_changes)
+        assert {tmp_path / "a.py", tmp_path / "pkg" / "b.py"} <= changes
+    finally:
+        watcher.close()
+
+
+def test_inotify_watcher_skips_ignored_directories(tmp_path: pathlib.Path) -> None:
+    (tmp_path / ".gitignore").write_text("generated/\n", encoding="utf-8")
+    for directory in ("generated/nested", "pkg/nested", "build", ".hidden"):
+        (tmp_path / directory).mkdir(parents=True)
+    watcher: Final = InotifyWatcher.try_create([tmp_path], SourceFileWalker())
+    if not watcher:
+        pytest.skip("inotify is not available")
+    try:
+        assert sorted(watcher._directories.values()) == [tmp_path, tmp_path / "pkg", tmp_path / "pkg" / "nested"]
+    finally:
+        watcher.close()